@@ -1,9 +1,20 @@
+import functools
 import logging
-from fastapi import FastAPI, HTTPException
+import logging.config
+import os
+import time
+from typing import List, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
+from app.backend.batching import PredictionBatcher
+from app.backend.executor import InferenceExecutor, Overloaded
+from app.backend.metrics import QUEUE_DEPTH, REQUEST_SECONDS, render
 from app.backend.model.mock import MockSkill
 from app.backend.model.skill import InvalidInput
 from app.backend.model.tgl import TGLDeepSkill
+from app.backend.registry import ModelRegistry
+from app.backend import shared
 
 # setup loggers
 logging.config.fileConfig('app/backend/logging.conf', disable_existing_loggers=False)
@@ -20,16 +31,153 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-skill_system = TGLDeepSkill()
+# requests arriving within BATCH_WINDOW_MS of each other share one model call
+BATCH_WINDOW_MS = float(os.environ.get("DEEPSKILL_BATCH_WINDOW_MS", 2))
+BATCH_SIZE = int(os.environ.get("DEEPSKILL_BATCH_SIZE", 64))
+# inference runs on INFERENCE_THREADS threads, or on INFERENCE_PROCESSES
+# processes with a model each when set; MAX_PENDING bounds the backlog
+INFERENCE_THREADS = int(os.environ.get("DEEPSKILL_INFERENCE_THREADS", 2))
+INFERENCE_PROCESSES = int(os.environ.get("DEEPSKILL_INFERENCE_PROCESSES", 0))
+MAX_PENDING = int(os.environ.get("DEEPSKILL_MAX_PENDING", 1024))
+# yml file of named models (see app/backend/models.yml), loaded on first use
+# and evicted least recently used first past MODEL_MEMORY_MB; without it the
+# single model configured in app/backend/model/tgl.py is served
+MODELS = os.environ.get("DEEPSKILL_MODELS")
+DEFAULT_MODEL = os.environ.get("DEEPSKILL_DEFAULT_MODEL")
+MODEL_MEMORY_MB = int(os.environ.get("DEEPSKILL_MODEL_MEMORY_MB", 0))
+# directory through which all worker processes share one copy of the model
+# state: one of them ingests and publishes snapshots, the others memory-map
+# them. Each model uses its own subdirectory, named after it (a model's
+# `shared_state` entry in MODELS overrides it). POST /games needs it when
+# there are INFERENCE_PROCESSES
+SHARED_STATE = os.environ.get("DEEPSKILL_SHARED_STATE")
+# "mock" serves MockSkill's canned answers, to measure the serving framework
+# on its own (see utils/benchmark_api.py)
+BACKEND = os.environ.get("DEEPSKILL_BACKEND", "tgl")
+
+if BACKEND == "mock":
+    model_factory = MockSkill
+elif INFERENCE_PROCESSES > 0:
+    # one intra-op thread per process, the processes already cover the cores
+    model_factory = functools.partial(TGLDeepSkill, num_threads=1)
+else:
+    model_factory = TGLDeepSkill
+model_factory = functools.partial(shared.build, model_factory)
+skill_system_factory = functools.partial(ModelRegistry.from_config, MODELS, model_factory, default=DEFAULT_MODEL,
+                                         memory_budget=MODEL_MEMORY_MB * 2**20, shared_state=SHARED_STATE)
+
+executor = InferenceExecutor(skill_system_factory, threads=INFERENCE_THREADS, processes=INFERENCE_PROCESSES, max_pending=MAX_PENDING)
+batcher = PredictionBatcher(executor, max_batch_size=BATCH_SIZE, max_wait=BATCH_WINDOW_MS / 1000, max_queue=MAX_PENDING)
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    # label by route template, unknown paths would make unbounded series
+    path = route.path if route is not None else "other"
+    REQUEST_SECONDS.labels(path, request.method, response.status_code).observe(time.perf_counter() - start)
+    return response
+
+@app.on_event("startup")
+async def startup():
+    batcher.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await batcher.stop()
+    executor.shutdown()
 
 @app.get("/predict")
-async def predict(white: str, black: str, min: int = 10, inc: int = 0):
+async def predict(white: str, black: str, min: int = 10, inc: int = 0, model: Optional[str] = None):
     time_control = (min, inc)
     try:
-        prediction = skill_system.predict(white, black, time_control)    
+        prediction = await batcher.predict(white, black, time_control, model)
         return prediction
     except InvalidInput as e:
         raise HTTPException(status_code=400, detail=e.invalid)
+    except Overloaded:
+        raise HTTPException(status_code=503, detail="overloaded")
+
+@app.post("/predict/batch")
+async def predict_batch(games: List[Tuple[str, str, int, int]], model: Optional[str] = None):
+    games = [(white, black, (min, inc)) for white, black, min, inc in games]
+    try:
+        return await executor.call('route', model, 'predict_batch', games)
+    except InvalidInput as e:
+        raise HTTPException(status_code=400, detail=e.invalid)
+    except Overloaded:
+        raise HTTPException(status_code=503, detail="overloaded")
+
+class Game(BaseModel):
+    white: str
+    black: str
+    result: str
+    min: int = 10
+    inc: int = 0
+    white_elo: int
+    black_elo: int
+    time: Optional[float] = None
+
+@app.post("/games")
+async def ingest(games: List[Game], model: Optional[str] = None):
+    if INFERENCE_PROCESSES > 0 and SHARED_STATE is None:
+        # every process has a model of its own, the games would reach only one of them
+        raise HTTPException(status_code=501, detail="ingestion with inference processes needs DEEPSKILL_SHARED_STATE")
+    games = [(g.white, g.black, g.result, (g.min, g.inc), g.white_elo, g.black_elo, g.time) for g in games]
+    try:
+        return await executor.call('route', model, 'ingest', games)
+    except InvalidInput as e:
+        raise HTTPException(status_code=400, detail=e.invalid)
+    except NotImplementedError:
+        raise HTTPException(status_code=501, detail="ingestion not supported")
+    except Overloaded:
+        raise HTTPException(status_code=503, detail="overloaded")
+
+@app.get("/players")
+async def players(prefix: str = "", limit: int = Query(10, ge=1, le=100), model: Optional[str] = None):
+    try:
+        return await executor.call('route', model, 'search_players', prefix, limit)
+    except InvalidInput as e:
+        raise HTTPException(status_code=400, detail=e.invalid)
+    except Overloaded:
+        raise HTTPException(status_code=503, detail="overloaded")
+
+@app.get("/matchmaking")
+async def matchmaking(player: str, k: int = Query(10, ge=1, le=100), min: int = 10, inc: int = 0, model: Optional[str] = None):
+    try:
+        return await executor.call('route', model, 'find_opponents', player, k, (min, inc))
+    except InvalidInput as e:
+        raise HTTPException(status_code=400, detail=e.invalid)
+    except NotImplementedError:
+        raise HTTPException(status_code=501, detail="matchmaking not supported")
+    except Overloaded:
+        raise HTTPException(status_code=503, detail="overloaded")
+
+@app.get("/leaderboard")
+async def leaderboard(type: str = "Blitz", offset: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500), model: Optional[str] = None):
+    try:
+        return await executor.call('route', model, 'leaderboard', type, offset, limit)
+    except InvalidInput as e:
+        raise HTTPException(status_code=400, detail=e.invalid)
+    except NotImplementedError:
+        raise HTTPException(status_code=501, detail="leaderboard not supported")
+    except Overloaded:
+        raise HTTPException(status_code=503, detail="overloaded")
+
+@app.get("/stats")
+async def stats():
+    return {
+        "batcher": batcher.stats(),
+        "executor": {"pending": executor.pending, "concurrency": executor.concurrency},
+        "models": await executor.call('stats'),
+    }
+
+@app.get("/metrics")
+async def metrics():
+    QUEUE_DEPTH.set(batcher.queue_depth())
+    body, content_type = render()
+    return Response(content=body, media_type=content_type)
 
 @app.get("/")
 async def root():
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+
+from app.backend.executor import Overloaded
+from app.backend.metrics import BATCH_SIZE, REJECTED
+from app.backend.model.skill import InvalidInput
+
+logger = logging.getLogger(__name__)
+
+class PredictionBatcher:
+    """Coalesces concurrent predictions into batched model calls.
+
+    Requests are queued and a single dispatcher task drains the queue,
+    waiting at most `max_wait` seconds after the first request of a batch
+    for up to `max_batch_size` requests before handing the batch to the
+    executor, one call per model in the batch. While every executor slot
+    is busy, requests keep accumulating into the next batch; past
+    `max_queue` waiting requests new ones are rejected with `Overloaded`.
+    """
+
+    def __init__(self, executor, max_batch_size: int = 64, max_wait: float = 0.002, max_queue: int = 4096):
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self._queue = None
+        self._dispatcher = None
+        self._slots = None
+        self._in_flight = set()
+
+        self.requests = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.batch_sizes = [0] * (max_batch_size + 1)
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.executor.concurrency)
+        self._dispatcher = asyncio.create_task(self._dispatch_forever())
+
+    async def stop(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+    async def predict(self, white: str, black: str, tc: (int, int), model: str = None):
+        if self.queue_depth() >= self.max_queue:
+            REJECTED.inc()
+            raise Overloaded()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(((model, (white, black, tc)), future))
+        return await future
+
+    def queue_depth(self):
+        return 0 if self._queue is None else self._queue.qsize()
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue_depth(),
+            'requests': self.requests,
+            'batches': self.batches,
+            'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+            'max_batch_size': self.max_batch,
+            'batch_sizes': {size: count for size, count in enumerate(self.batch_sizes) if count},
+        }
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _dispatch_forever(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except asyncio.CancelledError:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._resolve(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _resolve(self, batch):
+        try:
+            # callers that went away do not need a prediction
+            batch = [(request, future) for request, future in batch if not future.done()]
+            if not batch:
+                return
+
+            self.requests += len(batch)
+            self.batches += 1
+            self.max_batch = max(self.max_batch, len(batch))
+            self.batch_sizes[len(batch)] += 1
+            BATCH_SIZE.observe(len(batch))
+
+            by_model = {}
+            for (model, game), future in batch:
+                by_model.setdefault(model, []).append((game, future))
+            await asyncio.gather(*(self._resolve_model(model, requests) for model, requests in by_model.items()))
+        finally:
+            self._slots.release()
+
+    async def _resolve_model(self, model, batch):
+        games = [game for game, _ in batch]
+        try:
+            # invalid games come back as their InvalidInput and never poison a batch
+            results = await self.executor.call('route', model, 'try_predict_batch', games)
+        except Exception as e:
+            if not isinstance(e, (Overloaded, InvalidInput)):
+                logger.exception("batched prediction failed")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, InvalidInput):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
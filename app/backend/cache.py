@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import OrderedDict
+
+from app.backend.metrics import CACHE_EVICTIONS, CACHE_LOOKUPS
+
+class PredictionCache:
+    """Bounded LRU cache with a TTL, for predictions keyed by matchup.
+
+    Every entry carries a tag describing the model state it was computed
+    from (see TemporalGraphModel.state_tag). A lookup with a different tag
+    drops the entry, so a memory update only invalidates the entries of the
+    players it touched.
+    """
+
+    def __init__(self, max_size: int = 100000, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, key, tag):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                CACHE_LOOKUPS.labels('miss').inc()
+                return None
+            entry_tag, expires, value = entry
+            if entry_tag != tag or expires < time.monotonic():
+                if entry_tag != tag:
+                    self.invalidations += 1
+                    CACHE_LOOKUPS.labels('invalidated').inc()
+                else:
+                    self.expirations += 1
+                    CACHE_LOOKUPS.labels('expired').inc()
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            CACHE_LOOKUPS.labels('hit').inc()
+            return value
+
+    def put(self, key, tag, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (tag, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+                CACHE_EVICTIONS.inc()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'expirations': self.expirations,
+            'evictions': self.evictions,
+        }
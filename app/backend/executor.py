@@ -0,0 +1,75 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from app.backend.metrics import EXECUTOR_PENDING, REJECTED
+
+logger = logging.getLogger(__name__)
+
+# skill system owned by a process pool worker
+_worker_skill_system = None
+
+def _init_worker(skill_system_factory):
+    global _worker_skill_system
+    _worker_skill_system = skill_system_factory()
+
+def _call_worker(method, *args):
+    return getattr(_worker_skill_system, method)(*args)
+
+class Overloaded(Exception):
+    pass
+
+class InferenceExecutor:
+    """Runs blocking skill system calls off the event loop.
+
+    By default the skill system is built in this process and called from a
+    small thread pool. With `processes` > 0 every pool process builds its own
+    skill system instead, so inference can use one core per process.
+
+    At most `concurrency` calls run at once; callers beyond that wait, and
+    once `max_pending` calls are running or waiting new ones are rejected
+    with `Overloaded`.
+    """
+
+    def __init__(self, skill_system_factory, threads: int = 1, processes: int = 0, max_pending: int = 1024):
+        if processes > 0:
+            self.skill_system = None
+            self.concurrency = processes
+            # torch and OpenMP state does not survive a fork
+            self._executor = ProcessPoolExecutor(
+                processes,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(skill_system_factory,))
+        else:
+            self.skill_system = skill_system_factory()
+            self.concurrency = threads
+            self._executor = ThreadPoolExecutor(threads, thread_name_prefix='inference')
+        self.max_pending = max_pending
+        self.pending = 0
+        self._slots = None
+
+    async def call(self, method: str, *args):
+        if self.pending >= self.max_pending:
+            REJECTED.inc()
+            raise Overloaded()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        self.pending += 1
+        EXECUTOR_PENDING.inc()
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                if self.skill_system is None:
+                    fn = functools.partial(_call_worker, method, *args)
+                else:
+                    fn = functools.partial(getattr(self.skill_system, method), *args)
+                return await loop.run_in_executor(self._executor, fn)
+        finally:
+            self.pending -= 1
+            EXECUTOR_PENDING.dec()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
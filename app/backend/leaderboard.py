@@ -0,0 +1,78 @@
+import threading
+import numpy as np
+import torch
+
+def to_rating(score):
+    """Elo-like rating of an expected score against a 1500 rated panel."""
+    score = np.clip(score, 1e-4, 1 - 1e-4)
+    return 1500 + 400 * np.log10(score / (1 - score))
+
+class Leaderboard:
+    """Every player ranked by the model against a fixed reference panel.
+
+    A player's rating is `to_rating` of their mean expected score against
+    the panel at `time_control`. The panel is sampled, and its embeddings
+    frozen, on every full rebuild, which happens when the model's state
+    epoch changes; otherwise `refresh` only re-scores the players whose
+    node version moved since the last refresh.
+    """
+
+    def __init__(self, model, time_control: (int, int), panel_size: int = 64, min_degree: int = 10, seed: int = 0):
+        self.model = model
+        self.time_control = time_control
+        self.panel_size = panel_size
+        self.min_degree = min_degree
+        self.seed = seed
+        self.panel = None
+        self._panel_embs = None
+        self._epoch = None
+        self._versions = None
+        self.ratings = np.zeros(0, dtype=np.float32)
+        self.order = np.zeros(0, dtype=np.int64)
+        self._lock = threading.Lock()
+
+        self.rebuilds = 0
+        self.rescored = 0
+
+    def refresh(self):
+        with self._lock:
+            model = self.model
+            epoch = model.state_epoch
+            # read before scoring so concurrent updates are picked up next time
+            versions = model.node_version.copy()
+            if epoch != self._epoch:
+                self.panel = model.reference_panel(self.panel_size, self.min_degree, self.seed)
+                self._panel_embs = model.node_embs[torch.from_numpy(self.panel)].clone()
+                nodes = np.arange(len(versions))
+                ratings = np.zeros(len(versions), dtype=np.float32)
+                self.rebuilds += 1
+            else:
+                known = len(self._versions)
+                nodes = np.concatenate([np.nonzero(versions[:known] != self._versions)[0], np.arange(known, len(versions))])
+                if len(nodes) == 0:
+                    return
+                ratings = np.concatenate([self.ratings, np.zeros(len(versions) - known, dtype=np.float32)])
+            ratings[nodes] = to_rating(model.expected_scores(nodes, self._panel_embs, self.time_control))
+            self.rescored += len(nodes)
+            self.order = np.argsort(-ratings, kind='stable')
+            self.ratings = ratings
+            self._epoch = epoch
+            self._versions = versions
+
+    def page(self, offset: int, limit: int):
+        """(rank, node, rating) of the players ranked offset+1 .. offset+limit."""
+        self.refresh()
+        order, ratings = self.order, self.ratings
+        nodes = order[offset:offset + limit]
+        return [(offset + i + 1, int(node), float(ratings[node])) for i, node in enumerate(nodes)]
+
+    def __len__(self):
+        return len(self.order)
+
+    def stats(self):
+        return {
+            'players': len(self.order),
+            'panel_size': 0 if self.panel is None else len(self.panel),
+            'rebuilds': self.rebuilds,
+            'rescored': self.rescored,
+        }
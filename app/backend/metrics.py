@@ -0,0 +1,51 @@
+import os
+
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+                               REGISTRY, generate_latest, multiprocess)
+
+# stages of the serving path take from microseconds (lookups) to seconds (replay)
+STAGE_BUCKETS = (.00001, .00005, .0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+STAGE_SECONDS = Histogram(
+    'deepskill_stage_seconds', 'Time spent in one stage of the serving path',
+    ['stage'], buckets=STAGE_BUCKETS)
+SAMPLER_SECONDS = Counter(
+    'deepskill_sampler_seconds', 'Time recorded by the temporal neighbor sampler, per phase',
+    ['phase'])
+REQUEST_SECONDS = Histogram(
+    'deepskill_request_seconds', 'End-to-end request latency',
+    ['route', 'method', 'status'], buckets=STAGE_BUCKETS)
+BATCH_SIZE = Histogram(
+    'deepskill_batch_size', 'Predictions per batched model call',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512))
+QUEUE_DEPTH = Gauge(
+    'deepskill_batcher_queue_depth', 'Predictions waiting for a batch', multiprocess_mode='livesum')
+EXECUTOR_PENDING = Gauge(
+    'deepskill_executor_pending', 'Inference calls running or waiting for a slot', multiprocess_mode='livesum')
+REJECTED = Counter(
+    'deepskill_rejected', 'Requests rejected because the server is overloaded')
+CACHE_LOOKUPS = Counter(
+    'deepskill_cache_lookups', 'Prediction cache lookups by outcome',
+    ['result'])
+CACHE_EVICTIONS = Counter(
+    'deepskill_cache_evictions', 'Predictions evicted from a full cache')
+MODEL_LOADS = Counter(
+    'deepskill_model_loads', 'Models loaded by the registry')
+MODEL_EVICTIONS = Counter(
+    'deepskill_model_evictions', 'Models evicted by the registry to stay under its memory budget')
+
+def observe_stage(stage: str, seconds: float):
+    """Stage hook for TemporalGraphModel and the skill systems."""
+    if stage.startswith('sampler_'):
+        SAMPLER_SECONDS.labels(stage[len('sampler_'):]).inc(seconds)
+    else:
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+def render():
+    """Prometheus text exposition of every metric, summed over the inference
+    processes when PROMETHEUS_MULTIPROC_DIR is set."""
+    registry = REGISTRY
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
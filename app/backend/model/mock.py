@@ -43,6 +43,10 @@ class MockSkill(SkillRatingSystem):
             raise InvalidInput(invalid)
         
     
+    def search_players(self, prefix: str, limit: int = 10):
+        prefix = prefix.lower()
+        return sorted(player for player in self.players if player.lower().startswith(prefix))[:limit]
+    
     def predict(self, white: str, black: str, tc: (int, int)):
         
         self.validate(white, black, tc)
@@ -52,4 +56,22 @@ class MockSkill(SkillRatingSystem):
             'white': results[0],
             'black': results[1],
             'draw': results[2],
-        }
\ No newline at end of file
+        }    
+    def find_opponents(self, player: str, k: int = 10, tc: (int, int) = (10, 0)):
+        
+        if player not in self.players:
+            raise InvalidInput(['player'])
+        
+        opponents = []
+        for opponent in self.players:
+            if opponent == player:
+                continue
+            as_white = self.predict(player, opponent, tc)
+            as_black = self.predict(opponent, player, tc)
+            opponents.append({
+                'player': opponent,
+                'imbalance': (abs(as_white['white'] - as_white['black']) + abs(as_black['white'] - as_black['black'])) / 2,
+                'as_white': as_white,
+                'as_black': as_black,
+            })
+        return sorted(opponents, key=lambda opponent: opponent['imbalance'])[:k]
@@ -9,3 +9,49 @@ class SkillRatingSystem:
     
     def predict(self, white: str, black: str, tc: (int, int)):
         pass
+    
+    def search_players(self, prefix: str, limit: int = 10):
+        return []
+    
+    def find_opponents(self, player: str, k: int = 10, tc: (int, int) = (10, 0)):
+        raise NotImplementedError
+    
+    def leaderboard(self, type: str = "Blitz", offset: int = 0, limit: int = 50):
+        raise NotImplementedError
+    
+    def memory_usage(self):
+        return 0
+    
+    def stats(self):
+        return {}
+    
+    def validate_games(self, games: [(str, str, str, (int, int), int, int, float)]):
+        pass
+    
+    def ingest(self, games: [(str, str, str, (int, int), int, int, float)]):
+        raise NotImplementedError
+    
+    def validate_batch(self, games: [(str, str, (int, int))]):
+        invalid = []
+        for index, (white, black, tc) in enumerate(games):
+            try:
+                self.validate(white, black, tc)
+            except InvalidInput as e:
+                invalid.append({'index': index, 'invalid': e.invalid})
+        if invalid:
+            raise InvalidInput(invalid)
+    
+    def predict_batch(self, games: [(str, str, (int, int))]):
+        self.validate_batch(games)
+        return [self.predict(white, black, tc) for white, black, tc in games]
+    
+    def try_predict_batch(self, games: [(str, str, (int, int))]):
+        """Like predict_batch, but an invalid game gets its InvalidInput in
+        place of a prediction instead of failing the whole batch."""
+        errors = {}
+        try:
+            self.validate_batch(games)
+        except InvalidInput as e:
+            errors = {item['index']: InvalidInput(item['invalid']) for item in e.invalid}
+        predictions = iter(self.predict_batch([game for index, game in enumerate(games) if index not in errors]))
+        return [errors[index] if index in errors else next(predictions) for index in range(len(games))]
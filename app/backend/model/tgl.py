@@ -1,9 +1,17 @@
+import argparse
 import logging
 import os
+import shutil
+import numpy as np
+import torch
 
+from app.backend.cache import PredictionCache
+from app.backend.leaderboard import Leaderboard
+from app.backend.metrics import observe_stage
 from app.backend.model.skill import SkillRatingSystem, InvalidInput
 from tgl.model import TemporalGraphModel
-from utils.player_statistics import PlayerStatistics
+from utils.player_dict import PlayerDictionary
+from utils.player_statistics import PlayerIndex, PlayerStatistics
 
 logger = logging.getLogger(__name__)
 
@@ -12,52 +20,281 @@ CONFIG = "tgl/config/TGN_PRODUCTION.yml"
 STORED_MODEL = "tgl/models/1685627744.312774.pkl"
 
 PLAYER_DATA = "data/processed/lichess_db_standard_rated_2013-06.csv"
+# player dictionary the dataset was prepared with (csv_to_input.py --player-dict),
+# node ids then come from it instead of from the order of PLAYER_DATA
+PLAYER_DICT = os.environ.get("DEEPSKILL_PLAYER_DICT")
+
+# "cpu", "cuda:0", ... defaults to the GPU when there is one
+DEVICE = os.environ.get("DEEPSKILL_DEVICE")
+NUM_THREADS = int(os.environ.get("DEEPSKILL_NUM_THREADS", 0)) or None
+# optional .npy file to memory-map the precomputed player embeddings into
+EMBEDDINGS = os.environ.get("DEEPSKILL_EMBEDDINGS")
+# warm-state snapshot written by `python -m app.backend.model.tgl <dir>`,
+# used instead of the raw data above when it exists
+SNAPSHOT = os.environ.get("DEEPSKILL_SNAPSHOT")
+SNAPSHOT_PLAYERS = "players.npz"
+# predictions cached per (white, black, time control), 0 disables the cache
+CACHE_SIZE = int(os.environ.get("DEEPSKILL_CACHE_SIZE", 100000))
+CACHE_TTL = float(os.environ.get("DEEPSKILL_CACHE_TTL", 300))
+# serve an int8 quantized, TorchScript-compiled copy of the model (CPU only)
+QUANTIZE = os.environ.get("DEEPSKILL_QUANTIZE", "0") == "1"
+# matchmaking re-ranks this many embedding-space neighbours of the player,
+# 0 scores every player exactly
+MATCHMAKING_CANDIDATES = int(os.environ.get("DEEPSKILL_MATCHMAKING_CANDIDATES", 2000))
+# leaderboards rank players at one representative time control per game type
+LEADERBOARDS = {"Bullet": (1, 0), "Blitz": (5, 0), "Rapid": (10, 0), "Classical": (30, 0)}
+LEADERBOARD_PANEL = int(os.environ.get("DEEPSKILL_LEADERBOARD_PANEL", 64))
+
+# edge feature layout written by utils/csv_to_input.py: the one-hot result,
+# trimmed after the last result of the month, then NUM_GAME_FEATURES columns
+# for minutes, increment, white and black elo
+RESULTS = {"1-0": 0, "0-1": 1, "1/2-1/2": 2}
+NUM_GAME_FEATURES = 4
 
 class TGLDeepSkill(SkillRatingSystem):
     
-    def __init__(self):
-        logger.info(os.getcwd())
-        self.model = TemporalGraphModel(DATA, CONFIG, STORED_MODEL, supervised = True)
-        self.player_stats = PlayerStatistics(PLAYER_DATA)
+    def __init__(self, data = DATA, config = CONFIG, stored_model = STORED_MODEL, player_data = PLAYER_DATA,
+                 device = DEVICE, num_threads = NUM_THREADS, snapshot = SNAPSHOT, quantize = QUANTIZE, player_dict = PLAYER_DICT):
+        if snapshot is not None and os.path.exists(snapshot):
+            logger.info(f"Restoring from snapshot {snapshot}")
+            self.model = TemporalGraphModel.restore(snapshot, device = device, num_threads = num_threads)
+            self.player_stats = None
+            self.player_index = PlayerIndex.load(os.path.join(snapshot, SNAPSHOT_PLAYERS))
+        else:
+            logger.info(f"Building model from {data} with {config} and {stored_model}")
+            self.model = TemporalGraphModel(data, config, stored_model, supervised = True, device = device, num_threads = num_threads)
+            self.player_stats = PlayerStatistics(player_data, PlayerDictionary(player_dict) if player_dict else None)
+            self.player_index = self.player_stats.index()
+        if quantize:
+            try:
+                parity = self.model.export_for_inference()
+                logger.info(f"Serving quantized model, parity with fp32: {parity}")
+            except ValueError as e:
+                logger.warning(f"Serving fp32 model: {e}")
+        if self.model.node_embs is None:
+            self.model.materialize_embeddings(path = EMBEDDINGS)
+        if MATCHMAKING_CANDIDATES > 0:
+            self.model.build_ann_index()
+        self.cache = PredictionCache(max_size = CACHE_SIZE, ttl = CACHE_TTL)
+        self.model.stage_hook = observe_stage
+        # built on first request, a full rebuild scores every player
+        self.leaderboards = {}
     
-    def validate(self, white: str, black: str, tc: (int, int)):
+    def snapshot(self, path: str):
+        partial = path.rstrip('/') + '.partial'
+        self.model.snapshot(partial)
+        self.player_index.save(os.path.join(partial, SNAPSHOT_PLAYERS))
+        shutil.rmtree(path, ignore_errors = True)
+        os.rename(partial, path)
+    
+    def _known(self, username: str, players):
+        # an index can name players past the end of the graph, e.g. ones added
+        # by an ingest whose edges were rejected
+        return username in players and players.code(username) < self.model.num_nodes
+    
+    def _invalid_fields(self, white: str, black: str, tc: (int, int), players):
 
-        error = False
         invalid = []
         
-        if white not in self.player_stats.players():
-            error = True
+        if not self._known(white, players):
             invalid.append('white')
-            pass
-        if black not in self.player_stats.players():
-            error = True
+        if not self._known(black, players):
             invalid.append('black')
-            pass
+        
+        return invalid + self._invalid_tc(tc)
+    
+    def _invalid_tc(self, tc: (int, int)):
+        
+        invalid = []
         
         min = tc[0]
-        inc = tc[0]
+        inc = tc[1]
         
         if min is None or min < 1:
-            error = True
             invalid.append('min')
         
         if inc is None or inc < 0:
-            error = True
             invalid.append('inc')
         
-        if error:
+        return invalid
+    
+    def validate(self, white: str, black: str, tc: (int, int)):
+        invalid = self._invalid_fields(white, black, tc, self.player_index)
+        if invalid:
             raise InvalidInput(invalid)
     
+    def validate_batch(self, games: [(str, str, (int, int))]):
+        players = self.player_index
+        invalid = []
+        for index, (white, black, tc) in enumerate(games):
+            fields = self._invalid_fields(white, black, tc, players)
+            if fields:
+                invalid.append({'index': index, 'invalid': fields})
+        if invalid:
+            raise InvalidInput(invalid)
+    
+    def search_players(self, prefix: str, limit: int = 10):
+        return self.player_index.search(prefix, limit)
+    
+    def find_opponents(self, player: str, k: int = 10, tc: (int, int) = (10, 0)):
+        invalid = self._invalid_tc(tc)
+        if not self._known(player, self.player_index):
+            invalid.insert(0, 'player')
+        if invalid:
+            raise InvalidInput(invalid)
+        
+        nodes, imbalance, as_white, as_black = self.model.find_opponents(
+            self.player_index.code(player), k, tc, num_candidates = MATCHMAKING_CANDIDATES or None)
+        
+        def outcome(pred):
+            return {'white': pred[0], 'black': pred[1], 'draw': pred[2]}
+        
+        return [{
+                'player': self.player_index.username(node),
+                'imbalance': score,
+                'as_white': outcome(white),
+                'as_black': outcome(black),
+            } for node, score, white, black in zip(nodes, imbalance, as_white, as_black)]
+    
+    def leaderboard(self, type: str = "Blitz", offset: int = 0, limit: int = 50):
+        if type not in LEADERBOARDS:
+            raise InvalidInput(['type'])
+        if type not in self.leaderboards:
+            self.leaderboards[type] = Leaderboard(self.model, LEADERBOARDS[type], panel_size = LEADERBOARD_PANEL)
+        leaderboard = self.leaderboards[type]
+        entries = leaderboard.page(offset, limit)
+        return {
+            'type': type,
+            'total': len(leaderboard),
+            'entries': [{
+                    'rank': rank,
+                    'player': self.player_index.username(node),
+                    'rating': rating,
+                } for rank, node, rating in entries],
+        }
+    
     def predict(self, white: str, black: str, tc: (int, int)):
+        with self.model.stage('validate'):
+            self.validate(white, black, tc)
+        return self._predict([(white, black, tc)])[0]
+    
+    def predict_batch(self, games: [(str, str, (int, int))]):
+        with self.model.stage('validate'):
+            self.validate_batch(games)
+        return self._predict(games)
+    
+    def _num_results(self):
+        # results the one-hot block of the edge features has room for
+        if self.model.edge_feats is None:
+            return len(RESULTS)
+        return self.model.edge_feats.shape[1] - NUM_GAME_FEATURES
+    
+    def validate_games(self, games: [(str, str, str, (int, int), int, int, float)]):
+        latest_ts = self.model.latest_ts
+        num_results = self._num_results()
+        invalid = []
+        for index, (white, black, result, tc, white_elo, black_elo, time) in enumerate(games):
+            fields = []
+            if not white or not black or white == black:
+                fields.append('players')
+            if result not in RESULTS or RESULTS[result] >= num_results:
+                fields.append('result')
+            if tc[0] is None or tc[0] <= 0:
+                fields.append('min')
+            if tc[1] is None or tc[1] < 0:
+                fields.append('inc')
+            if white_elo is None or white_elo <= 0:
+                fields.append('white_elo')
+            if black_elo is None or black_elo <= 0:
+                fields.append('black_elo')
+            if time is not None and time < latest_ts:
+                fields.append('time')
+            if fields:
+                invalid.append({'index': index, 'invalid': fields})
+        if invalid:
+            raise InvalidInput(invalid)
+    
+    def ingest(self, games: [(str, str, str, (int, int), int, int, float)]):
+        """Add finished games to the graph and update the players' memory.
+
+        Each game is (white, black, result, (min, inc), white_elo, black_elo, time)
+        where `time` is in graph time units and defaults to the latest game.
+        """
+        self.validate_games(games)
+        latest_ts = self.model.latest_ts
+        
+        num_players = len(self.player_index)
+        src = np.array([self.player_index.add(white) for white, *_ in games])
+        dst = np.array([self.player_index.add(black) for _, black, *_ in games])
+        time = np.array([latest_ts if game[6] is None else game[6] for game in games], dtype=np.float64)
         
-        self.validate(white, black, tc)
-        white_node = self.player_stats.code_from_username(white)
-        black_node = self.player_stats.code_from_username(black)
-        pred = self.model.get_prediction(white_node, black_node, tc)
+        results = torch.tensor([RESULTS[game[2]] for game in games])
+        numeric = torch.tensor([[
+                tc[0]*60/1200,
+                tc[1]/10,
+                (white_elo - 1500)/400,
+                (black_elo - 1500)/400,
+            ] for _, _, _, tc, white_elo, black_elo, _ in games], dtype=torch.float64)
+        edge_feats = torch.cat((torch.nn.functional.one_hot(results, self._num_results()), numeric), 1)
         
+        try:
+            self.model.add_edges(src, dst, time, edge_feats)
+        except ValueError as e:
+            raise InvalidInput(str(e))
+        
+        return {
+            'games': len(games),
+            'new_players': len(self.player_index) - num_players,
+        }
+    
+    def _predict(self, games: [(str, str, (int, int))]):
+        
+        if not games:
+            return []
+        predictions = [None] * len(games)
+        misses = []
+        with self.model.stage('cache_lookup'):
+            for index, (white, black, tc) in enumerate(games):
+                white_node = self.player_index.code(white)
+                black_node = self.player_index.code(black)
+                key = (white, black, tuple(tc))
+                tag = self.model.state_tag(white_node, black_node)
+                predictions[index] = self.cache.get(key, tag)
+                if predictions[index] is None:
+                    misses.append((index, white_node, black_node, tuple(tc), key, tag))
+        
+        if misses:
+            preds = self.model.get_predictions(
+                [white_node for _, white_node, _, _, _, _ in misses],
+                [black_node for _, _, black_node, _, _, _ in misses],
+                [tc for _, _, _, tc, _, _ in misses])
+            for (index, _, _, _, key, tag), pred in zip(misses, preds):
+                predictions[index] = {
+                    'white': pred[0],
+                    'black': pred[1],
+                    'draw': pred[2],
+                }
+                self.cache.put(key, tag, predictions[index])
+        
+        return predictions
+    
+    def memory_usage(self):
+        return self.model.memory_usage()
+    
+    def stats(self):
         return {
-            'white': pred[0],
-            'black': pred[1],
-            'draw': pred[2],
+            'cache': self.cache.stats(),
+            'leaderboards': {type: leaderboard.stats() for type, leaderboard in self.leaderboards.items()},
         }
-        
\ No newline at end of file
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the model from the raw data and write a warm-state snapshot.')
+    parser.add_argument('snapshot', help='directory to write the snapshot to')
+    parser.add_argument('--data', default=DATA, help='dataset directory')
+    parser.add_argument('--config', default=CONFIG, help='model config')
+    parser.add_argument('--stored-model', default=STORED_MODEL, help='trained model weights')
+    parser.add_argument('--player-data', default=PLAYER_DATA, help='processed games csv')
+    parser.add_argument('--player-dict', default=PLAYER_DICT, help='player dictionary the dataset was prepared with')
+    args = parser.parse_args()
+    TGLDeepSkill(args.data, args.config, args.stored_model, args.player_data,
+                 snapshot = None, quantize = False, player_dict = args.player_dict).snapshot(args.snapshot)
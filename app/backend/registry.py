@@ -0,0 +1,118 @@
+import gc
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import yaml
+
+from app.backend.metrics import MODEL_EVICTIONS, MODEL_LOADS
+from app.backend.model.skill import InvalidInput
+
+logger = logging.getLogger(__name__)
+
+class ModelRegistry:
+    """Several named skill systems, loaded on first use.
+
+    `specs` maps a model name to the keyword arguments passed to `factory`
+    to build it. Loaded systems are kept in LRU order; once their combined
+    `memory_usage()` exceeds `memory_budget` bytes (0 for no limit) the
+    least recently used ones are dropped, together with their graph,
+    mailbox and embeddings. Requests in flight keep their system alive
+    until they finish.
+    """
+
+    def __init__(self, specs: dict, factory, default: str = None, memory_budget: int = 0):
+        if not specs:
+            raise ValueError('no models configured')
+        self.specs = specs
+        self.factory = factory
+        self.default = default or next(iter(specs))
+        if self.default not in specs:
+            raise ValueError('default model {} is not configured'.format(self.default))
+        self.memory_budget = memory_budget
+        self._loaded = OrderedDict()
+        # last measured size per model, to make room before loading it again
+        self._sizes = {}
+        self._loading = {}
+        self._lock = threading.Lock()
+
+        self.loads = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_config(cls, path: str, factory, default: str = None, memory_budget: int = 0, shared_state: str = None):
+        """Registry over the models of a yml file mapping names to factory
+        arguments, or over one 'default' model built with no arguments. The
+        default model is loaded right away.
+
+        With `shared_state`, each model without a `shared_state` entry of its
+        own gets the directory `<shared_state>/<name>`."""
+        if path is None:
+            specs = {'default': {}}
+        else:
+            with open(path) as f:
+                specs = yaml.safe_load(f)
+        if shared_state is not None:
+            specs = {name: {'shared_state': os.path.join(shared_state, name), **spec} for name, spec in specs.items()}
+        registry = cls(specs, factory, default, memory_budget)
+        registry.get()
+        return registry
+
+    def get(self, name: str = None):
+        name = name or self.default
+        if name not in self.specs:
+            raise InvalidInput(['model'])
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                return self._loaded[name][0]
+            load_lock = self._loading.setdefault(name, threading.Lock())
+
+        # one load per model at a time, other models keep serving meanwhile
+        with load_lock:
+            with self._lock:
+                if name in self._loaded:
+                    self._loaded.move_to_end(name)
+                    return self._loaded[name][0]
+                self._evict(self._sizes.get(name, 0))
+            logger.info(f"Loading model {name}")
+            system = self.factory(**self.specs[name])
+            size = system.memory_usage()
+            with self._lock:
+                self._sizes[name] = size
+                self._evict(size)
+                self._loaded[name] = (system, size)
+                self.loads += 1
+                MODEL_LOADS.inc()
+        return system
+
+    def route(self, model: str, method: str, *args):
+        return getattr(self.get(model), method)(*args)
+
+    def memory_usage(self):
+        return sum(size for _, size in self._loaded.values())
+
+    def _evict(self, incoming: int):
+        evicted = False
+        while self.memory_budget > 0 and self._loaded and self.memory_usage() + incoming > self.memory_budget:
+            name, (_, size) = self._loaded.popitem(last=False)
+            logger.info(f"Evicting model {name} ({size} bytes)")
+            self.evictions += 1
+            MODEL_EVICTIONS.inc()
+            evicted = True
+        if evicted:
+            gc.collect()
+
+    def stats(self):
+        with self._lock:
+            loaded = list(self._loaded.items())
+        return {
+            'default': self.default,
+            'models': list(self.specs),
+            'loaded': {name: {'memory_usage': size, **system.stats()} for name, (system, size) in loaded},
+            'memory_usage': sum(size for _, (_, size) in loaded),
+            'memory_budget': self.memory_budget,
+            'loads': self.loads,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,264 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+from app.backend.model.skill import SkillRatingSystem
+
+logger = logging.getLogger(__name__)
+
+CURRENT = "CURRENT"
+WRITER_LOCK = "writer.lock"
+SPOOL = "games.jsonl"
+SPOOL_LOCK = "games.lock"
+
+class SharedState:
+    """Generations of snapshots under one directory, shared by processes.
+
+    Each generation is a snapshot directory `gen-<n>`; the CURRENT file
+    names the latest complete one and is replaced atomically, so a reader
+    never sees a partially written generation. Readers memory-map the
+    snapshot arrays, so all processes share the same physical pages.
+    """
+
+    def __init__(self, root: str, keep: int = 3):
+        self.root = root
+        self.keep = keep
+        os.makedirs(root, exist_ok=True)
+
+    def current(self):
+        """(generation, path) of the latest published snapshot, or None."""
+        try:
+            with open(os.path.join(self.root, CURRENT)) as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return int(name.split('-')[1]), os.path.join(self.root, name)
+
+    def publish(self, write):
+        """Write the next generation with `write(path)` and make it current."""
+        current = self.current()
+        name = 'gen-{}'.format(1 if current is None else current[0] + 1)
+        write(os.path.join(self.root, name))
+        tmp = os.path.join(self.root, CURRENT + '.tmp')
+        with open(tmp, 'w') as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.root, CURRENT))
+        self._prune()
+        return self.current()
+
+    def _prune(self):
+        generations = sorted(int(name.split('-')[1]) for name in os.listdir(self.root)
+                             if name.startswith('gen-') and name.split('-')[1].isdigit())
+        # readers keep mapped files of removed generations alive until they switch
+        for generation in generations[:-self.keep]:
+            shutil.rmtree(os.path.join(self.root, 'gen-{}'.format(generation)), ignore_errors=True)
+
+    def try_acquire_writer(self):
+        """Open file holding the writer lock, or None if another process has it.
+
+        The lock goes away with the process, so a reader can take over from
+        a writer that died."""
+        f = open(os.path.join(self.root, WRITER_LOCK), 'a')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return None
+        return f
+
+    def spool(self, games):
+        """Queue games for the writer."""
+        with open(os.path.join(self.root, SPOOL_LOCK), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            with open(os.path.join(self.root, SPOOL), 'a') as f:
+                for game in games:
+                    f.write(json.dumps(game) + '\n')
+
+    def drain(self):
+        """Take every queued game off the spool."""
+        path = os.path.join(self.root, SPOOL)
+        with open(os.path.join(self.root, SPOOL_LOCK), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(path) as f:
+                    lines = f.readlines()
+            except FileNotFoundError:
+                return []
+            os.remove(path)
+        games = []
+        for line in lines:
+            white, black, result, tc, white_elo, black_elo, game_time = json.loads(line)
+            games.append((white, black, result, tuple(tc), white_elo, black_elo, game_time))
+        return games
+
+class SharedSkill(SkillRatingSystem):
+    """Skill system whose state is shared by every process using `root`.
+
+    Exactly one process, the holder of the writer lock, owns the mutable
+    state: it ingests games, its own and the ones the readers spool for it,
+    and publishes a new snapshot generation at most every
+    `publish_interval` seconds. The other processes serve from the current
+    generation, memory-mapped, and re-attach when a newer one appears.
+    `factory(snapshot=path, **kwargs)` builds the skill system of a
+    generation; with snapshot=None it builds the first one from raw data.
+    """
+
+    def __init__(self, factory, root: str, poll_interval: float = 1.0, publish_interval: float = 10.0, **kwargs):
+        self.factory = factory
+        self.kwargs = kwargs
+        self.state = SharedState(root)
+        self.poll_interval = poll_interval
+        self.publish_interval = publish_interval
+        self._writer_lock = self.state.try_acquire_writer()
+        self._refresh_lock = threading.Lock()
+        # ingestion and publishing must not interleave on the writer
+        self._write_lock = threading.Lock()
+        self._dirty = False
+        self._last_poll = time.monotonic()
+
+        current = self.state.current()
+        if current is None and self._writer_lock is not None:
+            logger.info(f"Publishing the first generation to {root}")
+            system = self.factory(snapshot = None, **self.kwargs)
+            current = self.state.publish(system.snapshot)
+        while current is None:
+            # the writer is still building the first generation
+            time.sleep(self.poll_interval)
+            current = self.state.current()
+        self.generation, path = current
+        self.system = self.factory(snapshot = path, **self.kwargs)
+        if self._writer_lock is not None:
+            self._start_writer()
+
+    @property
+    def is_writer(self):
+        return self._writer_lock is not None
+
+    def _start_writer(self):
+        logger.info(f"Process {os.getpid()} is the writer for {self.state.root}")
+        thread = threading.Thread(target=self._write_forever, name='shared-state-writer', daemon=True)
+        thread.start()
+
+    def _write_forever(self):
+        while True:
+            time.sleep(self.publish_interval)
+            with self._write_lock:
+                games = self.state.drain()
+                if games:
+                    try:
+                        self.system.ingest(games)
+                        self._dirty = True
+                    except Exception:
+                        logger.exception(f"dropping {len(games)} spooled games")
+                if self._dirty:
+                    self._dirty = False
+                    try:
+                        self.generation, _ = self.state.publish(self.system.snapshot)
+                    except Exception:
+                        self._dirty = True
+                        logger.exception("publishing a snapshot failed")
+
+    def _poll(self):
+        now = time.monotonic()
+        if self.is_writer or now - self._last_poll < self.poll_interval:
+            return
+        self._last_poll = now
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            # set when the writer died, we take over from the latest generation
+            writer_lock = self.state.try_acquire_writer()
+            current = self.state.current()
+            if current is not None and current[0] != self.generation:
+                threading.Thread(target=self._attach, args=(*current, writer_lock), daemon=True).start()
+            elif writer_lock is not None:
+                self._writer_lock = writer_lock
+                self._start_writer()
+                self._refresh_lock.release()
+            else:
+                self._refresh_lock.release()
+        except BaseException:
+            self._refresh_lock.release()
+            raise
+
+    def _attach(self, generation, path, writer_lock = None):
+        try:
+            logger.info(f"Attaching to generation {generation}")
+            self.system = self.factory(snapshot = path, **self.kwargs)
+            self.generation = generation
+            if writer_lock is not None:
+                self._writer_lock = writer_lock
+                self._start_writer()
+        except Exception:
+            logger.exception(f"failed to attach to generation {generation}")
+        finally:
+            self._refresh_lock.release()
+
+    def ingest(self, games: [(str, str, str, (int, int), int, int, float)]):
+        self._poll()
+        if self.is_writer:
+            with self._write_lock:
+                result = self.system.ingest(games)
+                self._dirty = True
+            return result
+        self.system.validate_games(games)
+        self.state.spool(games)
+        return {'games': len(games), 'queued': True}
+
+    def validate(self, white: str, black: str, tc: (int, int)):
+        return self.system.validate(white, black, tc)
+
+    def predict(self, white: str, black: str, tc: (int, int)):
+        self._poll()
+        return self.system.predict(white, black, tc)
+
+    def validate_batch(self, games: [(str, str, (int, int))]):
+        return self.system.validate_batch(games)
+
+    def predict_batch(self, games: [(str, str, (int, int))]):
+        self._poll()
+        return self.system.predict_batch(games)
+
+    def try_predict_batch(self, games: [(str, str, (int, int))]):
+        self._poll()
+        return self.system.try_predict_batch(games)
+
+    def search_players(self, prefix: str, limit: int = 10):
+        self._poll()
+        return self.system.search_players(prefix, limit)
+
+    def find_opponents(self, player: str, k: int = 10, tc: (int, int) = (10, 0)):
+        self._poll()
+        return self.system.find_opponents(player, k, tc)
+
+    def leaderboard(self, type: str = "Blitz", offset: int = 0, limit: int = 50):
+        self._poll()
+        return self.system.leaderboard(type, offset, limit)
+
+    def memory_usage(self):
+        return self.system.memory_usage()
+
+    def stats(self):
+        return {
+            'shared_state': {
+                'root': self.state.root,
+                'generation': self.generation,
+                'writer': self.is_writer,
+                'pid': os.getpid(),
+            },
+            **self.system.stats(),
+        }
+
+def build(factory, shared_state: str = None, **kwargs):
+    """`factory(**kwargs)`, shared across processes through the directory
+    `shared_state` when one is given. Used as the registry's model factory;
+    every model needs a directory of its own."""
+    if shared_state is None:
+        return factory(**kwargs)
+    return SharedSkill(factory, shared_state, **kwargs)
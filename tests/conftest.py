@@ -0,0 +1,135 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+# the preprocessing scripts import their siblings by module name
+sys.path.insert(1, str(ROOT / "utils"))
+
+EVENTS = {
+    "Rated Bullet game": "60+0",
+    "Rated Blitz game": "300+0",
+    "Rated Rapid game": "600+5",
+    "Rated Classical game": "1800+30",
+    "Rated Correspondence game": "-",
+}
+
+def games_frame(num_games, num_players, seed = 0, start = "2013-06-01", players = None):
+    """Processed games like pgn_to_csv writes them, a few seconds apart so
+    that some share a timestamp, with some unfinished and unrated ones."""
+    rng = np.random.default_rng(seed)
+    if players is None:
+        players = ["player{}".format(i) for i in range(num_players)]
+    white = rng.integers(0, len(players), num_games)
+    black = (white + rng.integers(1, len(players), num_games)) % len(players)
+    events = rng.choice(list(EVENTS), num_games)
+    time = pd.Timestamp(start) + pd.to_timedelta(np.cumsum(rng.integers(0, 3, num_games)), unit = "s")
+    # shuffled so sorting by time matters
+    order = rng.permutation(num_games)
+    df = pd.DataFrame({
+        "Event": events,
+        "White": np.asarray(players)[white],
+        "Black": np.asarray(players)[black],
+        "Result": rng.choice(["1-0", "0-1", "1/2-1/2", "*"], num_games, p = [0.45, 0.4, 0.1, 0.05]),
+        "BlackElo": rng.integers(800, 2500, num_games).astype(str),
+        "WhiteElo": rng.integers(800, 2500, num_games).astype(str),
+        "TimeControl": [EVENTS[event] for event in events],
+        "UTCDate": time.strftime("%Y.%m.%d"),
+        "UTCTime": time.strftime("%H:%M:%S"),
+    }).iloc[order].reset_index(drop = True)
+    df.loc[rng.random(num_games) < 0.02, "WhiteElo"] = "?"
+    return df
+
+@pytest.fixture
+def write_games(tmp_path):
+    """Writes a games csv into the test's tmp dir and returns its path."""
+    def write(name = "games.csv", num_games = 500, num_players = 40, **kwargs):
+        path = tmp_path / name
+        games_frame(num_games, num_players, **kwargs).to_csv(path, index = False)
+        return path
+    return write
+
+def build_tgl_dataset(root, games_df):
+    """A small dataset built like a month is: csv_to_input, then gen_graph,
+    with a TGN config for the CPU and freshly initialized weights."""
+    pytest.importorskip("dgl")
+    pytest.importorskip("torch_scatter")
+    pytest.importorskip("tgl.sampler_core")
+    import torch
+    from csv_to_input import prepare_input
+    from tgl.gen_graph import build_csr
+    from tgl.model import TemporalGraphModel
+    from tgl.utils import load_feat, load_graph, parse_config
+
+    games = root / "games.csv"
+    games_df.to_csv(games, index = False)
+    data = root / "LICHESS-TEST"
+    data.mkdir()
+    prepare_input(games, data)
+    df = pd.read_csv(data / "edges.csv")
+    num_nodes = max(df["src"].max(), df["dst"].max()) + 1
+    indptr, indices, ts, eid = build_csr(df["src"].values, df["dst"].values, df["time"].values, num_nodes)
+    np.savez(data / "ext_full.npz", indptr = indptr, indices = indices, ts = ts, eid = eid)
+
+    with open(ROOT / "tgl" / "config" / "TGN.yml") as f:
+        config = yaml.safe_load(f)
+    config["sampling"][0]["num_thread"] = 2
+    config["train"][0]["batch_size"] = 200
+    config["train"][0]["all_on_gpu"] = False
+    with open(root / "TGN.yml", "w") as f:
+        yaml.safe_dump(config, f)
+
+    torch.manual_seed(0)
+    tgm = TemporalGraphModel.__new__(TemporalGraphModel)
+    node_feats, edge_feats = load_feat(str(data))
+    g, df = load_graph(str(data))
+    tgm._setup(node_feats, edge_feats, g, df, parse_config(root / "TGN.yml"), True, "cpu", 2)
+    torch.save(tgm.model.state_dict(), root / "model.pkl")
+    return {
+        "games": games,
+        "data": str(data),
+        "config": str(root / "TGN.yml"),
+        "stored_model": str(root / "model.pkl"),
+    }
+
+@pytest.fixture(scope = "session")
+def tgl_dataset(tmp_path_factory):
+    return build_tgl_dataset(tmp_path_factory.mktemp("tgl"), games_frame(2000, 120))
+
+@pytest.fixture(scope = "session")
+def tgl_dataset_without_draws(tmp_path_factory):
+    """A month without draws, whose edge features have two result columns."""
+    games = games_frame(1000, 80, seed = 1)
+    games["Result"] = games["Result"].replace("1/2-1/2", "1-0")
+    return build_tgl_dataset(tmp_path_factory.mktemp("tgl"), games)
+
+@pytest.fixture
+def tgl_model(tgl_dataset):
+    from tgl.model import TemporalGraphModel
+    return TemporalGraphModel(tgl_dataset["data"], tgl_dataset["config"], tgl_dataset["stored_model"],
+                              supervised = True, device = "cpu", num_threads = 2)
+
+@pytest.fixture
+def api(monkeypatch):
+    """The api module serving MockSkill, imported afresh with the settings
+    the test put in the environment."""
+    pytest.importorskip("dgl")
+    pytest.importorskip("torch_scatter")
+    import importlib
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setenv("DEEPSKILL_BACKEND", "mock")
+    sys.modules.pop("api", None)
+    module = importlib.import_module("api")
+    yield module
+    sys.modules.pop("api", None)
+
+@pytest.fixture
+def client(api):
+    from fastapi.testclient import TestClient
+    with TestClient(api.app) as client:
+        yield client
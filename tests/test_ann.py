@@ -0,0 +1,39 @@
+import torch
+
+from tgl.ann import IVFIndex
+
+def clustered(num_clusters = 20, per_cluster = 100, dim = 10, seed = 0):
+    gen = torch.Generator().manual_seed(seed)
+    centers = torch.randn(num_clusters, dim, generator = gen) * 5
+    return (centers.repeat_interleave(per_cluster, 0) + torch.randn(num_clusters * per_cluster, dim, generator = gen))
+
+def exact(vectors, query, k):
+    return torch.topk((vectors - query).pow(2).sum(1), k, largest = False)[1]
+
+def test_lists_partition_the_vectors():
+    vectors = clustered()
+    index = IVFIndex(num_lists = 16).build(vectors)
+    assert torch.equal(torch.sort(index.list_ids)[0], torch.arange(len(vectors)))
+    assert index.list_offsets[-1] == len(vectors)
+    assert index.centroids.shape == (16, vectors.shape[1])
+
+def test_all_probes_is_exact():
+    vectors = clustered()
+    index = IVFIndex(num_lists = 16).build(vectors)
+    for query in vectors[::97]:
+        ids, dists = index.search(vectors, query, 10, num_probes = 16)
+        assert torch.equal(torch.sort(ids)[0], torch.sort(exact(vectors, query, 10))[0])
+        assert torch.all(dists[1:] >= dists[:-1])
+
+def test_recall():
+    vectors = clustered()
+    index = IVFIndex().build(vectors)
+    queries = vectors[::50]
+    found = sum(len(set(index.search(vectors, query, 10)[0].tolist()) & set(exact(vectors, query, 10).tolist())) for query in queries)
+    assert found / (10 * len(queries)) >= 0.9
+
+def test_more_lists_than_vectors():
+    vectors = clustered(num_clusters = 1, per_cluster = 3)
+    index = IVFIndex(num_lists = 10).build(vectors)
+    assert index.centroids.shape[0] == 3
+    assert len(index.search(vectors, vectors[0], 5)[0]) == 3
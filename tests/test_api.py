@@ -0,0 +1,52 @@
+def test_predict(client):
+    response = client.get("/predict", params = {"white": "John", "black": "Alice", "min": 5})
+    assert response.status_code == 200
+    assert response.json() == {"white": 0.7, "black": 0.2, "draw": 0.1}
+
+def test_predict_invalid(client):
+    response = client.get("/predict", params = {"white": "John", "black": "Nobody"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == ["black"]
+
+def test_predict_batch(client):
+    games = [["John", "Alice", 5, 0], ["Bobby", "John", 10, 0], ["Alice", "Bobby", 3, 2]]
+    response = client.post("/predict/batch", json = games)
+    assert response.status_code == 200
+    assert response.json() == [client.get("/predict", params = {"white": white, "black": black, "min": min, "inc": inc}).json()
+                               for white, black, min, inc in games]
+
+def test_predict_batch_reports_every_invalid_game(client):
+    games = [["John", "Alice", 5, 0], ["John", "Nobody", 5, 0], ["Nobody", "Alice", 0, 0]]
+    response = client.post("/predict/batch", json = games)
+    assert response.status_code == 400
+    assert response.json()["detail"] == [
+        {"index": 1, "invalid": ["black"]},
+        {"index": 2, "invalid": ["white", "min"]},
+    ]
+
+def test_players(client):
+    assert client.get("/players", params = {"prefix": "b"}).json() == ["Bobby"]
+    assert client.get("/players", params = {"limit": 2}).json() == ["Alice", "Bobby"]
+    assert client.get("/players", params = {"limit": 0}).status_code == 422
+
+def test_ingest_not_supported(client):
+    game = {"white": "John", "black": "Alice", "result": "1-0", "white_elo": 1500, "black_elo": 1500}
+    assert client.post("/games", json = [game]).status_code == 501
+
+def test_ingest_needs_shared_state_with_processes(api, client, monkeypatch):
+    game = {"white": "John", "black": "Alice", "result": "1-0", "white_elo": 1500, "black_elo": 1500}
+    monkeypatch.setattr(api, "INFERENCE_PROCESSES", 2)
+    response = client.post("/games", json = [game])
+    assert response.status_code == 501 and "DEEPSKILL_SHARED_STATE" in response.json()["detail"]
+    monkeypatch.setattr(api, "SHARED_STATE", "state")
+    assert client.post("/games", json = [game]).json()["detail"] == "ingestion not supported"
+
+def test_matchmaking(client):
+    response = client.get("/matchmaking", params = {"player": "John", "k": 1})
+    assert response.status_code == 200
+    assert [opponent["player"] for opponent in response.json()] == ["Bobby"]
+    assert client.get("/matchmaking", params = {"player": "Nobody"}).status_code == 400
+
+def test_leaderboard_not_supported(client):
+    assert client.get("/leaderboard").status_code == 501
+    assert client.get("/leaderboard", params = {"limit": 1000}).status_code == 422
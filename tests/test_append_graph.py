@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from tgl.append_graph import merge_csr
+from tgl.gen_graph import build_csr
+
+def edges(num_edges, num_nodes, seed = 0):
+    rng = np.random.default_rng(seed)
+    src = rng.integers(0, num_nodes, num_edges)
+    dst = (src + rng.integers(1, num_nodes, num_edges)) % num_nodes
+    return src, dst, np.cumsum(rng.integers(0, 3, num_edges))
+
+def split(num_edges, num_nodes, at, add_reverse, seed = 0):
+    """The graph of the first `at` edges merged with the rest, and the one
+    built over all of them; the old edges only reach the first nodes so
+    that the new ones bring new nodes."""
+    src, dst, ts = edges(num_edges, num_nodes, seed)
+    old = (src[:at] < num_nodes // 2) & (dst[:at] < num_nodes // 2)
+    src = np.concatenate([src[:at][old], src[at:]])
+    dst = np.concatenate([dst[:at][old], dst[at:]])
+    ts = np.concatenate([ts[:at][old], ts[at:]])
+    at = int(old.sum())
+    graph = build_csr(src[:at], dst[:at], ts[:at], num_nodes // 2, add_reverse)
+    merged = merge_csr(*graph, src[at:], dst[at:], ts[at:], np.arange(at, len(src)), add_reverse)
+    # as --check rebuilds it, up to the last node an edge reaches
+    rebuilt = build_csr(src, dst, ts, len(merged[0]) - 1, add_reverse)
+    return merged, rebuilt, at > 0 and ts[at - 1] == ts[at]
+
+@pytest.mark.parametrize("add_reverse", [False, True])
+@pytest.mark.parametrize("at", [1, 700, 1999])
+def test_merge_csr(add_reverse, at):
+    merged, rebuilt, _ = split(2000, 40, at, add_reverse)
+    assert all(x.dtype == y.dtype and np.array_equal(x, y) for x, y in zip(merged, rebuilt))
+
+@pytest.mark.parametrize("add_reverse", [False, True])
+def test_merge_csr_ties_at_the_boundary(add_reverse):
+    # new edges at the same second as the last old one go after it
+    for seed in range(20):
+        merged, rebuilt, tie = split(500, 20, 250, add_reverse, seed)
+        if tie:
+            break
+    assert tie
+    assert all(np.array_equal(x, y) for x, y in zip(merged, rebuilt))
+
+def test_merge_nothing():
+    src, dst, ts = edges(100, 10)
+    graph = build_csr(src, dst, ts, 10)
+    assert merge_csr(*graph, [], [], np.array([], dtype = ts.dtype), []) == graph
+
+def test_merge_older_edges():
+    src, dst, ts = edges(100, 10)
+    graph = build_csr(src, dst, ts, 10)
+    with pytest.raises(ValueError):
+        merge_csr(*graph, [1], [2], [ts[-1] - 1], [100])
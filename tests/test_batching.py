@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from app.backend.batching import PredictionBatcher
+from app.backend.executor import InferenceExecutor, Overloaded
+from app.backend.model.mock import MockSkill
+from app.backend.model.skill import InvalidInput
+from app.backend.registry import ModelRegistry
+
+def run(batcher, requests):
+    """Results of `requests` (white, black, tc, model) sent concurrently,
+    exceptions in place of the failed ones."""
+    async def main():
+        batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.predict(*request) for request in requests), return_exceptions = True)
+        finally:
+            await batcher.stop()
+    return asyncio.run(main())
+
+@pytest.fixture
+def executor():
+    executor = InferenceExecutor(lambda: ModelRegistry({'a': {}, 'b': {}}, MockSkill), threads = 2)
+    yield executor
+    executor.shutdown()
+
+def test_coalesces_concurrent_requests(executor):
+    batcher = PredictionBatcher(executor, max_batch_size = 8, max_wait = 0.05)
+    requests = [("John", "Alice", (5, 0), None), ("Bobby", "John", (5, 0), None)] * 10
+    results = run(batcher, requests)
+    assert results == [MockSkill().predict(white, black, tc) for white, black, tc, _ in requests]
+    stats = batcher.stats()
+    assert stats['requests'] == 20
+    assert stats['batches'] < 20
+    assert stats['max_batch_size'] <= 8
+    assert sum(size * count for size, count in stats['batch_sizes'].items()) == 20
+
+def test_invalid_request_does_not_fail_its_batch(executor):
+    batcher = PredictionBatcher(executor, max_wait = 0.05)
+    results = run(batcher, [("John", "Alice", (5, 0), None), ("John", "Nobody", (5, 0), None), ("Alice", "Bobby", (5, 0), None)])
+    assert results[0] == MockSkill().predict("John", "Alice", (5, 0))
+    assert isinstance(results[1], InvalidInput) and results[1].invalid == ['black']
+    assert results[2] == MockSkill().predict("Alice", "Bobby", (5, 0))
+    assert batcher.stats()['batches'] == 1
+
+def test_one_call_per_model(executor):
+    batcher = PredictionBatcher(executor, max_wait = 0.05)
+    results = run(batcher, [("John", "Alice", (5, 0), "a"), ("John", "Alice", (5, 0), "b"), ("John", "Alice", (5, 0), "c")])
+    assert results[0] == results[1] == MockSkill().predict("John", "Alice", (5, 0))
+    assert isinstance(results[2], InvalidInput) and results[2].invalid == ['model']
+    assert executor.skill_system.loads == 2
+
+def test_full_queue_rejects(executor):
+    batcher = PredictionBatcher(executor, max_queue = 0)
+    results = run(batcher, [("John", "Alice", (5, 0), None)])
+    assert isinstance(results[0], Overloaded)
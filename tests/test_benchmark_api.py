@@ -0,0 +1,51 @@
+import argparse
+
+import pytest
+
+from app.backend.model.mock import MockSkill
+from utils.benchmark_api import TIME_CONTROLS, percentile, regressions, run, run_model_level, sample_games, summarize
+
+def args(**kwargs):
+    defaults = dict(target = 'app', mock = True, pairs = 50, time_controls = TIME_CONTROLS, concurrency = '1,4',
+                    requests = 40, warmup = 4, seed = 0)
+    return argparse.Namespace(**{**defaults, **kwargs})
+
+def test_percentile():
+    values = [float(i) for i in range(101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([], 99) == 0.0
+    assert percentile([3.0], 50) == 3.0
+
+def test_summarize():
+    summary = summarize(4, [0.003, 0.001, 0.002], 1, 2.0)
+    assert summary['requests'] == 4 and summary['errors'] == 1
+    assert summary['qps'] == 2.0
+    assert summary['p50_ms'] == pytest.approx(2) and summary['max_ms'] == pytest.approx(3)
+    assert summary['mean_ms'] == pytest.approx(2)
+
+def test_regressions():
+    baseline = {'results': [summarize(1, [0.001] * 10, 0, 1.0), summarize(4, [0.002] * 10, 0, 1.0)]}
+    assert regressions(baseline['results'], baseline, 0.1) == []
+    slower = [summarize(1, [0.0015] * 10, 0, 1.2), summarize(4, [0.002] * 10, 1, 1.0), summarize(16, [1.0] * 10, 0, 1.0)]
+    found = regressions(slower, baseline, 0.1)
+    assert len(found) == 3
+    assert found[0].startswith('concurrency 1: qps') and found[1].startswith('concurrency 1: p99')
+    assert found[2] == 'concurrency 4: 1 errors, baseline had 0'
+
+def test_sample_games():
+    games = sample_games(args())
+    assert len(games) == 50 and games == sample_games(args())
+    assert all(white != black and white in MockSkill.players and (min, inc) in [(1, 0), (3, 0), (5, 0), (10, 0), (15, 10)]
+               for white, black, min, inc in games)
+
+def test_model_target():
+    games = [("John", "Alice", 5, 0), ("John", "Nobody", 5, 0)]
+    result = run_model_level(MockSkill(), games, 2, 10, 2)
+    assert (result['concurrency'], result['requests'], result['errors']) == (2, 10, 5)
+
+def test_app_target(api):
+    results = run(args())
+    assert [level['concurrency'] for level in results] == [1, 4]
+    assert all(level['requests'] == 40 and level['errors'] == 0 and level['qps'] > 0 for level in results)
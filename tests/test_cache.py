@@ -0,0 +1,37 @@
+from app.backend.cache import PredictionCache
+
+def test_hits_and_tags():
+    cache = PredictionCache()
+    assert cache.get("a", (0, 0, 0)) is None
+    cache.put("a", (0, 0, 0), 1)
+    assert cache.get("a", (0, 0, 0)) == 1
+    # computed from another model state
+    assert cache.get("a", (0, 1, 0)) is None
+    assert cache.get("a", (0, 0, 0)) is None
+    assert cache.stats() == {
+        'size': 0, 'max_size': 100000, 'hits': 1, 'misses': 3, 'hit_rate': 0.25,
+        'invalidations': 1, 'expirations': 0, 'evictions': 0,
+    }
+
+def test_ttl():
+    cache = PredictionCache(ttl = -1)
+    cache.put("a", 0, 1)
+    assert cache.get("a", 0) is None
+    assert cache.stats()['expirations'] == 1
+    assert len(cache) == 0
+
+def test_lru_eviction():
+    cache = PredictionCache(max_size = 2)
+    cache.put("a", 0, 1)
+    cache.put("b", 0, 2)
+    cache.get("a", 0)
+    cache.put("c", 0, 3)
+    assert cache.get("b", 0) is None
+    assert cache.get("a", 0) == 1 and cache.get("c", 0) == 3
+    assert cache.stats()['evictions'] == 1
+
+def test_disabled():
+    cache = PredictionCache(max_size = 0)
+    cache.put("a", 0, 1)
+    assert cache.get("a", 0) is None
+    assert len(cache) == 0
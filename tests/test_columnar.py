@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import columnar
+from conftest import games_frame
+from csv_to_input import EDGE_DTYPES, prepare_input
+from tgl.utils import load_edges
+
+def test_round_trip(tmp_path):
+    df = games_frame(200, 10)
+    df["Moves"] = np.arange(len(df), dtype = np.int64)
+    columnar.write_table(tmp_path / "games.cols", df, {"Moves": np.int16})
+    table = columnar.read_table(tmp_path / "games.cols")
+    assert list(table.columns) == list(df.columns)
+    assert table["Moves"].dtype == np.int16
+    assert isinstance(table["White"].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(table.astype({"Moves": np.int64}).astype({name: str for name in df if name != "Moves"}), df)
+    subset = columnar.read_table(tmp_path / "games.cols", columns = ["Result", "White"])
+    assert list(subset.columns) == ["Result", "White"]
+
+@pytest.mark.filterwarnings("error::FutureWarning")
+def test_string_columns_of_any_kind(tmp_path):
+    names = ["b", "a", "b", "ł"]
+    columnar.write_table(tmp_path / "t.cols", {
+        "list": names,
+        "series": pd.Series(names),
+        "strings": pd.Series(names, dtype = "string"),
+        "category": pd.Series(names, dtype = "category"),
+    })
+    table = columnar.read_table(tmp_path / "t.cols")
+    assert all(table[name].astype(str).tolist() == names for name in table)
+
+def test_narrow_refuses_overflow(tmp_path):
+    with pytest.raises(ValueError):
+        columnar.write_table(tmp_path / "t.cols", {"x": np.array([1, 1 << 40])}, {"x": np.int32})
+    assert not columnar.exists(tmp_path / "t.cols")
+
+def test_csv_to_table(tmp_path):
+    path = tmp_path / "games.csv"
+    games_frame(100, 10).to_csv(path, index = False)
+    assert columnar.csv_to_table(path) == str(tmp_path / "games.cols")
+    pd.testing.assert_frame_equal(columnar.read_table(tmp_path / "games.cols").astype(str),
+                                  pd.read_csv(path, keep_default_na = False).astype(str))
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = tmp_path / "games.csv"
+    games_frame(300, 20).to_csv(path, index = False)
+    data = tmp_path / "DATA"
+    data.mkdir()
+    prepare_input(path, data)
+    return data
+
+def test_load_edges_reads_the_table(dataset):
+    edges = load_edges(str(dataset))
+    assert all(edges[name].dtype == dtype for name, dtype in EDGE_DTYPES.items())
+    pd.testing.assert_frame_equal(edges.astype(np.int64), pd.read_csv(dataset / "edges.csv"))
+
+def test_load_edges_ids_index_tensors(dataset):
+    # torch only indexes with int64
+    assert load_edges(str(dataset))["Unnamed: 0"].dtype == np.int64
+    table = columnar.read_table(dataset / "edges.cols")
+    columnar.write_table(dataset / "edges.cols", table, {"Unnamed: 0": np.int32}, dataset / "edges.csv")
+    assert columnar.read_table(dataset / "edges.cols")["Unnamed: 0"].dtype == np.int32
+    assert load_edges(str(dataset))["Unnamed: 0"].dtype == np.int64
+
+def test_load_edges_skips_stale_table(dataset):
+    edges = pd.read_csv(dataset / "edges.csv")
+    edges["src"], edges["dst"] = edges["dst"].values, edges["src"].values
+    edges.drop(columns = "Unnamed: 0").to_csv(dataset / "edges.csv")
+    pd.testing.assert_frame_equal(load_edges(str(dataset)), edges)
+
+def test_fresh_without_source_stamp(tmp_path):
+    csv = tmp_path / "edges.csv"
+    pd.DataFrame({"x": [1, 2]}).to_csv(csv, index = False)
+    columnar.write_table(tmp_path / "edges.cols", {"x": np.array([1, 2])})
+    assert columnar.fresh(tmp_path / "edges.cols", csv)
+    later = os.path.getmtime(tmp_path / "edges.cols" / columnar.META) + 10
+    os.utime(csv, (later, later))
+    assert not columnar.fresh(tmp_path / "edges.cols", csv)
+    # a table without its csv is all there is
+    os.remove(csv)
+    assert columnar.fresh(tmp_path / "edges.cols", csv)
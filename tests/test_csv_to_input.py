@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+
+import columnar
+from conftest import games_frame
+from csv_to_input import prepare_input, prepare_input_chunked
+
+def prepare_both(tmp_path, games, chunk_size):
+    """Outputs of prepare_input and prepare_input_chunked over the same games."""
+    path = tmp_path / "games.csv"
+    games.to_csv(path, index = False)
+    outputs = []
+    for name, prepare in (("whole", prepare_input), ("chunked", lambda file, out: prepare_input_chunked(file, out, chunk_size))):
+        out = tmp_path / name
+        out.mkdir()
+        prepare(path, out)
+        outputs.append({
+            "edges": pd.read_csv(out / "edges.csv"),
+            "table": columnar.read_table(out / "edges.cols"),
+            "feats": torch.load(out / "edge_features.pt"),
+        })
+    return outputs
+
+def unique_times(games):
+    # the chunked sort orders games of the same second differently
+    return games.drop_duplicates(["UTCDate", "UTCTime"])
+
+@pytest.mark.parametrize("results, width", [
+    (["1-0", "0-1", "1/2-1/2"], 7),
+    (["1-0", "0-1"], 6),
+    (["1-0"], 5),
+])
+def test_chunked_matches_whole(tmp_path, results, width):
+    games = unique_times(games_frame(3000, 80))
+    games = games[games["Result"].isin(results + ["*"])]
+    whole, chunked = prepare_both(tmp_path, games, 200)
+    pd.testing.assert_frame_equal(whole["edges"], chunked["edges"])
+    pd.testing.assert_frame_equal(whole["table"], chunked["table"])
+    assert whole["feats"].shape == (len(whole["edges"]), width)
+    assert torch.equal(whole["feats"], chunked["feats"])
+
+def test_chunked_ties(tmp_path):
+    # games of the same second, and so the players' first appearances, may
+    # come in another order; the times and the multiset of features may not
+    whole, chunked = prepare_both(tmp_path, games_frame(3000, 80), 200)
+    for column in ("time", "ext_roll"):
+        assert np.array_equal(whole["edges"][column], chunked["edges"][column])
+    assert whole["feats"].shape == chunked["feats"].shape
+    def rows(feats):
+        return feats.numpy()[np.lexsort(feats.numpy().T)]
+    assert np.array_equal(rows(whole["feats"]), rows(chunked["feats"]))
+
+def test_single_chunk_is_prepare_input(tmp_path):
+    whole, chunked = prepare_both(tmp_path, games_frame(300, 20), 1000)
+    pd.testing.assert_frame_equal(whole["edges"], chunked["edges"])
+    assert torch.equal(whole["feats"], chunked["feats"])
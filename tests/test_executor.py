@@ -0,0 +1,76 @@
+import asyncio
+import functools
+import threading
+import time
+
+from app.backend.executor import InferenceExecutor, Overloaded
+from app.backend.model.mock import MockSkill
+from app.backend.registry import ModelRegistry
+
+class SlowSkill(MockSkill):
+    """MockSkill whose predictions block for a while, like a model call."""
+
+    def __init__(self, seconds = 0.1):
+        super().__init__()
+        self.seconds = seconds
+        self.threads = set()
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def predict(self, white, black, tc):
+        with self._lock:
+            self.threads.add(threading.get_ident())
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.seconds)
+        with self._lock:
+            self.running -= 1
+        return super().predict(white, black, tc)
+
+def test_calls_run_off_the_event_loop():
+    skill = SlowSkill()
+    executor = InferenceExecutor(lambda: skill, threads = 2)
+
+    async def main():
+        ticks = 0
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+        ticker = asyncio.create_task(tick())
+        results = await asyncio.gather(*(executor.call('predict', "John", "Alice", (5, 0)) for _ in range(4)))
+        ticker.cancel()
+        return results, ticks
+
+    results, ticks = asyncio.run(main())
+    executor.shutdown()
+    assert results == [MockSkill().predict("John", "Alice", (5, 0))] * 4
+    # the loop kept running while the predictions blocked their threads
+    assert ticks >= 5
+    assert threading.get_ident() not in skill.threads
+    assert skill.max_running == 2
+    assert executor.pending == 0
+
+def test_backlog_is_bounded():
+    skill = SlowSkill()
+    executor = InferenceExecutor(lambda: skill, threads = 1, max_pending = 2)
+
+    async def main():
+        return await asyncio.gather(*(executor.call('predict', "John", "Alice", (5, 0)) for _ in range(3)), return_exceptions = True)
+
+    results = asyncio.run(main())
+    executor.shutdown()
+    assert [isinstance(result, Overloaded) for result in results] == [False, False, True]
+    assert skill.max_running == 1
+
+def test_processes():
+    executor = InferenceExecutor(functools.partial(ModelRegistry.from_config, None, MockSkill), processes = 1)
+    try:
+        assert executor.skill_system is None
+        result = asyncio.run(executor.call('route', None, 'predict', "John", "Alice", (5, 0)))
+        assert result == MockSkill().predict("John", "Alice", (5, 0))
+        assert asyncio.run(executor.call('route', None, 'search_players', "b", 10)) == ["Bobby"]
+    finally:
+        executor.shutdown()
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tgl.gen_graph import build_csr, build_csr_legacy, same_up_to_ties
+
+def edges(num_edges, num_nodes, seed = 0):
+    """Time-ordered edges, some of them simultaneous, between the first
+    `num_nodes - 1` nodes so that the last one has none."""
+    rng = np.random.default_rng(seed)
+    src = rng.integers(0, num_nodes - 1, num_edges)
+    dst = (src + rng.integers(1, num_nodes - 1, num_edges)) % (num_nodes - 1)
+    return pd.DataFrame({"src": src, "dst": dst, "time": np.cumsum(rng.integers(0, 3, num_edges))})
+
+@pytest.mark.parametrize("add_reverse", [False, True])
+def test_build_csr_without_ties(add_reverse):
+    df = edges(300, 30)
+    df["time"] = np.arange(len(df)) * 7
+    graph = build_csr(df["src"].values, df["dst"].values, df["time"].values, 31, add_reverse)
+    legacy = build_csr_legacy(df, 31, add_reverse)
+    assert all(np.array_equal(x, y) for x, y in zip(graph, legacy))
+    indptr, indices, ts, eid = graph
+    assert indptr[-1] == len(df) * (2 if add_reverse else 1) and indptr[-2] == indptr[-1]
+
+@pytest.mark.parametrize("add_reverse", [False, True])
+def test_build_csr_with_ties(add_reverse):
+    # hubs with many simultaneous games, which the per-node argsort reorders
+    df = edges(5000, 12, seed = 1)
+    graph = build_csr(df["src"].values, df["dst"].values, df["time"].values, 13, add_reverse)
+    legacy = build_csr_legacy(df, 13, add_reverse)
+    assert same_up_to_ties(graph, legacy)
+    indptr, indices, ts, eid = graph
+    for node in range(12):
+        neighbors = slice(indptr[node], indptr[node + 1])
+        assert np.all(np.diff(ts[neighbors]) >= 0)
+        # ties keep the input order
+        assert np.all(np.diff(eid[neighbors])[np.diff(ts[neighbors]) == 0] >= 0)
+
+def test_same_up_to_ties():
+    df = edges(500, 10, seed = 2)
+    graph = build_csr(df["src"].values, df["dst"].values, df["time"].values, 10)
+    assert same_up_to_ties(graph, graph)
+    indptr, indices, ts, eid = graph
+    swapped = eid.copy()
+    # two entries of a node at different times
+    node = np.argmax(np.diff(indptr))
+    first = indptr[node]
+    second = first + np.argmax(ts[first:indptr[node + 1]] > ts[first])
+    swapped[[first, second]] = swapped[[second, first]]
+    assert not same_up_to_ties(graph, (indptr, indices, ts, swapped))
+    assert not same_up_to_ties(graph, (indptr, indices, ts + 1, eid))
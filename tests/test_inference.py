@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+import torch
+
+from tgl.inference import export_model, quantizable_layers
+from tgl.model import TemporalGraphModel
+
+def predictions(model, pairs = 200, seed = 0):
+    rng = np.random.default_rng(seed)
+    white = rng.integers(0, model.num_nodes, pairs)
+    black = rng.integers(0, model.num_nodes, pairs)
+    time_controls = rng.choice([1, 5, 10, 30], pairs)
+    return np.array(model.get_predictions(white, black, [(tc, 0) for tc in time_controls]))
+
+@pytest.fixture
+def eager(tgl_dataset):
+    model = TemporalGraphModel(tgl_dataset["data"], tgl_dataset["config"], tgl_dataset["stored_model"],
+                               supervised = True, device = "cpu", num_threads = 2)
+    model.materialize_embeddings()
+    return model
+
+@pytest.mark.parametrize("quantize, script, atol", [
+    (False, True, 1e-5),
+    (True, False, 0.05),
+    (True, True, 0.05),
+])
+def test_export_matches_eager(tgl_model, eager, quantize, script, atol):
+    parity = tgl_model.export_for_inference(quantize = quantize, script = script, atol = atol)
+    assert parity['probability_max_abs_diff'] <= atol
+    assert tgl_model.float_model is not None
+    if script:
+        assert isinstance(tgl_model.model.edge_classifier, torch.jit.ScriptModule)
+    tgl_model.materialize_embeddings()
+    assert np.abs(predictions(tgl_model) - predictions(eager)).max() <= atol
+
+def test_quantize_replaces_dense_layers(tgl_model):
+    exported = export_model(tgl_model.model, quantize = True, script = False)
+    modules = dict(exported.named_modules())
+    for name in quantizable_layers(tgl_model.model):
+        assert type(modules[name]).__module__.startswith('torch.ao.nn.quantized')
+    # the original is left alone
+    assert all(type(module).__module__.startswith('torch.nn') for name, module in tgl_model.model.named_modules()
+               if name in quantizable_layers(tgl_model.model))
+
+def test_export_off_by_too_much_keeps_fp32(tgl_model):
+    reference = tgl_model.model
+    with pytest.raises(ValueError):
+        tgl_model.export_for_inference(quantize = True, script = False, atol = 0)
+    assert tgl_model.model is reference
+    assert tgl_model.float_model is None
+
+def test_snapshot_keeps_fp32_weights(tgl_model, eager, tmp_path):
+    tgl_model.export_for_inference()
+    tgl_model.snapshot(str(tmp_path / "snapshot"))
+    restored = TemporalGraphModel.restore(str(tmp_path / "snapshot"), device = "cpu", num_threads = 2)
+    for name, tensor in eager.model.state_dict().items():
+        assert torch.equal(restored.model.state_dict()[name], tensor), name
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+import torch
+
+from app.backend.leaderboard import Leaderboard, to_rating
+
+def test_to_rating():
+    assert to_rating(0.5) == 1500
+    assert to_rating(10 / 11) == pytest.approx(1900)
+    ratings = to_rating(np.array([0.0, 0.25, 0.75, 1.0]))
+    assert np.all(np.isfinite(ratings)) and np.all(np.diff(ratings) > 0)
+
+@pytest.fixture
+def model(tgl_model):
+    tgl_model.materialize_embeddings()
+    return tgl_model
+
+def test_ranks_every_player(model):
+    leaderboard = Leaderboard(model, (5, 0), panel_size = 16)
+    page = leaderboard.page(0, 10)
+    assert len(leaderboard) == model.num_nodes
+    assert len(leaderboard.panel) == 16
+    assert np.all(np.diff(model.g['indptr'])[leaderboard.panel] >= 10)
+    scores = model.expected_scores(np.arange(model.num_nodes), model.node_embs[torch.from_numpy(leaderboard.panel)], (5, 0))
+    assert np.allclose(leaderboard.ratings, to_rating(scores), atol = 1e-3)
+    assert [rank for rank, _, _ in page] == list(range(1, 11))
+    assert [node for _, node, _ in page] == list(np.argsort(-leaderboard.ratings, kind = 'stable')[:10])
+    ratings = [rating for _, _, rating in leaderboard.page(0, model.num_nodes)]
+    assert ratings == sorted(ratings, reverse = True)
+    assert leaderboard.page(model.num_nodes - 2, 10)[-1][0] == model.num_nodes
+    assert leaderboard.stats() == {'players': model.num_nodes, 'panel_size': 16, 'rebuilds': 1, 'rescored': model.num_nodes}
+
+def test_refresh_rescores_updated_players(model):
+    leaderboard = Leaderboard(model, (5, 0), panel_size = 16)
+    leaderboard.refresh()
+    leaderboard.refresh()
+    assert leaderboard.rescored == model.num_nodes
+    feats = torch.zeros((2, model.edge_feats.shape[1]), dtype = model.edge_feats.dtype)
+    model.add_edges([0, 1], [2, model.num_nodes], [model.latest_ts] * 2, feats)
+    leaderboard.refresh()
+    # the three players of the games and the new one
+    assert leaderboard.rescored == model.num_nodes - 1 + 4
+    assert leaderboard.rebuilds == 1
+    assert len(leaderboard) == model.num_nodes
+    scores = model.expected_scores(np.arange(model.num_nodes), leaderboard._panel_embs, (5, 0))
+    assert np.allclose(leaderboard.ratings, to_rating(scores), atol = 1e-3)
+    model.materialize_embeddings()
+    leaderboard.refresh()
+    assert leaderboard.rebuilds == 2
@@ -0,0 +1,44 @@
+from prometheus_client import REGISTRY
+
+from app.backend.metrics import observe_stage
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+def test_observe_stage():
+    count = sample('deepskill_stage_seconds_count', stage = 'test_stage')
+    sampler = sample('deepskill_sampler_seconds_total', phase = 'search')
+    observe_stage('test_stage', 0.002)
+    observe_stage('sampler_search', 0.5)
+    assert sample('deepskill_stage_seconds_count', stage = 'test_stage') == count + 1
+    assert sample('deepskill_stage_seconds_bucket', stage = 'test_stage', le = '0.0025') >= 1
+    assert sample('deepskill_sampler_seconds_total', phase = 'search') == sampler + 0.5
+    # sampler phases do not make stage series
+    assert REGISTRY.get_sample_value('deepskill_stage_seconds_count', {'stage': 'sampler_search'}) is None
+
+def test_model_stages(tgl_model):
+    stages = []
+    tgl_model.stage_hook = lambda stage, seconds: stages.append((stage, seconds))
+    tgl_model.get_predictions([0], [1], [(5, 0)])
+    names = {stage for stage, _ in stages}
+    assert {'replay', 'sample', 'forward', 'memory_update', 'to_dgl_blocks', 'classify_edge', 'sampler_tot'} <= names
+    assert all(seconds >= 0 for _, seconds in stages)
+    tgl_model.materialize_embeddings()
+    stages.clear()
+    tgl_model.get_predictions([0], [1], [(5, 0)])
+    assert [stage for stage, _ in stages] == ['embedding_lookup', 'classify_edge']
+
+def test_metrics_endpoint(client):
+    client.get("/predict", params = {"white": "John", "black": "Alice"})
+    client.get("/predict", params = {"white": "John", "black": "Nobody"})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'deepskill_request_seconds_count{method="GET",route="/predict",status="200"}' in body
+    assert 'deepskill_request_seconds_count{method="GET",route="/predict",status="400"}' in body
+    assert 'deepskill_batch_size_count' in body
+    assert 'deepskill_batcher_queue_depth 0.0' in body
+    # unknown paths share one series
+    client.get("/nowhere")
+    assert 'route="other"' in client.get("/metrics").text
@@ -0,0 +1,188 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+
+from tgl.gen_graph import build_csr
+from tgl.utils import resolve_device
+
+def new_games(model, num_games, seed = 0):
+    """Games after the last one in the graph, between known players and a new one."""
+    rng = np.random.default_rng(seed)
+    src = rng.integers(0, model.num_nodes + 1, num_games)
+    dst = (src + rng.integers(1, model.num_nodes, num_games)) % (model.num_nodes + 1)
+    time = model.latest_ts + np.sort(rng.integers(0, 100, num_games))
+    feats = torch.zeros((num_games, model.edge_feats.shape[1]), dtype = model.edge_feats.dtype)
+    feats[:, 0] = 1
+    return src, dst, time, feats
+
+def record_grad_mode(model, monkeypatch):
+    """Whether autograd was on, for every classify_edge call of `model`."""
+    modes = []
+    classify_edge = model.model.classify_edge
+    def recording(*args):
+        modes.append(torch.is_grad_enabled())
+        return classify_edge(*args)
+    monkeypatch.setattr(model.model, "classify_edge", recording)
+    return modes
+
+def test_add_edges(tgl_model):
+    df = tgl_model.df.copy()
+    num_nodes = tgl_model.num_nodes
+    tgl_model.materialize_embeddings()
+    before = tgl_model.node_embs.clone()
+    src, dst, time, feats = new_games(tgl_model, 300)
+    tgl_model.add_edges(src, dst, time, feats)
+
+    assert tgl_model.num_nodes == num_nodes + 1
+    assert tgl_model.num_edges == len(df) + 300
+    assert tgl_model.latest_ts == time[-1]
+    assert torch.equal(tgl_model.edge_feats[len(df):], feats)
+    # the sampler's graph is the one gen_graph builds over all the edges
+    rebuilt = build_csr(np.concatenate([df.src, src]), np.concatenate([df.dst, dst]),
+                        np.concatenate([df.time, time]), num_nodes + 1)
+    graph = tgl_model._current_graph()
+    for key, arr in zip(('indptr', 'indices', 'ts', 'eid'), rebuilt):
+        assert np.array_equal(graph[key], arr), key
+    # the embeddings of the players of the new games were refreshed
+    touched = np.unique(np.concatenate([src, dst]))
+    touched = touched[touched < num_nodes]
+    assert not torch.equal(tgl_model.node_embs[touched], before[touched])
+    assert all(tgl_model.node_version[touched] > 0)
+
+def test_add_edges_refuses_older_edges(tgl_model):
+    src, dst, time, feats = new_games(tgl_model, 10)
+    with pytest.raises(ValueError):
+        tgl_model.add_edges(src, dst, time - tgl_model.latest_ts - 1, feats)
+    assert tgl_model.num_edges == len(tgl_model.df)
+
+def test_reference_panel_sees_added_edges(tgl_model):
+    degree = np.diff(tgl_model.g['indptr'])
+    node = int(np.argmin(degree))
+    min_degree = int(degree.max()) + 1
+    time = np.repeat(tgl_model.latest_ts, min_degree)
+    feats = torch.zeros((min_degree, tgl_model.edge_feats.shape[1]), dtype = tgl_model.edge_feats.dtype)
+    tgl_model.add_edges(np.repeat(node, min_degree), (node + 1 + np.arange(min_degree)) % tgl_model.num_nodes, time, feats)
+    assert tgl_model.reference_panel(1, min_degree).tolist() == [node]
+
+def test_memory_usage_counts_added_edges(tgl_model):
+    src, dst, time, feats = new_games(tgl_model, 300)
+    tgl_model.add_edges(src[:1], dst[:1], time[:1], feats[:1])
+    before = tgl_model.memory_usage()
+    entries = len(tgl_model._current_graph()['indices'])
+    tgl_model.add_edges(src[1:], dst[1:], time[1:], feats[1:])
+    graph = tgl_model._current_graph()
+    assert len(graph['indices']) == entries + 299
+    # indices, eid and ts of every new entry, on top of the grown edge feature buffer
+    entry = sum(graph[key].itemsize for key in ('indices', 'eid', 'ts'))
+    assert tgl_model.memory_usage() - before >= 299 * entry
+
+def test_resolve_device():
+    assert resolve_device('cpu') == torch.device('cpu')
+    assert resolve_device('auto').type == ('cuda' if torch.cuda.is_available() else 'cpu')
+
+def test_cpu_model(tgl_model):
+    assert tgl_model.device.type == 'cpu'
+    assert torch.get_num_threads() == 2
+    assert all(param.device.type == 'cpu' for param in tgl_model.model.parameters())
+    assert tgl_model.mailbox.node_memory.device.type == 'cpu'
+    # without an embedding table predictions go through the sampled forward pass
+    assert tgl_model.node_embs is None
+    prediction = tgl_model.get_prediction(0, 1, (5, 0))
+    assert len(prediction) == 3 and sum(prediction) == pytest.approx(1, abs = 1e-5)
+    assert tgl_model.processed_edge_id >= len(tgl_model.df)
+
+def test_embedding_table_matches_forward_pass(tgl_model, tmp_path, monkeypatch):
+    white, black = np.arange(0, 40), np.arange(40, 80)
+    time_controls = [(5, 0)] * 40
+    modes = record_grad_mode(tgl_model, monkeypatch)
+    sampled = np.array(tgl_model.get_predictions(white, black, time_controls))
+    tgl_model.materialize_embeddings(batch_size = 50, path = str(tmp_path / "embs.npy"))
+    assert tgl_model.node_embs.shape == (tgl_model.num_nodes, tgl_model.gnn_param['dim_out'])
+    assert np.allclose(np.array(tgl_model.get_predictions(white, black, time_controls)), sampled, atol = 1e-5)
+    # both paths classify without building an autograd graph
+    assert len(modes) == 2 and not any(modes)
+    epoch = tgl_model.state_epoch
+    table = tgl_model.node_embs.clone()
+    tgl_model.load_embeddings(str(tmp_path / "embs.npy"))
+    assert torch.equal(tgl_model.node_embs, table)
+    assert tgl_model.state_epoch == epoch + 1
+
+def test_materialize_replaces_the_embeddings_file(tgl_model, tmp_path):
+    path = str(tmp_path / "embs.npy")
+    tgl_model.materialize_embeddings(path = path)
+    # another process serving from the file
+    mapped = np.load(path, mmap_mode = 'r')
+    before = np.array(mapped)
+    tgl_model.add_edges(*new_games(tgl_model, 50))
+    assert not np.array_equal(tgl_model.node_embs[:len(before)].numpy(), before)
+    assert np.array_equal(np.load(path), before)
+    tgl_model.materialize_embeddings(path = path)
+    assert np.array_equal(mapped, before)
+    assert np.array_equal(np.load(path), tgl_model.node_embs.numpy())
+    assert os.listdir(tmp_path) == ["embs.npy"]
+
+def restored(model, path):
+    from tgl.model import TemporalGraphModel
+    model.snapshot(str(path))
+    return TemporalGraphModel.restore(str(path), device = "cpu", num_threads = 2)
+
+def test_snapshot_restore(tgl_model, tmp_path):
+    tgl_model.materialize_embeddings()
+    src, dst, time, feats = new_games(tgl_model, 100)
+    tgl_model.add_edges(src[:50], dst[:50], time[:50], feats[:50])
+    copy = restored(tgl_model, tmp_path / "snapshot")
+    assert not os.path.exists(str(tmp_path / "snapshot") + ".tmp")
+
+    assert (copy.num_nodes, copy.num_edges, copy.latest_ts) == (tgl_model.num_nodes, tgl_model.num_edges, tgl_model.latest_ts)
+    assert copy.processed_edge_id == tgl_model.processed_edge_id
+    pd.testing.assert_frame_equal(copy.df, tgl_model.df, check_dtype = False)
+    assert torch.equal(copy.node_embs, tgl_model.node_embs)
+    assert torch.equal(copy.edge_feats, tgl_model.edge_feats)
+    assert torch.equal(copy.mailbox.node_memory, tgl_model.mailbox.node_memory)
+    for key, arr in copy._current_graph().items():
+        assert np.array_equal(arr, tgl_model._current_graph()[key]), key
+
+    # both go on the same way from there
+    for model in (tgl_model, copy):
+        model.add_edges(src[50:], dst[50:], time[50:], feats[50:])
+    white, black = np.arange(0, 60), np.arange(60, 120)
+    assert np.allclose(copy.get_predictions(white, black, [(5, 0)] * 60),
+                       tgl_model.get_predictions(white, black, [(5, 0)] * 60), atol = 1e-6)
+    assert torch.equal(copy.mailbox.node_memory, tgl_model.mailbox.node_memory)
+
+def test_restore_refuses_other_formats(tgl_model, tmp_path):
+    from tgl.model import TemporalGraphModel
+    tgl_model.snapshot(str(tmp_path / "snapshot"))
+    with open(tmp_path / "snapshot" / "manifest.json") as f:
+        manifest = json.load(f)
+    manifest['format'] += 1
+    with open(tmp_path / "snapshot" / "manifest.json", "w") as f:
+        json.dump(manifest, f)
+    with pytest.raises(ValueError):
+        TemporalGraphModel.restore(str(tmp_path / "snapshot"))
+
+def test_find_opponents(tgl_model, monkeypatch):
+    tgl_model.materialize_embeddings()
+    modes = record_grad_mode(tgl_model, monkeypatch)
+    nodes, imbalance, as_white, as_black = tgl_model.find_opponents(3, 10, (5, 0))
+    assert modes and not any(modes)
+    assert len(nodes) == 10 and 3 not in nodes
+    assert imbalance == sorted(imbalance)
+    white, black = tgl_model.get_predictions([3] * 10, nodes, [(5, 0)] * 10), tgl_model.get_predictions(nodes, [3] * 10, [(5, 0)] * 10)
+    assert np.allclose(as_white, white, atol = 1e-6) and np.allclose(as_black, black, atol = 1e-6)
+    expected = [(abs(w[0] - w[1]) + abs(b[0] - b[1])) / 2 for w, b in zip(white, black)]
+    assert np.allclose(imbalance, expected, atol = 1e-6)
+
+    # with every node a candidate the index gives the exact answer
+    tgl_model.build_ann_index(num_lists = 8)
+    assert tgl_model.find_opponents(3, 10, (5, 0), num_candidates = tgl_model.num_nodes, num_probes = 8)[0] == nodes
+    # nodes added after the index was built are still candidates
+    src, dst, time, feats = new_games(tgl_model, 20)
+    tgl_model.add_edges(src, dst, time, feats)
+    assert tgl_model.ann_index_size == tgl_model.num_nodes - 1
+    candidates = tgl_model.find_opponents(3, 100, (5, 0), num_candidates = 1)[0]
+    assert len(candidates) <= 2 and tgl_model.num_nodes - 1 in candidates
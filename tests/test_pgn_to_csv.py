@@ -0,0 +1,58 @@
+import csv
+import multiprocessing
+
+import pytest
+
+zstandard = pytest.importorskip("zstandard")
+from utils.pgn_to_csv import FIELDNAMES, convert_chunk, convert_file, read_chunks
+
+def pgn_games(num_games):
+    """PGN text of `num_games` games, with a quoted name and a missing tag,
+    and the headers each game should produce."""
+    text, rows = [], []
+    for i in range(num_games):
+        row = {
+            "Event": 'Rated Blitz game "arena"' if i % 7 == 3 else "Rated Blitz game",
+            "Site": "https://lichess.org/{:08d}".format(i),
+            "White": "white{}".format(i),
+            "Black": "blåck{}".format(i % 5),
+            "Result": ["1-0", "0-1", "1/2-1/2"][i % 3],
+            "UTCDate": "2013.06.01",
+            "UTCTime": "00:00:{:02d}".format(i % 60),
+            "WhiteElo": str(1500 + i),
+            "BlackElo": "?",
+            "TimeControl": "300+0",
+            "Termination": "Normal",
+        }
+        if i % 4 == 0:
+            del row["Termination"]
+        for key, value in row.items():
+            text.append('[{} "{}"]\n'.format(key, value.replace('\\', '\\\\').replace('"', '\\"')))
+        text.append("\n1. e4 e5 2. Nf3 {{ [%clk 0:05:00] }} Nc6 {} \n\n".format(row["Result"]))
+        rows.append([row.get(name, "") for name in FIELDNAMES])
+    return "".join(text).encode(), rows
+
+def test_convert_chunk():
+    pgn, rows = pgn_games(20)
+    assert list(csv.reader(convert_chunk(pgn).splitlines())) == rows
+
+@pytest.mark.parametrize("chunk_size", [1, 100, 1000, 1 << 20])
+def test_read_chunks(chunk_size):
+    import io
+    pgn, rows = pgn_games(30)
+    chunks = list(read_chunks(io.BytesIO(pgn), chunk_size))
+    assert b"".join(chunks) == pgn
+    assert all(chunk.startswith(b"[Event ") for chunk in chunks)
+    converted = [row for chunk in chunks for row in csv.reader(convert_chunk(chunk).splitlines())]
+    assert converted == rows
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_convert_file(tmp_path, compress):
+    pgn, rows = pgn_games(50)
+    path = tmp_path / ("games.pgn.zst" if compress else "games.pgn")
+    path.write_bytes(zstandard.ZstdCompressor().compress(pgn) if compress else pgn)
+    with multiprocessing.Pool(2) as pool:
+        for options in [{}, {"pool": pool, "max_pending": 2}]:
+            convert_file(str(path), tmp_path / "games.csv", 300, **options)
+            with open(tmp_path / "games.csv", newline = "") as f:
+                assert list(csv.reader(f)) == [FIELDNAMES] + rows
@@ -0,0 +1,94 @@
+from pathlib import Path
+
+import pytest
+
+import columnar
+from pipeline import PLAYER_DICT, Stage, build_table, month_stages, run_stages
+
+def shout(src, dst):
+    Path(dst).write_text(Path(src).read_text().upper())
+
+def count(src, dst):
+    Path(dst).write_text(str(len(Path(src).read_text())))
+
+def broken(src, dst):
+    raise RuntimeError("broken stage")
+
+def stages(tmp_path, first = shout):
+    src, loud, length = tmp_path / "src.txt", tmp_path / "loud.txt", tmp_path / "length.txt"
+    return [
+        Stage("loud", "table", first, (src, loud), [src], [loud]),
+        Stage("length", "table", count, (loud, length), [loud], [length], deps = ["loud"]),
+    ]
+
+def ran(capsys):
+    return sorted(line.split(":")[0] for line in capsys.readouterr().out.splitlines() if line.endswith(": done"))
+
+def test_run_stages(tmp_path, capsys):
+    state = tmp_path / "state.json"
+    (tmp_path / "src.txt").write_text("abc")
+    assert run_stages(stages(tmp_path), state, 2) == set()
+    assert ran(capsys) == ["length", "loud"]
+    assert (tmp_path / "length.txt").read_text() == "3"
+
+    # nothing changed
+    assert run_stages(stages(tmp_path), state, 2) == set()
+    assert ran(capsys) == []
+
+    # same output, so the stage after it stays
+    (tmp_path / "src.txt").write_text("ABC")
+    run_stages(stages(tmp_path), state, 2)
+    assert ran(capsys) == ["loud"]
+
+    (tmp_path / "src.txt").write_text("abcd")
+    run_stages(stages(tmp_path), state, 2)
+    assert ran(capsys) == ["length", "loud"]
+    assert (tmp_path / "length.txt").read_text() == "4"
+
+    # an output that no longer holds what the last run wrote
+    (tmp_path / "length.txt").write_text("0")
+    run_stages(stages(tmp_path), state, 2)
+    assert ran(capsys) == ["length"]
+
+    run_stages(stages(tmp_path), state, 2, force = True)
+    assert ran(capsys) == ["length", "loud"]
+
+def test_failures(tmp_path, capsys):
+    state = tmp_path / "state.json"
+    (tmp_path / "src.txt").write_text("abc")
+    assert run_stages(stages(tmp_path, broken), state, 2) == {"loud", "length"}
+    assert "length: skipped, a dependency failed" in capsys.readouterr().out
+    # a failed stage runs again next time
+    assert run_stages(stages(tmp_path), state, 2) == set()
+    assert ran(capsys) == ["length", "loud"]
+
+    (tmp_path / "src.txt").unlink()
+    assert run_stages(stages(tmp_path), state, 2) == {"loud", "length"}
+    assert "loud: missing" in capsys.readouterr().out
+
+    orphan = Stage("orphan", "table", count, (tmp_path / "loud.txt", tmp_path / "orphan.txt"),
+                   [tmp_path / "loud.txt"], [tmp_path / "orphan.txt"], deps = ["nowhere"])
+    assert run_stages([orphan], state, 2) == {"orphan"}
+
+def test_build_table(tmp_path, write_games, capsys):
+    games = write_games(num_games = 100)
+    table = Path(columnar.table_path(games))
+    stage = Stage("table", "table", build_table, (games, table), [games], [table])
+    assert run_stages([stage], tmp_path / "state.json", 1) == set()
+    assert columnar.fresh(table, games)
+    assert run_stages([stage], tmp_path / "state.json", 1) == set()
+    assert "table: up to date" in capsys.readouterr().out
+
+@pytest.mark.parametrize("player_dict", [False, True])
+def test_month_stages(player_dict):
+    stages = {stage.name: stage for stage in month_stages(["2199-01", "2199-02"], player_dict = player_dict)}
+    # no raw dumps for these months, they start from the processed csv
+    assert list(stages) == ["2199-01/table", "2199-01/input", "2199-01/graph",
+                            "2199-02/table", "2199-02/input", "2199-02/graph"]
+    assert stages["2199-01/graph"].deps == ["2199-01/input"]
+    if player_dict:
+        assert stages["2199-02/input"].deps == ["2199-01/input"]
+        assert stages["2199-01/input"].outputs[-1].name == PLAYER_DICT
+        assert stages["2199-01/input"].outputs[-1] in stages["2199-02/input"].inputs
+    else:
+        assert stages["2199-02/input"].deps == []
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from csv_to_input import prepare_input, prepare_input_chunked
+from player_dict import PlayerDictionary
+
+def test_assign_in_order_of_first_appearance():
+    players = PlayerDictionary()
+    assert list(players.assign(["carol", "alice", "carol", "bob"])) == [0, 1, 0, 2]
+    assert list(players.assign(["dave", "alice", "erin", "dave"])) == [3, 1, 4, 3]
+    assert players.usernames() == ["carol", "alice", "bob", "dave", "erin"]
+    assert list(players.lookup(["bob", "nobody", "erin"])) == [2, -1, 4]
+    assert players.username(3) == "dave"
+
+def test_lookup_empty():
+    assert list(PlayerDictionary().lookup(["alice", "bob"])) == [-1, -1]
+
+def test_widening():
+    players = PlayerDictionary()
+    players.assign(["al", "bo"])
+    players.assign(["a_much_longer_username", "al", "b"])
+    assert players.usernames() == ["al", "bo", "a_much_longer_username", "b"]
+    assert list(players.lookup(["b", "bo", "a_much_longer_username", "a_much"])) == [3, 1, 2, -1]
+
+def test_save_round_trip(tmp_path):
+    names = ["Łukasz", "ÖmerK", "gm_小明", "plain", "Łukasz2"]
+    players = PlayerDictionary(str(tmp_path / "players"))
+    players.assign(names)
+    players.save()
+    loaded = PlayerDictionary(str(tmp_path / "players"))
+    assert loaded.usernames() == names and len(loaded) == len(names)
+    assert list(loaded.lookup(names[::-1])) == [4, 3, 2, 1, 0]
+    # a memory-mapped dictionary keeps growing and saves over itself
+    assert list(loaded.assign(["new", "plain"])) == [5, 3]
+    loaded.save()
+    assert PlayerDictionary(str(tmp_path / "players")).usernames() == names + ["new"]
+    assert not (tmp_path / "players.tmp").exists()
+
+def test_ids_stable_across_months(tmp_path, write_games):
+    path = str(tmp_path / "players")
+    months = []
+    for month, (start, num_players) in enumerate([("2013-06-01", 60), ("2013-07-01", 80)]):
+        games = write_games("games{}.csv".format(month), num_games = 400, num_players = num_players, start = start, seed = month)
+        for prepare, extra in [(prepare_input, ()), (prepare_input_chunked, (97,))]:
+            out = tmp_path / "{}-{}".format(prepare.__name__, month)
+            out.mkdir()
+            # both paths start from the dictionary as the previous month left it
+            players = PlayerDictionary(path)
+            prepare(games, out, *extra, player_dict = players)
+            months.append((pd.read_csv(out / "edges.csv"), players.usernames()))
+        players.save(path)  # the chunked run's, as the pipeline would keep one
+    (june, june_names), (june_chunked, june_chunked_names), (july, july_names), _ = months
+    # games at the same second may come in a different order, so the two
+    # paths can number a month's new players differently
+    assert sorted(june_names) == sorted(june_chunked_names)
+    assert july_names[:len(june_chunked_names)] == june_chunked_names and len(july_names) > len(june_names)
+    # the chunked runs numbered their players with the dictionary that was saved
+    for edges, names in months[1::2]:
+        names = np.asarray(names)
+        assert list(PlayerDictionary(path).lookup(names[edges["src"]])) == list(edges["src"])
+        assert list(PlayerDictionary(path).lookup(names[edges["dst"]])) == list(edges["dst"])
@@ -0,0 +1,69 @@
+from collections import defaultdict
+
+import pandas as pd
+import pytest
+
+import columnar
+from player_dict import PlayerDictionary
+from player_statistics import GAME_TYPES, PlayerIndex, PlayerStatistics, clean_dataframe, game_type, sort_by_time
+
+def legacy_statistics(path):
+    """Final elos, game counts and outcomes as the original row loop computed them."""
+    df = sort_by_time(clean_dataframe(pd.read_csv(path, usecols = ["Event", "Black", "White", "BlackElo", "WhiteElo", "UTCDate", "UTCTime", "Result", "TimeControl"])))
+    final_elo = defaultdict(dict)
+    games_played = defaultdict(lambda: defaultdict(int))
+    by_type = {str(type): 0 for type in GAME_TYPES}
+    for row in df.itertuples():
+        type = game_type(row.Event)
+        final_elo[row.White][type] = int(row.WhiteElo)
+        final_elo[row.Black][type] = int(row.BlackElo)
+        games_played[row.White][type] += 1
+        games_played[row.Black][type] += 1
+        by_type[str(type)] += 1
+    outcomes = {
+        'White': df[df['Result'] == '1-0'].count(),
+        'Black': df[df['Result'] == '0-1'].count(),
+        'Draw': df[df['Result'] == '1/2-1/2'].count(),
+    }
+    return final_elo, games_played, by_type, outcomes
+
+@pytest.mark.parametrize("source", ["csv", "table", "player_dict"])
+def test_matches_row_loop(write_games, tmp_path, source):
+    path = write_games(num_games = 2000, num_players = 60)
+    player_dict = None
+    if source == "table":
+        columnar.csv_to_table(path)
+    if source == "player_dict":
+        player_dict = PlayerDictionary()
+        player_dict.assign(["earlier{}".format(i) for i in range(10)])
+    stats = PlayerStatistics(path, player_dict)
+    final_elo, games_played, by_type, outcomes = legacy_statistics(path)
+
+    assert sorted(stats.players()) == sorted(final_elo) if player_dict is None else set(final_elo) <= set(stats.players())
+    for player in final_elo:
+        assert stats.final_elo(player) == final_elo[player]
+        assert stats.games_played(player) == dict(games_played[player])
+        assert stats.username_from_code(stats.code_from_username(player)) == player
+    for type, count in by_type.items():
+        assert stats.games_played_type(type) == count
+    assert stats.outcomes().keys() == outcomes.keys()
+    for side, counts in outcomes.items():
+        pd.testing.assert_series_equal(stats.outcomes()[side], counts)
+    assert stats.final_elo("nobody") == {} and stats.games_played("nobody") == {}
+
+def test_player_index(tmp_path):
+    index = PlayerIndex(["magnus", "Hikaru", "MaxiMe", "alireza", "max"])
+    assert len(index) == 5
+    assert "Hikaru" in index and "hikaru" not in index
+    assert index.code("MaxiMe") == 2 and index.username(2) == "MaxiMe"
+    # prefixes match case-insensitively, in case-insensitive order
+    assert index.search("MA") == ["magnus", "max", "MaxiMe"]
+    assert index.search("max", limit = 1) == ["max"]
+    assert index.search("z") == []
+    assert index.add("hikaru") == 5
+    assert index.add("max") == 4
+    assert index.search("hi") == ["Hikaru", "hikaru"]
+    index.save(tmp_path / "players.npz")
+    loaded = PlayerIndex.load(tmp_path / "players.npz")
+    assert loaded.usernames() == index.usernames()
+    assert loaded.search("m") == index.search("m")
@@ -0,0 +1,41 @@
+import pandas as pd
+import pytest
+import torch as pt
+
+from benchmark_preprocessing import legacy_prepare_tensor, legacy_sort_by_time, synthetic_month
+from csv_to_input import prepare_tensor
+from player_statistics import clean_dataframe, sort_by_time
+
+from conftest import games_frame
+
+FEATURES = ["Result", "TimeControl", "WhiteElo", "BlackElo"]
+
+def same_rows(a, b):
+    """Equal up to the order of games that share a timestamp."""
+    a = a.sort_values(list(a.columns)).reset_index(drop = True)
+    b = b.sort_values(list(b.columns)).reset_index(drop = True)
+    pd.testing.assert_frame_equal(a, b)
+
+@pytest.mark.parametrize("categorical", [False, True])
+def test_sort_by_time(categorical):
+    df = clean_dataframe(games_frame(3000, 100))
+    legacy = legacy_sort_by_time(df.copy())
+    if categorical:
+        # as columnar tables load them
+        df = df.astype({"UTCDate": "category", "UTCTime": "category"})
+    current = sort_by_time(df.copy())
+    assert legacy["time"].dtype == current["time"].dtype and legacy["time"].equals(current["time"])
+    same_rows(legacy, current)
+
+@pytest.mark.parametrize("results", [["1-0", "0-1", "1/2-1/2"], ["1-0", "0-1"], ["1-0"]])
+def test_prepare_tensor(tmp_path, results):
+    df = clean_dataframe(synthetic_month(2000, 0))
+    df = sort_by_time(df[df["Result"].isin(results)].copy())[FEATURES]
+    (tmp_path / "legacy").mkdir()
+    (tmp_path / "current").mkdir()
+    legacy_prepare_tensor(df, tmp_path / "legacy")
+    prepare_tensor(df, tmp_path / "current")
+    a = pt.load(tmp_path / "legacy" / "edge_features.pt")
+    b = pt.load(tmp_path / "current" / "edge_features.pt")
+    assert a.shape == (len(df), len(results) + 4)
+    assert a.dtype == b.dtype and pt.equal(a, b)
@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+from app.backend.model.skill import InvalidInput, SkillRatingSystem
+from app.backend.registry import ModelRegistry
+
+class SizedSkill(SkillRatingSystem):
+    """Skill system of a given size that takes a while to build."""
+
+    built = []
+
+    def __init__(self, name, size = 100, seconds = 0):
+        time.sleep(seconds)
+        self.name = name
+        self.size = size
+        SizedSkill.built.append(name)
+
+    def predict(self, white, black, tc):
+        return self.name
+
+    def memory_usage(self):
+        return self.size
+
+@pytest.fixture(autouse = True)
+def clear_built():
+    SizedSkill.built = []
+
+def registry(budget = 0, **sizes):
+    return ModelRegistry({name: {'name': name, 'size': size} for name, size in sizes.items()}, SizedSkill, memory_budget = budget)
+
+def test_loads_lazily():
+    models = registry(a = 100, b = 100)
+    assert SizedSkill.built == []
+    assert models.route(None, 'predict', "x", "y", (5, 0)) == "a"
+    assert models.route('b', 'predict', "x", "y", (5, 0)) == "b"
+    assert models.get('a') is models.get('a')
+    assert SizedSkill.built == ['a', 'b']
+    assert models.memory_usage() == 200
+    with pytest.raises(InvalidInput) as e:
+        models.get('c')
+    assert e.value.invalid == ['model']
+
+def test_evicts_least_recently_used():
+    models = registry(250, a = 100, b = 100, c = 100)
+    models.get('a')
+    models.get('b')
+    models.get('a')
+    models.get('c')
+    stats = models.stats()
+    assert list(stats['loaded']) == ['a', 'c']
+    assert (stats['memory_usage'], stats['loads'], stats['evictions']) == (200, 3, 1)
+    # its size is known now, so room is made before it loads again
+    models.get('b')
+    assert list(models.stats()['loaded']) == ['c', 'b']
+
+def test_concurrent_gets_load_once():
+    models = ModelRegistry({'a': {'name': 'a', 'seconds': 0.1}}, SizedSkill)
+    systems = []
+    threads = [threading.Thread(target = lambda: systems.append(models.get('a'))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert SizedSkill.built == ['a']
+    assert all(system is systems[0] for system in systems)
+
+def test_from_config(tmp_path):
+    with open(tmp_path / "models.yml", "w") as f:
+        f.write("a:\n  name: a\nb:\n  name: b\n  size: 10\n")
+    models = ModelRegistry.from_config(str(tmp_path / "models.yml"), SizedSkill, default = 'b')
+    # the default model is loaded right away
+    assert SizedSkill.built == ['b']
+    assert models.route(None, 'predict', "x", "y", (5, 0)) == "b"
+    with pytest.raises(ValueError):
+        ModelRegistry.from_config(str(tmp_path / "models.yml"), SizedSkill, default = 'c')
+    assert ModelRegistry.from_config(None, lambda: SizedSkill('only')).get().name == 'only'
@@ -0,0 +1,128 @@
+import functools
+import json
+import os
+import time
+
+import yaml
+
+from app.backend.model.mock import MockSkill
+from app.backend.registry import ModelRegistry
+from app.backend.shared import SharedSkill, SharedState, build
+
+class GamesSkill(MockSkill):
+    """MockSkill that keeps the games it ingested, in its snapshots too."""
+
+    def __init__(self, snapshot = None):
+        super().__init__()
+        self.games = []
+        if snapshot is not None:
+            with open(os.path.join(snapshot, "games.json")) as f:
+                self.games = [(*game[:3], tuple(game[3]), *game[4:]) for game in json.load(f)]
+
+    def ingest(self, games):
+        self.games += [tuple(game) for game in games]
+        return {'games': len(games)}
+
+    def snapshot(self, path):
+        os.makedirs(path)
+        with open(os.path.join(path, "games.json"), "w") as f:
+            json.dump(self.games, f)
+
+def wait_for(condition, timeout = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+GAME = ("John", "Alice", "1-0", (5, 0), 1500, 1600, None)
+
+def test_generations(tmp_path):
+    state = SharedState(str(tmp_path), keep = 2)
+    assert state.current() is None
+    for generation in range(1, 5):
+        assert state.publish(os.makedirs) == (generation, str(tmp_path / "gen-{}".format(generation)))
+    assert sorted(name for name in os.listdir(tmp_path) if name.startswith("gen-")) == ["gen-3", "gen-4"]
+
+def test_spool(tmp_path):
+    state = SharedState(str(tmp_path))
+    assert state.drain() == []
+    state.spool([GAME, GAME])
+    state.spool([GAME])
+    assert state.drain() == [GAME] * 3
+    assert state.drain() == []
+
+def test_one_writer(tmp_path):
+    state = SharedState(str(tmp_path))
+    writer = state.try_acquire_writer()
+    assert writer is not None
+    assert state.try_acquire_writer() is None
+    writer.close()
+    assert state.try_acquire_writer() is not None
+
+def test_reader_follows_writer(tmp_path):
+    writer = SharedSkill(GamesSkill, str(tmp_path), poll_interval = 0.01, publish_interval = 0.05)
+    reader = SharedSkill(GamesSkill, str(tmp_path), poll_interval = 0.01, publish_interval = 0.05)
+    assert writer.is_writer and not reader.is_writer
+    assert writer.generation == reader.generation == 1
+
+    assert writer.ingest([GAME]) == {'games': 1}
+    assert reader.ingest([GAME]) == {'games': 1, 'queued': True}
+    # the writer takes the spooled game and publishes both
+    wait_for(lambda: writer.generation > 1 and writer.system.games == [GAME, GAME])
+    wait_for(lambda: (reader.predict("John", "Alice", (5, 0)), reader.generation)[1] == writer.generation)
+    assert reader.system.games == [GAME, GAME]
+    assert reader.stats()['shared_state']['generation'] == writer.generation
+
+def test_build(tmp_path):
+    assert isinstance(build(GamesSkill), GamesSkill)
+    shared = build(GamesSkill, shared_state = str(tmp_path))
+    assert isinstance(shared, SharedSkill) and shared.is_writer
+
+def test_models_share_state_separately(tmp_path):
+    with open(tmp_path / "models.yml", "w") as f:
+        yaml.safe_dump({"a": {}, "b": {}, "c": {"shared_state": str(tmp_path / "elsewhere")}}, f)
+    models = ModelRegistry.from_config(str(tmp_path / "models.yml"), functools.partial(build, GamesSkill),
+                                       shared_state = str(tmp_path / "state"))
+    # each one writes its own snapshots, none restores another model's
+    assert {name: models.get(name).state.root for name in "abc"} == {
+        "a": str(tmp_path / "state" / "a"),
+        "b": str(tmp_path / "state" / "b"),
+        "c": str(tmp_path / "elsewhere"),
+    }
+    assert all(models.get(name).is_writer for name in "abc")
+
+def mapped_file(address):
+    """The file the memory at `address` is mapped from, None for anonymous memory."""
+    with open("/proc/self/maps") as f:
+        for line in f:
+            fields = line.split()
+            start, end = (int(bound, 16) for bound in fields[0].split("-"))
+            if start <= address < end:
+                return fields[5] if len(fields) > 5 else None
+
+def test_snapshot_is_memory_mapped(tgl_dataset, tmp_path):
+    from app.backend.model.tgl import TGLDeepSkill
+    from tgl.model import GRAPH_ARRAYS
+    factory = functools.partial(TGLDeepSkill, tgl_dataset["data"], tgl_dataset["config"], tgl_dataset["stored_model"],
+                                tgl_dataset["games"], device = "cpu", num_threads = 2, quantize = False)
+    writer = SharedSkill(factory, str(tmp_path), publish_interval = 60)
+    reader = SharedSkill(factory, str(tmp_path), publish_interval = 60)
+    generation = str(tmp_path / "gen-1")
+
+    for system in (writer.system, reader.system):
+        model = system.model
+        # the sampler reads the mapped graph instead of a private copy
+        assert model.sampler.borrows_graph()
+        for key in GRAPH_ARRAYS:
+            assert mapped_file(model.g[key].ctypes.data) == os.path.join(generation, "g_{}.npy".format(key))
+        for name, tensor in [("edge_feats", model.edge_feats), ("node_embs", model.node_embs),
+                             ("node_memory", model.mailbox.node_memory), ("mailbox", model.mailbox.mailbox)]:
+            assert mapped_file(tensor.data_ptr()) == os.path.join(generation, name + ".npy")
+
+    players = reader.system.player_index
+    white, black = players.username(0), players.username(1)
+    assert reader.predict(white, black, (5, 0)) == writer.predict(white, black, (5, 0))
+    # the writer copies what it changes, the readers keep the published pages
+    writer.ingest([(white, black, "1-0", (5, 0), 1500, 1600, None)])
+    assert not writer.system.model.sampler.borrows_graph()
+    assert reader.system.model.sampler.borrows_graph()
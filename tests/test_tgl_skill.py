@@ -0,0 +1,140 @@
+import pandas as pd
+import pytest
+
+from app.backend.model.skill import InvalidInput
+from player_dict import PlayerDictionary
+from player_statistics import clean_dataframe, factor_players, sort_by_time
+
+@pytest.fixture
+def skill(tgl_dataset, tmp_path):
+    """The service over the test dataset, with a player dictionary that also
+    holds players of later months, which have no node in the graph."""
+    from app.backend.model.tgl import TGLDeepSkill
+    df = sort_by_time(clean_dataframe(pd.read_csv(tgl_dataset["games"])))
+    _, usernames = factor_players(df)
+    players = PlayerDictionary()
+    players.assign(usernames)
+    players.assign(["later{}".format(i) for i in range(50)])
+    players.save(str(tmp_path / "players"))
+    return TGLDeepSkill(tgl_dataset["data"], tgl_dataset["config"], tgl_dataset["stored_model"], tgl_dataset["games"],
+                        device = "cpu", num_threads = 2, snapshot = None, quantize = False, player_dict = str(tmp_path / "players"))
+
+def test_index_stops_at_the_graph(skill):
+    assert len(skill.player_index) == skill.model.num_nodes
+    assert "later0" not in skill.player_index
+    assert skill.player_stats.final_elo("later0") == {}
+
+def test_players_without_a_node_are_invalid(skill):
+    white = skill.player_index.username(0)
+    with pytest.raises(InvalidInput) as e:
+        skill.predict(white, "later0", (5, 0))
+    assert e.value.invalid == ['black']
+    # added to the index, but not to the graph
+    skill.player_index.add("newcomer")
+    with pytest.raises(InvalidInput) as e:
+        skill.predict_batch([(white, skill.player_index.username(1), (5, 0)), ("newcomer", white, (5, 0))])
+    assert e.value.invalid == [{'index': 1, 'invalid': ['white']}]
+    with pytest.raises(InvalidInput):
+        skill.find_opponents("newcomer")
+    prediction = skill.predict(white, skill.player_index.username(1), (5, 0))
+    assert sum(prediction.values()) == pytest.approx(1, abs = 1e-5)
+
+def test_predict_batch(skill):
+    players = skill.player_index.usernames()
+    games = [(players[i], players[i + 1], (tc, 0)) for i, tc in zip(range(0, 40, 2), [1, 5, 10, 30] * 5)]
+    batch = skill.predict_batch(games)
+    skill.cache.clear()
+    for game, prediction in zip(games, batch):
+        assert skill.predict(*game) == pytest.approx(prediction, abs = 1e-6)
+    with pytest.raises(InvalidInput) as e:
+        skill.predict_batch(games[:2] + [(players[0], players[1], (0, -1))])
+    assert e.value.invalid == [{'index': 2, 'invalid': ['min', 'inc']}]
+
+def test_search_players(skill):
+    assert skill.search_players("player1", limit = 3) == ["player1", "player10", "player100"]
+    assert skill.search_players("PLAYER11") == ["player11", "player110", "player111", "player112", "player113",
+                                                "player114", "player115", "player116", "player117", "player118"]
+    assert skill.search_players("later") == []
+
+def test_snapshot(skill, tmp_path):
+    from app.backend.model.tgl import TGLDeepSkill
+    players = skill.player_index.usernames()
+    games = [(players[i], players[i + 1], (5, 0)) for i in range(0, 40, 2)]
+    skill.snapshot(str(tmp_path / "snapshot"))
+    copy = TGLDeepSkill(snapshot = str(tmp_path / "snapshot"), device = "cpu", num_threads = 2, quantize = False)
+    assert copy.player_stats is None
+    assert copy.player_index.usernames() == players
+    assert copy.search_players("player1") == skill.search_players("player1")
+    assert copy.predict_batch(games) == skill.predict_batch(games)
+
+def test_ingest(skill):
+    players = skill.player_index.usernames()
+    latest_ts = skill.model.latest_ts
+    games = [
+        (players[0], players[1], "1-0", (5, 0), 1500, 1600, latest_ts + 10),
+        (players[2], "newcomer", "1/2-1/2", (1, 0), 1700, 1200, None),
+    ]
+    assert skill.ingest(games) == {'games': 2, 'new_players': 1}
+    assert skill.model.num_edges == len(skill.model.df) + 2
+    assert skill.model.latest_ts == latest_ts + 10
+    assert skill.player_index.code("newcomer") == skill.model.num_nodes - 1
+    assert set(skill.predict("newcomer", players[0], (5, 0))) == {'white', 'black', 'draw'}
+
+    with pytest.raises(InvalidInput) as e:
+        skill.ingest([
+            (players[0], players[0], "1-0", (5, 0), 1500, 1600, None),
+            (players[0], players[1], "2-0", (0, -1), 0, 1600, latest_ts),
+        ])
+    assert e.value.invalid == [
+        {'index': 0, 'invalid': ['players']},
+        {'index': 1, 'invalid': ['result', 'min', 'inc', 'white_elo', 'time']},
+    ]
+
+def test_ingest_matches_the_edge_features(tgl_dataset_without_draws):
+    from app.backend.model.tgl import TGLDeepSkill
+    data = tgl_dataset_without_draws
+    skill = TGLDeepSkill(data["data"], data["config"], data["stored_model"], data["games"],
+                         device = "cpu", num_threads = 2, snapshot = None, quantize = False, player_dict = None)
+    assert skill.model.edge_feats.shape[1] == 6
+    players = skill.player_index.usernames()
+    # no column for draws
+    with pytest.raises(InvalidInput) as e:
+        skill.ingest([(players[0], players[1], "1/2-1/2", (5, 0), 1500, 1600, None)])
+    assert e.value.invalid == [{'index': 0, 'invalid': ['result']}]
+    assert skill.ingest([(players[0], players[1], "0-1", (5, 0), 1500, 1600, None)]) == {'games': 1, 'new_players': 0}
+    assert skill.model.edge_feats[-1].tolist() == [0, 1, 5 * 60 / 1200, 0, 0, 0.25]
+
+def test_ingest_invalidates_cached_predictions(skill):
+    players = skill.player_index.usernames()
+    skill.cache.clear()
+    first = skill.predict_batch([(players[0], players[1], (5, 0)), (players[2], players[3], (5, 0))])
+    assert skill.predict_batch([(players[0], players[1], (5, 0)), (players[2], players[3], (5, 0))]) == first
+    assert skill.cache.stats()['hits'] == 2
+
+    skill.ingest([(players[0], players[4], "1-0", (5, 0), 1500, 1600, None)])
+    second = skill.predict_batch([(players[0], players[1], (5, 0)), (players[2], players[3], (5, 0))])
+    stats = skill.cache.stats()
+    # only the pair with a player of the new game is recomputed
+    assert (stats['hits'], stats['invalidations']) == (3, 1)
+    assert second[1] == first[1]
+    assert second[0] != first[0]
+
+def test_find_opponents(skill):
+    player = skill.player_index.username(5)
+    opponents = skill.find_opponents(player, 5, (5, 0))
+    assert len(opponents) == 5
+    assert all(opponent['player'] != player and opponent['player'] in skill.player_index for opponent in opponents)
+    assert [opponent['imbalance'] for opponent in opponents] == sorted(opponent['imbalance'] for opponent in opponents)
+    assert set(opponents[0]['as_white']) == {'white', 'black', 'draw'}
+    with pytest.raises(InvalidInput) as e:
+        skill.find_opponents("nobody", 5, (0, 0))
+    assert e.value.invalid == ['player', 'min']
+
+def test_leaderboard(skill):
+    board = skill.leaderboard("Blitz", 0, 5)
+    assert board['type'] == "Blitz" and board['total'] == skill.model.num_nodes
+    assert [entry['rank'] for entry in board['entries']] == [1, 2, 3, 4, 5]
+    assert all(entry['player'] in skill.player_index for entry in board['entries'])
+    assert skill.stats()['leaderboards']['Blitz']['players'] == skill.model.num_nodes
+    with pytest.raises(InvalidInput):
+        skill.leaderboard("Chess960")
@@ -0,0 +1,63 @@
+import math
+import torch
+
+class IVFIndex:
+    """Inverted-file approximate nearest neighbor index over dense vectors.
+
+    Vectors are clustered with k-means into `num_lists` lists; a query only
+    scans the lists of its `num_probes` nearest centroids. Everything runs
+    on CPU with dense torch ops.
+    """
+
+    def __init__(self, num_lists=None, num_probes=8, iterations=10, max_train=100000, seed=0):
+        self.num_lists = num_lists
+        self.num_probes = num_probes
+        self.iterations = iterations
+        self.max_train = max_train
+        self.seed = seed
+        self.centroids = None
+        self.list_ids = None
+        self.list_offsets = None
+
+    def build(self, vectors):
+        vectors = vectors.float()
+        num_lists = self.num_lists or max(1, int(math.sqrt(vectors.shape[0])))
+        num_lists = min(num_lists, vectors.shape[0])
+        gen = torch.Generator().manual_seed(self.seed)
+
+        train = vectors
+        if vectors.shape[0] > self.max_train:
+            train = vectors[torch.randperm(vectors.shape[0], generator=gen)[:self.max_train]]
+        centroids = train[torch.randperm(train.shape[0], generator=gen)[:num_lists]].clone()
+        for _ in range(self.iterations):
+            assign = self._nearest(train, centroids, 1)[:, 0]
+            sums = torch.zeros_like(centroids).index_add_(0, assign, train)
+            counts = torch.bincount(assign, minlength=num_lists).unsqueeze(1)
+            # empty lists keep their old centroid
+            centroids = torch.where(counts > 0, sums / counts.clamp(min=1), centroids)
+
+        assign = self._nearest(vectors, centroids, 1)[:, 0]
+        self.list_ids = torch.argsort(assign, stable=True)
+        self.list_offsets = torch.zeros(num_lists + 1, dtype=torch.long)
+        self.list_offsets[1:] = torch.cumsum(torch.bincount(assign, minlength=num_lists), 0)
+        self.centroids = centroids
+        return self
+
+    def candidates(self, query, num_probes=None):
+        """Ids of all vectors in the lists closest to `query`."""
+        num_probes = min(num_probes or self.num_probes, self.centroids.shape[0])
+        lists = self._nearest(query.float().reshape(1, -1), self.centroids, num_probes)[0]
+        return torch.cat([self.list_ids[self.list_offsets[l]:self.list_offsets[l + 1]] for l in lists.tolist()])
+
+    def search(self, vectors, query, k, num_probes=None):
+        """Approximate `k` nearest rows of `vectors` (the indexed matrix) to `query`."""
+        ids = self.candidates(query, num_probes)
+        dists = (vectors[ids].float() - query.float()).pow(2).sum(1)
+        dists, top = torch.topk(dists, min(k, ids.shape[0]), largest=False)
+        return ids[top], dists
+
+    @staticmethod
+    def _nearest(x, centroids, k):
+        # squared L2 through one matmul: |x|^2 - 2 x.c + |c|^2
+        dists = (x * x).sum(1, keepdim=True) - 2 * x @ centroids.T + (centroids * centroids).sum(1)
+        return torch.topk(dists, k, dim=1, largest=False)[1]
@@ -0,0 +1,87 @@
+import argparse
+import os
+import time
+import pandas as pd
+import numpy as np
+try:
+    from tgl.gen_graph import build_csr
+except ImportError:
+    # run as a script from tgl/
+    from gen_graph import build_csr
+
+def merge_csr(indptr, indices, ts, eid, src, dst, new_ts, new_eid, add_reverse=False):
+    """T-CSR of a graph extended with edges no older than any it has.
+
+    Since every new edge is at least as recent as the existing ones, the
+    new neighbors of a node go right after its old ones. The new edges are
+    built into their own T-CSR, and both are copied into place with one
+    sequential pass each, in O(E + dE log dE). The result equals build_csr
+    over the old edges followed by the new ones.
+    """
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    new_ts = np.asarray(new_ts).astype(ts.dtype)
+    if len(src) == 0:
+        return indptr, indices, ts, eid
+    if len(ts) > 0 and new_ts.min() < ts.max():
+        raise ValueError('new edges start at {}, before the last edge of the graph at {}'.format(new_ts.min(), ts.max()))
+    num_nodes = max(len(indptr) - 1, int(src.max()) + 1, int(dst.max()) + 1)
+    delta = build_csr(src, dst, new_ts, num_nodes, add_reverse)
+    delta_indptr, delta_indices, delta_ts, delta_pos = delta
+    delta_eid = np.asarray(new_eid, dtype=eid.dtype)[delta_pos]
+
+    old_indptr = np.full(num_nodes + 1, indptr[-1], dtype=np.int64)
+    old_indptr[:len(indptr)] = indptr
+    merged_indptr = old_indptr + delta_indptr
+
+    # an old entry moves by the new entries of the nodes before its own,
+    # a new entry by the old entries of its own node and the ones before
+    old_dest = np.arange(len(indices), dtype=np.int64) + np.repeat(delta_indptr[:-1], np.diff(old_indptr))
+    new_dest = np.arange(len(delta_indices), dtype=np.int64) + np.repeat(old_indptr[1:], np.diff(delta_indptr))
+
+    merged = []
+    for old, new in ((indices, delta_indices), (ts, delta_ts), (eid, delta_eid)):
+        out = np.empty(len(old) + len(new), dtype=old.dtype)
+        out[old_dest] = old
+        out[new_dest] = new
+        merged.append(out)
+    return (merged_indptr,) + tuple(merged)
+
+if __name__ == '__main__':
+    parser=argparse.ArgumentParser(description='Add time-ordered edges to the ext_full.npz of a dataset without rebuilding it.')
+    parser.add_argument('--data', type=str, help='dataset name')
+    parser.add_argument('--edges', type=str, help='csv of the new edges with time, src and dst, and their ids in the unnamed first column if it has one')
+    parser.add_argument('--add_reverse', default=False, action='store_true', help='must match how ext_full.npz was generated')
+    parser.add_argument('--check', default=False, action='store_true', help='compare with gen_graph over edges.csv, which must already include the new edges')
+    args=parser.parse_args()
+
+    path = 'DATA/{}/ext_full.npz'.format(args.data)
+    g = np.load(path)
+    indptr, indices, ts, eid = (g[key] for key in ('indptr', 'indices', 'ts', 'eid'))
+    df = pd.read_csv(args.edges)
+    if 'Unnamed: 0' in df:
+        new_eid = df['Unnamed: 0'].values
+    else:
+        # the ids continue after the edges already in the graph
+        start = int(eid.max()) + 1 if len(eid) > 0 else 0
+        new_eid = np.arange(start, start + len(df))
+    print('adding {} edges to {} ({} entries)'.format(len(df), path, len(indices)))
+
+    start = time.perf_counter()
+    graph = merge_csr(indptr, indices, ts, eid, df['src'].values, df['dst'].values, df['time'].values, new_eid, args.add_reverse)
+    print('merged in {:.2f}s'.format(time.perf_counter() - start))
+
+    if args.check:
+        full = pd.read_csv('DATA/{}/edges.csv'.format(args.data), usecols=['src', 'dst', 'time'])
+        start = time.perf_counter()
+        rebuilt = build_csr(full['src'].values, full['dst'].values, full['time'].values, len(graph[0]) - 1, args.add_reverse)
+        print('gen_graph rebuild {:.2f}s'.format(time.perf_counter() - start))
+        if not all(np.array_equal(x, y) for x, y in zip(graph, rebuilt)):
+            raise SystemExit('merged graph differs from the rebuilt one')
+        print('outputs identical')
+
+    print('saving...')
+    merged_indptr, merged_indices, merged_ts, merged_eid = graph
+    tmp = 'DATA/{}/ext_full.tmp.npz'.format(args.data)
+    np.savez(tmp, indptr=merged_indptr, indices=merged_indices, ts=merged_ts, eid=merged_eid)
+    os.replace(tmp, path)
@@ -1,54 +1,109 @@
 import argparse
 import itertools
+import time
 import pandas as pd
 import numpy as np
 from tqdm import tqdm
 
-parser=argparse.ArgumentParser()
-parser.add_argument('--data', type=str, help='dataset name')
-parser.add_argument('--add_reverse', default=False, action='store_true')
-args=parser.parse_args()
-
-df = pd.read_csv('DATA/{}/edges.csv'.format(args.data))
-num_nodes = max(int(df['src'].max()), int(df['dst'].max())) + 1
-print('num_nodes: ', num_nodes)
-
-ext_full_indptr = np.zeros(num_nodes + 1, dtype=np.int)
-ext_full_indices = [[] for _ in range(num_nodes)]
-ext_full_ts = [[] for _ in range(num_nodes)]
-ext_full_eid = [[] for _ in range(num_nodes)]
-
-for idx, row in tqdm(df.iterrows(), total=len(df)):
-    src = int(row['src'])
-    dst = int(row['dst'])
-    ext_full_indices[src].append(dst)
-    ext_full_ts[src].append(row['time'])
-    ext_full_eid[src].append(idx)
-    if args.add_reverse:
-        ext_full_indices[dst].append(src)
-        ext_full_ts[dst].append(row['time'])
-        ext_full_eid[dst].append(idx)
-    # ext_full_indptr[src + 1:] += 1
-
-for i in tqdm(range(num_nodes)):
-    ext_full_indptr[i + 1] = ext_full_indptr[i] + len(ext_full_indices[i])
-
-ext_full_indices = np.array(list(itertools.chain(*ext_full_indices)))
-ext_full_ts = np.array(list(itertools.chain(*ext_full_ts)))
-ext_full_eid = np.array(list(itertools.chain(*ext_full_eid)))
-
-print('Sorting...')
-def tsort(i, indptr, indices, t, eid):
-    beg = indptr[i]
-    end = indptr[i + 1]
-    sidx = np.argsort(t[beg:end])
-    indices[beg:end] = indices[beg:end][sidx]
-    t[beg:end] = t[beg:end][sidx]
-    eid[beg:end] = eid[beg:end][sidx]
-
-for i in tqdm(range(ext_full_indptr.shape[0] - 1)):
-    tsort(i, ext_full_indptr, ext_full_indices, ext_full_ts, ext_full_eid)
-
-# import pdb; pdb.set_trace()
-print('saving...')
-np.savez('DATA/{}/ext_full.npz'.format(args.data), indptr=ext_full_indptr, indices=ext_full_indices, ts=ext_full_ts, eid=ext_full_eid)
\ No newline at end of file
+def build_csr(src, dst, ts, num_nodes, add_reverse=False):
+    """T-CSR of the edges: the neighbors of every node sorted by time.
+
+    Ties keep the order the edges come in, with the reverse of an edge right
+    after it, so the result only depends on the input order.
+    """
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    ts = np.asarray(ts)
+    eid = np.arange(len(src), dtype=np.int64)
+    if add_reverse:
+        nodes = np.column_stack([src, dst]).ravel()
+        indices = np.column_stack([dst, src]).ravel()
+        ts = np.repeat(ts, 2)
+        eid = np.repeat(eid, 2)
+    else:
+        nodes, indices = src, dst
+    # lexsort is stable: by node, then time, then position in the input
+    order = np.lexsort((ts, nodes))
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(nodes, minlength=num_nodes), out=indptr[1:])
+    return indptr, indices[order], ts[order], eid[order]
+
+def build_csr_legacy(df, num_nodes, add_reverse=False):
+    """The original per-edge builder, kept for --benchmark."""
+    ext_full_indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    ext_full_indices = [[] for _ in range(num_nodes)]
+    ext_full_ts = [[] for _ in range(num_nodes)]
+    ext_full_eid = [[] for _ in range(num_nodes)]
+
+    for idx, row in tqdm(df.iterrows(), total=len(df)):
+        src = int(row['src'])
+        dst = int(row['dst'])
+        ext_full_indices[src].append(dst)
+        ext_full_ts[src].append(row['time'])
+        ext_full_eid[src].append(idx)
+        if add_reverse:
+            ext_full_indices[dst].append(src)
+            ext_full_ts[dst].append(row['time'])
+            ext_full_eid[dst].append(idx)
+
+    for i in tqdm(range(num_nodes)):
+        ext_full_indptr[i + 1] = ext_full_indptr[i] + len(ext_full_indices[i])
+
+    ext_full_indices = np.array(list(itertools.chain(*ext_full_indices)))
+    ext_full_ts = np.array(list(itertools.chain(*ext_full_ts)))
+    ext_full_eid = np.array(list(itertools.chain(*ext_full_eid)))
+
+    def tsort(i, indptr, indices, t, eid):
+        beg = indptr[i]
+        end = indptr[i + 1]
+        sidx = np.argsort(t[beg:end])
+        indices[beg:end] = indices[beg:end][sidx]
+        t[beg:end] = t[beg:end][sidx]
+        eid[beg:end] = eid[beg:end][sidx]
+
+    for i in tqdm(range(ext_full_indptr.shape[0] - 1)):
+        tsort(i, ext_full_indptr, ext_full_indices, ext_full_ts, ext_full_eid)
+    return ext_full_indptr, ext_full_indices, ext_full_ts, ext_full_eid
+
+def same_up_to_ties(a, b):
+    """Whether two T-CSRs only differ in the order of a node's simultaneous edges."""
+    indptr, indices, ts, eid = a
+    if not (np.array_equal(indptr, b[0]) and np.array_equal(ts, b[2])):
+        return False
+    node = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    keys = [np.lexsort((e, t, n)) for n, t, e in ((node, ts, eid), (node, b[2], b[3]))]
+    return np.array_equal(eid[keys[0]], b[3][keys[1]]) and np.array_equal(indices[keys[0]], b[1][keys[1]])
+
+if __name__ == '__main__':
+    parser=argparse.ArgumentParser()
+    parser.add_argument('--data', type=str, help='dataset name')
+    parser.add_argument('--add_reverse', default=False, action='store_true')
+    parser.add_argument('--benchmark', default=False, action='store_true', help='also run the original builder and compare')
+    args=parser.parse_args()
+
+    df = pd.read_csv('DATA/{}/edges.csv'.format(args.data), usecols=['src', 'dst', 'time'])
+    num_nodes = max(int(df['src'].max()), int(df['dst'].max())) + 1
+    print('num_nodes: ', num_nodes)
+
+    start = time.perf_counter()
+    graph = build_csr(df['src'].values, df['dst'].values, df['time'].values, num_nodes, args.add_reverse)
+    elapsed = time.perf_counter() - start
+    print('built in {:.2f}s'.format(elapsed))
+
+    if args.benchmark:
+        start = time.perf_counter()
+        legacy = build_csr_legacy(df, num_nodes, args.add_reverse)
+        legacy_elapsed = time.perf_counter() - start
+        identical = all(np.array_equal(x, y) for x, y in zip(graph, legacy))
+        print('original builder {:.2f}s, {:.1f}x slower'.format(legacy_elapsed, legacy_elapsed / elapsed))
+        if identical:
+            print('outputs identical')
+        elif same_up_to_ties(graph, legacy):
+            # the original per-node argsort is not stable for high degree nodes
+            print('outputs identical up to the order of simultaneous edges')
+        else:
+            raise SystemExit('outputs differ')
+
+    print('saving...')
+    indptr, indices, ts, eid = graph
+    np.savez('DATA/{}/ext_full.npz'.format(args.data), indptr=indptr, indices=indices, ts=ts, eid=eid)
@@ -0,0 +1,26 @@
+import copy
+import torch
+
+def quantizable_layers(model):
+    # the time encoders hold frequencies down to 1e-9, int8 would flatten them
+    return {name for name, module in model.named_modules()
+            if isinstance(module, (torch.nn.Linear, torch.nn.GRUCell, torch.nn.RNNCell)) and 'time_enc' not in name}
+
+def export_model(model, quantize=True, script=True):
+    """Copy of a trained GeneralModel prepared for CPU inference.
+
+    With `quantize` the dense layers (memory updater cell, attention
+    projections, edge classifier) are replaced by int8 dynamically quantized
+    versions. With `script` the edge classifier, the only piece run per
+    request, is compiled with TorchScript; the rest relies on DGL message
+    passing and stays eager.
+    """
+    exported = copy.deepcopy(model).cpu().eval()
+    if quantize:
+        exported = torch.quantization.quantize_dynamic(exported, quantizable_layers(exported), dtype=torch.qint8)
+    if script and hasattr(exported, 'edge_classifier'):
+        exported.edge_classifier = torch.jit.script(exported.edge_classifier)
+    return exported
+
+def max_abs_diff(a, b):
+    return (a.float() - b.float()).abs().max().item() if a.numel() > 0 else 0.0
@@ -26,19 +26,36 @@ class MailBox():
         self.next_mail_pos.fill_(0)
 
     def move_to_gpu(self):
-        self.node_memory = self.node_memory.cuda()
-        self.node_memory_ts = self.node_memory_ts.cuda()
-        self.mailbox = self.mailbox.cuda()
-        self.mailbox_ts = self.mailbox_ts.cuda()
-        self.next_mail_pos = self.next_mail_pos.cuda()
-        self.device = torch.device('cuda:0')
+        self.move_to(torch.device('cuda:0'))
+
+    def move_to(self, device):
+        device = torch.device(device)
+        self.node_memory = self.node_memory.to(device)
+        self.node_memory_ts = self.node_memory_ts.to(device)
+        self.mailbox = self.mailbox.to(device)
+        self.mailbox_ts = self.mailbox_ts.to(device)
+        self.next_mail_pos = self.next_mail_pos.to(device)
+        self.device = device
+
+    def resize(self, num_nodes):
+        extra = num_nodes - self.node_memory.shape[0]
+        if extra <= 0:
+            return
+        grow = lambda t: torch.cat([t, t.new_zeros((extra,) + tuple(t.shape[1:]))])
+        self.node_memory = grow(self.node_memory)
+        self.node_memory_ts = grow(self.node_memory_ts)
+        self.mailbox = grow(self.mailbox)
+        self.mailbox_ts = grow(self.mailbox_ts)
+        self.next_mail_pos = grow(self.next_mail_pos)
+        if self.update_mail_pos is not None:
+            self.update_mail_pos = grow(self.update_mail_pos)
 
     def prep_input_mails(self, mfg):
         for i, b in enumerate(mfg):
-            b.srcdata['mem'] = self.node_memory[b.srcdata['ID'].long()].cuda()
-            b.srcdata['mem_ts'] = self.node_memory_ts[b.srcdata['ID'].long()].cuda()
-            b.srcdata['mem_input'] = self.mailbox[b.srcdata['ID'].long()].cuda().reshape(b.srcdata['ID'].shape[0], -1)
-            b.srcdata['mail_ts'] = self.mailbox_ts[b.srcdata['ID'].long()].cuda()
+            b.srcdata['mem'] = self.node_memory[b.srcdata['ID'].long()].to(b.device)
+            b.srcdata['mem_ts'] = self.node_memory_ts[b.srcdata['ID'].long()].to(b.device)
+            b.srcdata['mem_input'] = self.mailbox[b.srcdata['ID'].long()].to(b.device).reshape(b.srcdata['ID'].shape[0], -1)
+            b.srcdata['mail_ts'] = self.mailbox_ts[b.srcdata['ID'].long()].to(b.device)
 
     def update_memory(self, nid, memory, root_nodes, ts, neg_samples=1):
         if nid is None:
@@ -1,18 +1,45 @@
+import contextlib
+import json
+import os
+import shutil
+import threading
+import time as timer
 import torch
 import numpy as np
 import pandas as pd
 from sklearn.decomposition import PCA
+from tgl.ann import IVFIndex
+from tgl.inference import export_model, max_abs_diff
 from tgl.memorys import MailBox
 from tgl.modules import GeneralModel
 from tgl.sampler import *
 from tgl.utils import *
 
+# bump whenever the layout written by TemporalGraphModel.snapshot changes
+SNAPSHOT_FORMAT = 1
+GRAPH_ARRAYS = ('indptr', 'indices', 'eid', 'ts')
+# dtypes ParallelSampler stores the graph in; snapshots use them so that the
+# sampler reads a restored graph in place instead of copying it
+GRAPH_DTYPES = {'indptr': np.int32, 'indices': np.int32, 'eid': np.int32, 'ts': np.float32}
+MAILBOX_STATE = ('node_memory', 'node_memory_ts', 'mailbox', 'mailbox_ts', 'next_mail_pos')
+# per-call timings recorded by the C++ sampler, reported as 'sampler_<phase>'
+SAMPLER_PHASES = ('tot', 'ptr', 'search', 'sample', 'coo')
+
 class TemporalGraphModel:
 
-    def __init__(self, data: str, config: str, stored_model: str, supervised = False):
+    def __init__(self, data: str, config: str, stored_model: str, supervised = False, device = None, num_threads = None):
         node_feats, edge_feats = load_feat(data)
         g, df = load_graph(data)
-        sample_param, memory_param, gnn_param, train_param = parse_config(config)
+        self._setup(node_feats, edge_feats, g, df, parse_config(config), supervised, device, num_threads)
+        self.model.load_state_dict(torch.load(stored_model, map_location=self.device))
+
+    def _setup(self, node_feats, edge_feats, g, df, params, supervised, device, num_threads, mailbox_state = None):
+        device = resolve_device(device)
+        if device.type == 'cpu':
+            # intra-op parallelism is the only parallelism we get on CPU nodes,
+            # pin it so latency does not depend on what else the box is running
+            torch.set_num_threads(num_threads or os.cpu_count())
+        sample_param, memory_param, gnn_param, train_param = params
 
         gnn_dim_node = 0 if node_feats is None else node_feats.shape[1]
         gnn_dim_edge = 0 if edge_feats is None else edge_feats.shape[1]
@@ -25,26 +52,34 @@ class TemporalGraphModel:
                     gnn_param, train_param, 
                     combined=combine_first,
                     game_feats=2 if supervised else None
-                ).cuda()
-        mailbox = MailBox(memory_param, g['indptr'].shape[0] - 1, gnn_dim_edge) if memory_param['type'] != 'none' else None
+                ).to(device)
+        mailbox = None
+        if memory_param['type'] != 'none':
+            mailbox = MailBox(memory_param, g['indptr'].shape[0] - 1, gnn_dim_edge, **(mailbox_state or {}))
         
+        num_sample_threads = sample_param['num_thread']
+        if device.type == 'cpu':
+            # the sampler shares the OpenMP pool with torch, do not oversubscribe it
+            num_sample_threads = min(num_sample_threads, torch.get_num_threads())
         sampler = None
         if not ('no_sample' in sample_param and sample_param['no_sample']):
-            sampler = ParallelSampler(g['indptr'], g['indices'], g['eid'], g['ts'].astype(np.float32),
-                                    sample_param['num_thread'], 1, sample_param['layer'], sample_param['neighbor'],
+            sampler = ParallelSampler(g['indptr'], g['indices'], g['eid'], g['ts'].astype(np.float32, copy=False),
+                                    num_sample_threads, 1, sample_param['layer'], sample_param['neighbor'],
                                     sample_param['strategy']=='recent', sample_param['prop_time'],
                                     sample_param['history'], float(sample_param['duration']))
 
-        model.load_state_dict(torch.load(stored_model))
+        model.eval()
 
-        if 'all_on_gpu' in train_param and train_param['all_on_gpu']:
+        if device.type != 'cpu' and 'all_on_gpu' in train_param and train_param['all_on_gpu']:
             if node_feats is not None:
-                node_feats = node_feats.cuda()
+                node_feats = node_feats.to(device)
             if edge_feats is not None:
-                edge_feats = edge_feats.cuda()
+                edge_feats = edge_feats.to(device)
             if mailbox is not None:
-                mailbox.move_to_gpu()
+                mailbox.move_to(device)
         
+        self.device = device
+        self.supervised = supervised
         self.node_feats = node_feats
         self.edge_feats = edge_feats
         self.g = g
@@ -54,72 +89,523 @@ class TemporalGraphModel:
         self.gnn_param = gnn_param
         self.train_param = train_param
         self.model = model
+        # fp32 original of an exported model, the one snapshots store
+        self.float_model = None
         self.mailbox = mailbox
         self.sampler = sampler
         self.processed_edge_id = 0
         self.combine_first = combine_first
+        self.node_embs = None
+        self.node_embs_ts = None
+        # nearest-neighbor index over node_embs and the number of rows it covers
+        self.ann_index = None
+        self.ann_index_size = 0
+        self.num_nodes = g['indptr'].shape[0] - 1
+        self.num_edges = len(df)
+        self.latest_ts = df['time'].max() if len(df) > 0 else 0
+        # edges ingested online, not yet folded into df
+        self.live_edges = []
+        self.add_reverse = g['indices'].shape[0] == 2 * len(df)
+        # self.g misses the edges the sampler got since it was last read back
+        self._graph_stale = False
+        self._edge_feats_buf = None
+        # bumped per node when its embedding changes, and globally when all of them do
+        self.node_version = np.zeros(self.num_nodes, dtype=np.int64)
+        self.state_epoch = 0
+        # the sampler and the mailbox are stateful, only one thread may drive them
+        self.lock = threading.RLock()
+        # called with (stage, seconds) after every timed stage when set
+        self.stage_hook = None
         
     
-    def forward_model_to(self, time):
-        if self.processed_edge_id >= len(self.df):
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the enclosed block and report it to `stage_hook`."""
+        if self.stage_hook is None:
+            yield
             return
-        while self.df.time[self.processed_edge_id] < time:
-            rows = self.df[self.processed_edge_id:min(self.processed_edge_id + self.train_param['batch_size'], len(self.df))]
-            self.model.eval()
-            root_nodes = np.concatenate([rows.src.values, rows.dst.values]).astype(np.int32)
-            ts = np.concatenate([rows.time.values, rows.time.values]).astype(np.float32)
-            if self.sampler is not None:
-                self.sampler.sample(root_nodes, ts)
-                ret = self.sampler.get_ret()
+        start = timer.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_hook(name, timer.perf_counter() - start)
+
+    def _sample(self, root_nodes, ts):
+        with self.stage('sample'):
+            self.sampler.sample(root_nodes, ts)
+            ret = self.sampler.get_ret()
+        if self.stage_hook is not None:
+            for phase in SAMPLER_PHASES:
+                self.stage_hook('sampler_' + phase, getattr(ret[0], phase + '_time')())
+        return ret
+
+    def _prepare_mfgs(self, root_nodes, ts, ret):
+        with self.stage('to_dgl_blocks'):
             if self.gnn_param['arch'] != 'identity':
-                mfgs = to_dgl_blocks(ret, self.sample_param['history'])
+                mfgs = to_dgl_blocks(ret, self.sample_param['history'], device=self.device)
             else:
-                mfgs = node_to_dgl_blocks(root_nodes, ts)
+                mfgs = node_to_dgl_blocks(root_nodes, ts, device=self.device)
+        with self.stage('prepare_input'):
             mfgs = prepare_input(mfgs, self.node_feats, self.edge_feats, combine_first=self.combine_first)
-            if self.mailbox is not None:
+        if self.mailbox is not None:
+            with self.stage('prep_input_mails'):
                 self.mailbox.prep_input_mails(mfgs[0])
-            with torch.no_grad():
+        return mfgs
+
+    def forward_model_to(self, time):
+        with self.lock:
+            self._forward_model_to(time)
+
+    def _forward_model_to(self, time):
+        if self.processed_edge_id >= len(self.df) or not self.df.time[self.processed_edge_id] < time:
+            return
+        with self.stage('replay'):
+            self._replay_to(time)
+
+    def _replay_to(self, time):
+        while self.df.time[self.processed_edge_id] < time:
+            rows = self.df[self.processed_edge_id:min(self.processed_edge_id + self.train_param['batch_size'], len(self.df))]
+            self._process_edges(rows.src.values, rows.dst.values, rows.time.values, rows['Unnamed: 0'].values)
+            self.processed_edge_id += self.train_param['batch_size']
+            if self.processed_edge_id >= len(self.df):
+                return
+
+    def _process_edges(self, src, dst, time, eid):
+        self.model.eval()
+        root_nodes = np.concatenate([src, dst]).astype(np.int32)
+        ts = np.concatenate([time, time]).astype(np.float32)
+        ret = None
+        if self.sampler is not None:
+            ret = self._sample(root_nodes, ts)
+        mfgs = self._prepare_mfgs(root_nodes, ts, ret)
+        with torch.no_grad():
+            with self.stage('forward'):
                 _, _ = self.model(mfgs, neg_samples = 0)
-                if self.mailbox is not None:
-                    eid = rows['Unnamed: 0'].values
+            if self.mailbox is not None:
+                with self.stage('memory_update'):
                     mem_edge_feats = self.edge_feats[eid] if self.edge_feats is not None else None
                     block = None
                     if self.memory_param['deliver_to'] == 'neighbors':
-                        block = to_dgl_blocks(ret, self.sample_param['history'], reverse=True)[0][0]
+                        block = to_dgl_blocks(ret, self.sample_param['history'], reverse=True, device=self.device)[0][0]
                     self.mailbox.update_mailbox(self.model.memory_updater.last_updated_nid, self.model.memory_updater.last_updated_memory, root_nodes, ts, mem_edge_feats, block, neg_samples = 0)
                     self.mailbox.update_memory(self.model.memory_updater.last_updated_nid, self.model.memory_updater.last_updated_memory, root_nodes, self.model.memory_updater.last_updated_ts, neg_samples = 0)
-            self.processed_edge_id += self.train_param['batch_size']
-            if self.processed_edge_id >= len(self.df):
-                return
+
+    def add_edges(self, src, dst, time, edge_feats = None):
+        """Append time-ordered edges and push them through the memory online.
+
+        The edges are added to the sampler's CSR and to the edge features, and
+        then run through the same mailbox/memory update as the replay, so the
+        cost is proportional to the batch rather than to the history. Rows of
+        the embedding table belonging to the endpoints are refreshed; call
+        materialize_embeddings for a full refresh.
+        """
+        src = np.asarray(src, dtype=np.int32)
+        dst = np.asarray(dst, dtype=np.int32)
+        time = np.asarray(time)
+        if len(src) == 0:
+            return
+        order = np.argsort(time, kind='stable')
+        src, dst, time = src[order], dst[order], time[order]
+        if edge_feats is not None:
+            edge_feats = edge_feats[torch.from_numpy(order)]
+
+        with self.lock:
+            # everything ingested so far must be in memory before the new edges
+            self._forward_model_to(np.inf)
+            if time[0] < self.latest_ts:
+                raise ValueError('edges must not be older than the latest edge at {}'.format(self.latest_ts))
+
+            num_nodes = max(self.num_nodes, int(src.max()) + 1, int(dst.max()) + 1)
+            if num_nodes > self.num_nodes:
+                self._grow_nodes(num_nodes)
+            eid = np.arange(self.num_edges, self.num_edges + len(src), dtype=np.int64)
+            if self.edge_feats is not None:
+                self._append_edge_feats(edge_feats)
+            if self.sampler is not None:
+                ts = time.astype(np.float32)
+                if self.add_reverse:
+                    # same per-node order as gen_graph.py --add_reverse
+                    self.sampler.add_edges(np.stack([src, dst], 1).ravel(), np.stack([dst, src], 1).ravel(),
+                                           np.repeat(eid, 2), np.repeat(ts, 2))
+                else:
+                    self.sampler.add_edges(src, dst, eid, ts)
+                self._graph_stale = True
+
+            self.live_edges.append(pd.DataFrame({
+                'Unnamed: 0': eid,
+                'time': time,
+                'src': src,
+                'dst': dst,
+            }).reindex(columns=self.df.columns, fill_value=0))
+            self.num_edges += len(src)
+            self.latest_ts = time[-1]
+
+            batch_size = self.train_param['batch_size']
+            for start in range(0, len(src), batch_size):
+                end = start + batch_size
+                self._process_edges(src[start:end], dst[start:end], time[start:end], eid[start:end])
+
+            if self.node_embs is not None:
+                nodes = np.unique(np.concatenate([src, dst]))
+                ts = np.repeat(self.latest_ts, len(nodes)).astype(np.float32)
+                self.node_embs[torch.from_numpy(nodes).long()] = self._get_node_emb(nodes, ts)
+                self.node_embs_ts = self.latest_ts
+                self.node_version[nodes] += 1
+            else:
+                # embeddings are computed on the fly at the latest time, any of them may have moved
+                self.state_epoch += 1
+
+    def _grow_nodes(self, num_nodes):
+        if self.mailbox is not None:
+            self.mailbox.resize(num_nodes)
+        if self.node_embs is not None:
+            self.node_embs = torch.cat([self.node_embs, torch.zeros((num_nodes - self.num_nodes, self.node_embs.shape[1]))])
+        self.node_version = np.concatenate([self.node_version, np.zeros(num_nodes - self.num_nodes, dtype=np.int64)])
+        self.num_nodes = num_nodes
+
+    def _append_edge_feats(self, edge_feats):
+        end = self.num_edges + edge_feats.shape[0]
+        if self._edge_feats_buf is None or end > self._edge_feats_buf.shape[0]:
+            # grow geometrically so appends stay amortised O(batch)
+            buf = torch.empty((max(end, 2 * self.num_edges), self.edge_feats.shape[1]), dtype=self.edge_feats.dtype, device=self.edge_feats.device)
+            buf[:self.num_edges] = self.edge_feats
+            self._edge_feats_buf = buf
+        self._edge_feats_buf[self.num_edges:end] = edge_feats.to(self._edge_feats_buf)
+        self.edge_feats = self._edge_feats_buf[:end]
+
+    def _current_graph(self):
+        """The T-CSR with every edge added so far, read back from the sampler,
+        which owns the graph once edges have been added online."""
+        if self._graph_stale:
+            self.g = dict(zip(GRAPH_ARRAYS, self.sampler.csr()))
+            self._graph_stale = False
+        return self.g
+
+    def _fold_live_edges(self):
+        if self.live_edges:
+            processed = self.processed_edge_id >= len(self.df)
+            self.df = pd.concat([self.df] + self.live_edges, ignore_index=True)
+            self.live_edges = []
+            if processed:
+                self.processed_edge_id = len(self.df)
 
     def get_node_emb(self, root_nodes, ts):
-        self.forward_model_to(ts[-1])
+        with self.lock:
+            return self._get_node_emb(root_nodes, ts)
+
+    def _get_node_emb(self, root_nodes, ts):
+        self._forward_model_to(ts[-1])
+        ret = None
         if self.sampler is not None:
-            self.sampler.sample(root_nodes, ts)
-            ret = self.sampler.get_ret()
-        if self.gnn_param['arch'] != 'identity':
-            mfgs = to_dgl_blocks(ret, self.sample_param['history'])
-        else:
-            mfgs = node_to_dgl_blocks(root_nodes, ts)
-        mfgs = prepare_input(mfgs, self.node_feats, self.edge_feats, combine_first=self.combine_first)
-        if self.mailbox is not None:
-            self.mailbox.prep_input_mails(mfgs[0])
-        with torch.no_grad():
+            ret = self._sample(root_nodes, ts)
+        mfgs = self._prepare_mfgs(root_nodes, ts, ret)
+        with torch.no_grad(), self.stage('forward'):
             ret = self.model.get_emb(mfgs)
         return ret.detach().cpu()
     
+    def materialize_embeddings(self, batch_size = 10000, path = None):
+        """Compute the final-time embedding of every node in large batches.
+
+        The result is kept as one contiguous (num_nodes, dim_out) float32 table,
+        backed by a .npy memory map when `path` is given, so that predictions
+        reduce to two row lookups plus the edge classifier. The file is written
+        under a name of its own and renamed to `path`, so processes already
+        mapping `path` keep reading the table they mapped.
+        """
+        ts_max = self.latest_ts
+        self.forward_model_to(ts_max)
+        num_nodes = self.num_nodes
+        shape = (num_nodes, self.gnn_param['dim_out'])
+        if path is None:
+            embs = np.empty(shape, dtype=np.float32)
+        else:
+            tmp = '{}.{}.tmp'.format(path, os.getpid())
+            embs = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float32, shape=shape)
+        for start in range(0, num_nodes, batch_size):
+            root_nodes = np.arange(start, min(start + batch_size, num_nodes), dtype=np.int32)
+            ts = np.repeat(ts_max, len(root_nodes)).astype(np.float32)
+            embs[start:start + len(root_nodes)] = self.get_node_emb(root_nodes, ts).numpy()
+        if path is not None:
+            embs.flush()
+            del embs
+            # copy-on-write, like load_embeddings: online updates never reach the file
+            embs = np.load(tmp, mmap_mode='c')
+            os.replace(tmp, path)
+        self.node_embs = torch.from_numpy(embs)
+        self.node_embs_ts = ts_max
+        self.state_epoch += 1
+        self._rebuild_ann_index()
+
+    def load_embeddings(self, path):
+        # copy-on-write map: pages are shared with the file until written to
+        self.node_embs = torch.from_numpy(np.load(path, mmap_mode='c'))
+        self.node_embs_ts = self.latest_ts
+        self.state_epoch += 1
+        self._rebuild_ann_index()
+
+    def build_ann_index(self, **kwargs):
+        """Cluster the embedding table into an IVFIndex used by find_opponents.
+
+        Keyword arguments go to IVFIndex. The index is rebuilt with the same
+        parameters whenever the whole table is recomputed; rows added or
+        refreshed online are still scored with their current embedding.
+        """
+        if self.node_embs is None:
+            raise ValueError('no embedding table, call materialize_embeddings first')
+        with self.lock:
+            self.ann_index = IVFIndex(**kwargs)
+            self._rebuild_ann_index()
+
+    def _rebuild_ann_index(self):
+        if self.ann_index is not None:
+            self.ann_index.build(self.node_embs)
+            self.ann_index_size = self.node_embs.shape[0]
+
+    def snapshot(self, path):
+        """Write the current serving state into the directory `path`.
+
+        Graph, features, mailbox, sampler pointers and embeddings are stored as
+        plain .npy files so that `restore` can memory-map them instead of
+        re-parsing the dataset and replaying the whole history. The sampler
+        reads the mapped graph in place until edges are added to it.
+        """
+        with self.lock:
+            tmp = path.rstrip('/') + '.tmp'
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+
+            def save(name, arr):
+                np.save(os.path.join(tmp, name + '.npy'), arr)
+
+            self._fold_live_edges()
+            g = self._current_graph()
+            for key in GRAPH_ARRAYS:
+                save('g_' + key, g[key].astype(GRAPH_DTYPES[key], copy=False))
+            for i, column in enumerate(self.df.columns):
+                save('df_{}'.format(i), self.df[column].values)
+            if self.node_feats is not None:
+                save('node_feats', self.node_feats.cpu().numpy())
+            if self.edge_feats is not None:
+                save('edge_feats', self.edge_feats.cpu().numpy())
+            if self.mailbox is not None:
+                for name in MAILBOX_STATE:
+                    save(name, getattr(self.mailbox, name).cpu().numpy())
+            ts_ptr = self.sampler.get_ts_ptr() if self.sampler is not None else []
+            for i, ptr in enumerate(ts_ptr):
+                save('ts_ptr_{}'.format(i), ptr)
+            if self.node_embs is not None:
+                save('node_embs', self.node_embs.numpy())
+            model = self.model if self.float_model is None else self.float_model
+            torch.save(model.state_dict(), os.path.join(tmp, 'model.pt'))
+
+            manifest = {
+                'format': SNAPSHOT_FORMAT,
+                'params': [self.sample_param, self.memory_param, self.gnn_param, self.train_param],
+                'supervised': self.supervised,
+                'processed_edge_id': int(self.processed_edge_id),
+                'df_columns': list(self.df.columns),
+                'num_ts_ptr': len(ts_ptr),
+            }
+            with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+                json.dump(manifest, f, indent=2)
+
+            shutil.rmtree(path, ignore_errors=True)
+            os.rename(tmp, path)
+
+    @classmethod
+    def restore(cls, path, device = None, num_threads = None):
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest['format'] != SNAPSHOT_FORMAT:
+            raise ValueError('snapshot {} has format {}, expected {}'.format(path, manifest['format'], SNAPSHOT_FORMAT))
+
+        def load(name, tensor=False):
+            filename = os.path.join(path, name + '.npy')
+            if not os.path.exists(filename):
+                return None
+            # copy-on-write map: pages are shared with the file until written to
+            arr = np.load(filename, mmap_mode='c')
+            return torch.from_numpy(arr) if tensor else arr
+
+        g = {key: load('g_' + key) for key in GRAPH_ARRAYS}
+        df = pd.DataFrame({column: load('df_{}'.format(i)) for i, column in enumerate(manifest['df_columns'])}, copy=False)
+        mailbox_state = None
+        if os.path.exists(os.path.join(path, MAILBOX_STATE[0] + '.npy')):
+            mailbox_state = {'_' + name: load(name, tensor=True) for name in MAILBOX_STATE}
+
+        tgm = cls.__new__(cls)
+        tgm._setup(load('node_feats', tensor=True), load('edge_feats', tensor=True), g, df,
+                   manifest['params'], manifest['supervised'], device, num_threads, mailbox_state)
+        tgm.model.load_state_dict(torch.load(os.path.join(path, 'model.pt'), map_location=tgm.device))
+        if tgm.sampler is not None and manifest['num_ts_ptr'] > 0:
+            tgm.sampler.set_ts_ptr([load('ts_ptr_{}'.format(i)) for i in range(manifest['num_ts_ptr'])])
+        tgm.processed_edge_id = manifest['processed_edge_id']
+        node_embs = load('node_embs', tensor=True)
+        if node_embs is not None:
+            tgm.node_embs = node_embs
+            tgm.node_embs_ts = tgm.latest_ts
+        return tgm
+
+    def export_for_inference(self, quantize = True, script = True, num_samples = 1024, atol = 0.05):
+        """Swap in an int8 quantized and/or TorchScript-compiled copy of the model.
+
+        The exported model is checked against the fp32 one on a sample of nodes
+        and random pairings at the latest time. If the outcome probabilities
+        differ by more than `atol` the fp32 model is kept and ValueError raised.
+        Returns the measured differences.
+        """
+        if self.device.type != 'cpu':
+            raise ValueError('inference export targets CPU, model is on {}'.format(self.device))
+        with self.lock:
+            self._forward_model_to(self.latest_ts)
+            reference = self.model
+            exported = export_model(reference, quantize=quantize, script=script)
+
+            rng = np.random.default_rng(0)
+            nodes = np.unique(rng.integers(0, self.num_nodes, size=min(num_samples, self.num_nodes)))
+            ts = np.repeat(self.latest_ts, len(nodes)).astype(np.float32)
+            white = torch.from_numpy(rng.permutation(len(nodes)))
+            game_feats = torch.from_numpy(rng.choice([0.05, 0.25, 0.5, 1.5], size=(len(nodes), 1)).astype(np.float32))
+            game_feats = torch.cat([game_feats, torch.zeros_like(game_feats)], 1)
+
+            parity = {}
+            probs = []
+            for model in (reference, exported):
+                self.model = model
+                embs = self._get_node_emb(nodes, ts)
+                probs.append((embs, self.model.classify_edge(embs[white], embs, game_feats)))
+            parity['embedding_max_abs_diff'] = max_abs_diff(probs[0][0], probs[1][0])
+            parity['probability_max_abs_diff'] = max_abs_diff(probs[0][1], probs[1][1])
+
+            if parity['probability_max_abs_diff'] > atol:
+                self.model = reference
+                raise ValueError('exported model is off by {:.4f} > {} from fp32'.format(parity['probability_max_abs_diff'], atol))
+            self.model = exported
+            self.float_model = reference
+            return parity
+
+    def state_tag(self, white_node, black_node):
+        """Identifies the model state a prediction for this pair depends on."""
+        return (self.state_epoch, int(self.node_version[white_node]), int(self.node_version[black_node]))
+
+    def find_opponents(self, node, k, time_control, num_candidates = None, num_probes = None, batch_size = 65536):
+        """The `k` nodes whose game against `node` is predicted closest to even.
+
+        A candidate's imbalance is |P(win) - P(loss)| averaged over both colour
+        assignments. Without `num_candidates` (or an ANN index) every node in
+        the embedding table is scored; otherwise only the `num_candidates`
+        nearest to `node` in embedding space, plus nodes added since the index
+        was built. Returns (nodes, imbalance, probs as white, probs as black).
+        """
+        if self.node_embs is None:
+            raise ValueError('no embedding table, call materialize_embeddings first')
+        with self.lock, torch.no_grad(), self.stage('matchmaking'):
+            node_embs = self.node_embs
+            query = node_embs[node]
+            if self.ann_index is not None and num_candidates:
+                candidates, _ = self.ann_index.search(node_embs, query, num_candidates + 1, num_probes)
+                candidates = torch.cat([candidates, torch.arange(self.ann_index_size, node_embs.shape[0])])
+            else:
+                candidates = torch.arange(node_embs.shape[0])
+            candidates = candidates[candidates != node]
+
+            game_feats = self._game_feats([time_control])
+            as_white, as_black = [], []
+            for start in range(0, len(candidates), batch_size):
+                opponents = node_embs[candidates[start:start + batch_size]]
+                n = opponents.shape[0]
+                as_white.append(self.model.classify_edge(query.expand(n, -1), opponents, game_feats.expand(n, -1)))
+                as_black.append(self.model.classify_edge(opponents, query.expand(n, -1), game_feats.expand(n, -1)))
+        if len(candidates) == 0:
+            return [], [], [], []
+        as_white = torch.cat(as_white)
+        as_black = torch.cat(as_black)
+        imbalance = ((as_white[:, 0] - as_white[:, 1]).abs() + (as_black[:, 0] - as_black[:, 1]).abs()) / 2
+        imbalance, top = torch.topk(imbalance, min(k, len(candidates)), largest=False)
+        return candidates[top].tolist(), imbalance.tolist(), as_white[top].tolist(), as_black[top].tolist()
+
+    def reference_panel(self, size, min_degree = 10, seed = 0):
+        """Seeded sample of `size` nodes with at least `min_degree` edges in the graph."""
+        with self.lock:
+            degree = np.diff(self._current_graph()['indptr'])
+        nodes = np.nonzero(degree >= min_degree)[0]
+        if len(nodes) < size:
+            nodes = np.arange(len(degree))
+        rng = np.random.default_rng(seed)
+        return np.sort(rng.choice(nodes, size=min(size, len(nodes)), replace=False))
+
+    def expected_scores(self, nodes, panel_embs, time_control, batch_size = 65536):
+        """Mean expected score (win + draw/2) of each node against every panel
+        embedding, averaged over both colour assignments."""
+        if self.node_embs is None:
+            raise ValueError('no embedding table, call materialize_embeddings first')
+        nodes = torch.as_tensor(nodes, dtype=torch.long)
+        num_panel = panel_embs.shape[0]
+        nodes_per_batch = max(1, batch_size // num_panel)
+        game_feats = self._game_feats([time_control])
+        scores = []
+        with self.lock, torch.no_grad():
+            for start in range(0, len(nodes), nodes_per_batch):
+                embs = self.node_embs[nodes[start:start + nodes_per_batch]]
+                n = embs.shape[0]
+                # every node of the batch against every panel member, node-major
+                players = embs.repeat_interleave(num_panel, 0)
+                opponents = panel_embs.repeat(n, 1)
+                feats = game_feats.expand(n * num_panel, -1)
+                as_white = self.model.classify_edge(players, opponents, feats)
+                as_black = self.model.classify_edge(opponents, players, feats)
+                score = (as_white[:, 0] + as_black[:, 1] + (as_white[:, 2] + as_black[:, 2]) / 2) / 2
+                scores.append(score.reshape(n, num_panel).mean(1))
+        return torch.cat(scores).numpy() if scores else np.zeros(0, dtype=np.float32)
+
+    def _game_feats(self, time_controls):
+        time_controls = np.asarray(time_controls, dtype=np.float32).reshape(-1, 2)
+        return torch.from_numpy(np.stack([time_controls[:, 0]*60/1200, time_controls[:, 1]/10], axis=1))
+
     def get_prediction(self, white_node, black_node, time_control):
-        
-        root_nodes = np.array([white_node, black_node])
-        ts = np.repeat(self.timestamps().max(), len(root_nodes))
-        node_embs = self.get_node_emb(root_nodes, ts)
-        white_emb = node_embs[0:1, :]
-        black_emb = node_embs[1:2, :]
-        
-        game_feats = torch.tensor([[time_control[0]*60/1200, time_control[1]/10]])
-        return self.model.classify_edge(white_emb, black_emb, game_feats).tolist()[0]
+        return self.get_predictions([white_node], [black_node], [time_control])[0]
+
+    def get_predictions(self, white_nodes, black_nodes, time_controls):
+        white_nodes = np.asarray(white_nodes, dtype=np.int64)
+        black_nodes = np.asarray(black_nodes, dtype=np.int64)
+        if self.node_embs is not None:
+            with self.stage('embedding_lookup'):
+                white_embs = self.node_embs[torch.from_numpy(white_nodes)]
+                black_embs = self.node_embs[torch.from_numpy(black_nodes)]
+        else:
+            # one forward pass over the unique players of the whole batch
+            root_nodes, inv = np.unique(np.concatenate([white_nodes, black_nodes]), return_inverse=True)
+            ts = np.repeat(self.latest_ts, len(root_nodes))
+            node_embs = self.get_node_emb(root_nodes, ts)
+            inv = torch.from_numpy(inv)
+            white_embs = node_embs[inv[:len(white_nodes)]]
+            black_embs = node_embs[inv[len(white_nodes):]]
+
+        with torch.no_grad(), self.stage('classify_edge'):
+            return self.model.classify_edge(white_embs, black_embs, self._game_feats(time_controls)).tolist()
+
+    def memory_usage(self):
+        """Approximate bytes held by the graph, features, memory, embeddings and weights."""
+        # once edges were added online edge_feats is a view into the buffer
+        edge_feats = self.edge_feats if self._edge_feats_buf is None else self._edge_feats_buf
+        arrays = [self.node_feats, edge_feats, self.node_embs, self.node_version]
+        with self.lock:
+            graph = self._current_graph()
+        arrays += [graph[key] for key in GRAPH_ARRAYS]
+        if self.mailbox is not None:
+            arrays += [getattr(self.mailbox, name) for name in MAILBOX_STATE]
+        arrays += list(self.model.state_dict().values())
+        total = int(self.df.memory_usage(index=False).sum())
+        for arr in arrays:
+            if isinstance(arr, torch.Tensor):
+                total += arr.element_size() * arr.nelement()
+            elif arr is not None:
+                total += arr.nbytes
+        return total
 
     def graph(self):
+        with self.lock:
+            self._fold_live_edges()
         return self.df, self.edge_feats
     
     def node_count(self):
@@ -76,7 +76,9 @@ class GeneralModel(torch.nn.Module):
     
     def classify_edge(self, white_emb, black_emb,  game_feats):
         emb = torch.cat((white_emb, black_emb, game_feats), 1)
-        return self.edge_classifier(emb.cuda().float()).softmax(dim=1).cpu()
+        # quantized layers keep no float weights, go by the remaining parameters
+        device = next(self.parameters()).device
+        return self.edge_classifier(emb.to(device).float()).softmax(dim=1).cpu()
 
     def get_emb(self, mfgs):
         if self.memory_param['type'] == 'node':
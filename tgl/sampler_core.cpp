@@ -1,5 +1,7 @@
 #include <iostream>
 #include <string>
+#include <stdexcept>
+#include <algorithm>
 #include <cstdlib>
 #include <random>
 #include <omp.h>
@@ -40,13 +42,84 @@ class TemporalGraphBlock
                            nodes(_nodes), dim_in(_dim_in), dim_out(_dim_out) {}
 };
 
+template<typename T>
+using NumpyArray = py::array_t<T, py::array::c_style | py::array::forcecast>;
+
+template<typename T>
+class GraphArray
+{
+    // one array of the T-CSR. It borrows the buffer of the numpy array it was
+    // built from, so a graph memory-mapped from a snapshot is read in place and
+    // its pages are shared by every process mapping the same file. The first
+    // change copies it into memory of its own.
+    public:
+        NumpyArray<T> borrowed;
+        std::vector<T> owned;
+        const T *ptr = nullptr;
+        std::size_t len = 0;
+        bool is_borrowed = false;
+
+        GraphArray(){}
+
+        GraphArray(NumpyArray<T> arr) : borrowed(arr)
+        {
+            ptr = borrowed.data();
+            len = borrowed.size();
+            is_borrowed = true;
+        }
+
+        inline const T &operator[](std::size_t i) const { return ptr[i]; }
+        inline const T *begin() const { return ptr; }
+        inline const T *end() const { return ptr + len; }
+        inline std::size_t size() const { return len; }
+
+        std::vector<T> &own()
+        {
+            if (is_borrowed)
+            {
+                owned.assign(begin(), end());
+                release();
+            }
+            return owned;
+        }
+
+        void release()
+        {
+            // drop the reference to the numpy array, and with it the mapping
+            borrowed = NumpyArray<T>(0);
+            is_borrowed = false;
+        }
+
+        // call after changing the vector returned by own()
+        void sync()
+        {
+            ptr = owned.data();
+            len = owned.size();
+        }
+
+        void assign(std::vector<T> &&values)
+        {
+            release();
+            owned = std::move(values);
+            sync();
+        }
+
+        py::array numpy() const
+        {
+            return py::array_t<T>(len, ptr);
+        }
+};
+
+typedef NumpyArray<EdgeIDType> EdgeIDArray;
+typedef NumpyArray<TimeStampType> TimeStampArray;
+
 class ParallelSampler
 {
     public:
-        std::vector<EdgeIDType> indptr;
-        std::vector<EdgeIDType> indices;
-        std::vector<EdgeIDType> eid;
-        std::vector<TimeStampType> ts;
+        GraphArray<EdgeIDType> indptr;
+        GraphArray<EdgeIDType> indices;
+        GraphArray<EdgeIDType> eid;
+        GraphArray<TimeStampType> ts;
         NodeIDType num_nodes;
         EdgeIDType num_edges;
         int num_thread_per_worker;
@@ -62,8 +135,8 @@ class ParallelSampler
         omp_lock_t *ts_ptr_lock;
         std::vector<TemporalGraphBlock> ret;
 
-        ParallelSampler(std::vector<EdgeIDType> &_indptr, std::vector<EdgeIDType> &_indices,
-                        std::vector<EdgeIDType> &_eid, std::vector<TimeStampType> &_ts,
+        ParallelSampler(EdgeIDArray _indptr, EdgeIDArray _indices,
+                        EdgeIDArray _eid, TimeStampArray _ts,
                         int _num_thread_per_worker, int _num_workers, int _num_layers,
                         std::vector<int> &_num_neighbors, bool _recent, bool _prop_time,
                         int _num_history, TimeStampType _window_duration) :
@@ -100,6 +173,76 @@ class ParallelSampler
             }
         }
 
+        void add_edges(std::vector<NodeIDType> &src, std::vector<NodeIDType> &dst,
+                       std::vector<EdgeIDType> &new_eid, std::vector<TimeStampType> &new_ts)
+        {
+            // new edges must not be older than the ones already in the graph, so
+            // they go to the end of their source node's neighbor list
+            NodeIDType new_num_nodes = num_nodes;
+            for (std::vector<NodeIDType>::size_type i = 0; i < src.size(); i++)
+                new_num_nodes = std::max(new_num_nodes, std::max(src[i], dst[i]) + 1);
+            std::vector<EdgeIDType> new_indptr(new_num_nodes + 1, 0);
+            for (auto n : src)
+                new_indptr[n + 1]++;
+            for (NodeIDType n = 0; n < new_num_nodes; n++)
+            {
+                EdgeIDType deg = n < num_nodes ? indptr[n + 1] - indptr[n] : 0;
+                new_indptr[n + 1] += new_indptr[n] + deg;
+            }
+            EdgeIDType new_num_edges = num_edges + src.size();
+            // a borrowed graph is copied here, the numpy arrays are never written to
+            std::vector<EdgeIDType> &indices = this->indices.own();
+            std::vector<EdgeIDType> &eid = this->eid.own();
+            std::vector<TimeStampType> &ts = this->ts.own();
+            indices.resize(new_num_edges);
+            eid.resize(new_num_edges);
+            ts.resize(new_num_edges);
+            // shift the old segments back to front, so nothing is overwritten before it moved
+            for (NodeIDType n = num_nodes - 1; n >= 0; n--)
+            {
+                EdgeIDType beg = indptr[n];
+                EdgeIDType end = indptr[n + 1];
+                EdgeIDType to = new_indptr[n] + end - beg;
+                if (new_indptr[n] == beg)
+                    break;
+                std::move_backward(indices.begin() + beg, indices.begin() + end, indices.begin() + to);
+                std::move_backward(eid.begin() + beg, eid.begin() + end, eid.begin() + to);
+                std::move_backward(ts.begin() + beg, ts.begin() + end, ts.begin() + to);
+            }
+            std::vector<EdgeIDType> cursor(new_num_nodes);
+            for (NodeIDType n = 0; n < new_num_nodes; n++)
+                cursor[n] = new_indptr[n] + (n < num_nodes ? indptr[n + 1] - indptr[n] : 0);
+            for (std::vector<NodeIDType>::size_type i = 0; i < src.size(); i++)
+            {
+                EdgeIDType k = cursor[src[i]]++;
+                indices[k] = dst[i];
+                eid[k] = new_eid[i];
+                ts[k] = new_ts[i];
+            }
+            // the timestamp pointers move with their segments
+            for (auto it = ts_ptr.begin(); it != ts_ptr.end(); it++)
+            {
+                it->resize(new_num_nodes);
+                for (NodeIDType n = 0; n < new_num_nodes; n++)
+                    (*it)[n] = n < num_nodes ? (*it)[n] + new_indptr[n] - indptr[n] : new_indptr[n];
+            }
+            if (new_num_nodes > num_nodes)
+            {
+                for (int i = 0; i < num_nodes; i++)
+                    omp_destroy_lock(&ts_ptr_lock[i]);
+                free(ts_ptr_lock);
+                ts_ptr_lock = (omp_lock_t *)malloc(new_num_nodes * sizeof(omp_lock_t));
+                for (int i = 0; i < new_num_nodes; i++)
+                    omp_init_lock(&ts_ptr_lock[i]);
+            }
+            this->indices.sync();
+            this->eid.sync();
+            this->ts.sync();
+            indptr.assign(std::move(new_indptr));
+            num_nodes = new_num_nodes;
+            num_edges = new_num_edges;
+        }
+
         void update_ts_ptr(int slc, std::vector<NodeIDType> &root_nodes, 
                            std::vector<TimeStampType> &root_ts, float offset)
         {
@@ -392,11 +535,28 @@ PYBIND11_MODULE(sampler_core, m)
         .def("sample_time", [](const TemporalGraphBlock &tgb) { return tgb.sample_time; })
         .def("coo_time", [](const TemporalGraphBlock &tgb) { return tgb.coo_time; });
     py::class_<ParallelSampler>(m, "ParallelSampler")
-        .def(py::init<std::vector<EdgeIDType> &, std::vector<EdgeIDType> &,
-                      std::vector<EdgeIDType> &, std::vector<TimeStampType> &,
+        .def(py::init<EdgeIDArray, EdgeIDArray, EdgeIDArray, TimeStampArray,
                       int, int, int, std::vector<int> &, bool, bool,
                       int, TimeStampType>())
         .def("sample", &ParallelSampler::sample)
         .def("reset", &ParallelSampler::reset)
+        .def("add_edges", &ParallelSampler::add_edges)
+        .def("csr", [](const ParallelSampler &ps) {
+            return py::make_tuple(ps.indptr.numpy(), ps.indices.numpy(), ps.eid.numpy(), ps.ts.numpy()); })
+        .def("borrows_graph", [](const ParallelSampler &ps) {
+            return ps.indptr.is_borrowed && ps.indices.is_borrowed && ps.eid.is_borrowed && ps.ts.is_borrowed; })
+        .def("get_ts_ptr", [](const ParallelSampler &ps) {
+            std::vector<py::array> ptrs;
+            for (auto &ptr : ps.ts_ptr)
+                ptrs.push_back(vec2npy(ptr));
+            return ptrs; })
+        .def("set_ts_ptr", [](ParallelSampler &ps,
+                              std::vector<std::vector<std::vector<EdgeIDType>::size_type>> &ptrs) {
+            if (ptrs.size() != ps.ts_ptr.size())
+                throw std::invalid_argument("wrong number of timestamp pointer arrays");
+            for (auto &ptr : ptrs)
+                if (ptr.size() != ps.indptr.size() - 1)
+                    throw std::invalid_argument("timestamp pointer array does not match the graph");
+            ps.ts_ptr = ptrs; })
         .def("get_ret", [](const ParallelSampler &ps) { return ps.ret; });
 }
\ No newline at end of file
@@ -5,6 +5,11 @@ import dgl
 import time
 import pandas as pd
 import numpy as np
+try:
+    from utils import columnar
+except ImportError:
+    # tgl used on its own, without the preprocessing utilities
+    columnar = None
 
 def load_feat(d, rand_de=0, rand_dn=0):
     node_feats = None
@@ -29,11 +34,27 @@ def load_feat(d, rand_de=0, rand_dn=0):
             edge_feats = torch.randn(7144, rand_dn)
     return node_feats, edge_feats
 
+def load_edges(d):
+    """The edges of a dataset, memory-mapped from its columnar table
+    (edges.cols) when csv_to_input wrote one along with the current
+    edges.csv, parsed from edges.csv otherwise."""
+    if columnar is not None and columnar.fresh('{}/edges.cols'.format(d), '{}/edges.csv'.format(d)):
+        df = columnar.read_table('{}/edges.cols'.format(d))
+        # tables written with int32 edge ids, which torch does not index with
+        df['Unnamed: 0'] = df['Unnamed: 0'].astype(np.int64, copy=False)
+        return df
+    return pd.read_csv('{}/edges.csv'.format(d))
+
 def load_graph(d):
-    df = pd.read_csv('{}/edges.csv'.format(d))
+    df = load_edges(d)
     g = np.load('{}/ext_full.npz'.format(d))
     return g, df
 
+def resolve_device(device=None):
+    if device is None or device == 'auto':
+        device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+    return torch.device(device)
+
 def parse_config(f):
     conf = yaml.safe_load(open(f, 'r'))
     sample_param = conf['sampling'][0]
@@ -42,7 +63,7 @@ def parse_config(f):
     train_param = conf['train'][0]
     return sample_param, memory_param, gnn_param, train_param
 
-def to_dgl_blocks(ret, hist, reverse=False, cuda=True):
+def to_dgl_blocks(ret, hist, reverse=False, device='cuda:0'):
     mfgs = list()
     for r in ret:
         if not reverse:
@@ -56,29 +77,29 @@ def to_dgl_blocks(ret, hist, reverse=False, cuda=True):
             b.edata['dt'] = torch.from_numpy(r.dts())[b.num_src_nodes():]
             b.dstdata['ts'] = torch.from_numpy(r.ts())
         b.edata['ID'] = torch.from_numpy(r.eid())
-        if cuda:
-            mfgs.append(b.to('cuda:0'))
+        if torch.device(device).type != 'cpu':
+            mfgs.append(b.to(device))
         else:
             mfgs.append(b)
     mfgs = list(map(list, zip(*[iter(mfgs)] * hist)))
     mfgs.reverse()
     return mfgs
 
-def node_to_dgl_blocks(root_nodes, ts, cuda=True):
+def node_to_dgl_blocks(root_nodes, ts, device='cuda:0'):
     mfgs = list()
     b = dgl.create_block(([],[]), num_src_nodes=root_nodes.shape[0], num_dst_nodes=root_nodes.shape[0])
     b.srcdata['ID'] = torch.from_numpy(root_nodes)
     b.srcdata['ts'] = torch.from_numpy(ts)
-    if cuda:
-        mfgs.insert(0, [b.to('cuda:0')])
+    if torch.device(device).type != 'cpu':
+        mfgs.insert(0, [b.to(device)])
     else:
         mfgs.insert(0, [b])
     return mfgs
 
-def mfgs_to_cuda(mfgs):
+def mfgs_to_cuda(mfgs, device='cuda:0'):
     for mfg in mfgs:
         for i in range(len(mfg)):
-            mfg[i] = mfg[i].to('cuda:0')
+            mfg[i] = mfg[i].to(device)
     return mfgs
 
 def prepare_input(mfgs, node_feats, edge_feats, combine_first=False, nfeat_buffs=None, efeat_buffs=None, nids=None, eids=None):
@@ -93,7 +114,7 @@ def prepare_input(mfgs, node_feats, edge_feats, combine_first=False, nfeat_buffs
                 uts = unts[:, 0]
                 unid = unts[:, 1]
                 # import pdb; pdb.set_trace()
-                b = dgl.create_block((idx + num_dst, mfgs[0][i].edges()[1]), num_src_nodes=unts.shape[0] + num_dst, num_dst_nodes=num_dst, device=torch.device('cuda:0'))
+                b = dgl.create_block((idx + num_dst, mfgs[0][i].edges()[1]), num_src_nodes=unts.shape[0] + num_dst, num_dst_nodes=num_dst, device=mfgs[0][i].device)
                 b.srcdata['ts'] = torch.cat([mfgs[0][i].srcdata['ts'][:num_dst], uts], dim=0)
                 b.srcdata['ID'] = torch.cat([mfgs[0][i].srcdata['ID'][:num_dst], unid], dim=0)
                 b.edata['dt'] = mfgs[0][i].edata['dt']
@@ -105,14 +126,14 @@ def prepare_input(mfgs, node_feats, edge_feats, combine_first=False, nfeat_buffs
     if node_feats is not None:
         for b in mfgs[0]:
             srch = node_feats[b.srcdata['ID'].long()].float()
-            b.srcdata['h'] = srch.cuda()
+            b.srcdata['h'] = srch.to(b.device)
     i = 0
     if edge_feats is not None:
         for mfg in mfgs:
             for b in mfg:
                 if b.num_src_nodes() > b.num_dst_nodes():
                     srch = edge_feats[b.edata['ID'].long()].float()
-                    b.edata['f'] = srch.cuda()
+                    b.edata['f'] = srch.to(b.device)
     return mfgs
 
 def get_ids(mfgs, node_feats, edge_feats):
@@ -0,0 +1,327 @@
+"""Latency and throughput benchmark for the prediction API.
+
+Targets:
+  app    drive the FastAPI app of api.py in-process through ASGI, no sockets
+  url    HTTP/1.1 keep-alive connections to a running server (--url), or to a
+         uvicorn server started for the run (--spawn)
+  model  call the skill system's predict directly, without the web framework
+
+Each concurrency level of the sweep runs closed-loop clients issuing
+/predict requests for player pairs sampled from edges.csv (so active players
+show up as often as they play), and reports QPS and latency percentiles as
+JSON. With --mock the MockSkill backend is served, which measures the
+framework overhead alone. With --baseline the results are compared against a
+previous report and the exit status is 1 on a regression.
+
+Run from the repository root, e.g.
+  python -m utils.benchmark_api --target app --mock --concurrency 1,8,64
+  python -m utils.benchmark_api --target url --spawn --edges tgl/DATA/LICHESS-2013-06/edges.csv \\
+      --players snapshot/players.npz --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+TIME_CONTROLS = "1+0,3+0,5+0,10+0,15+10"
+
+def sample_games(args):
+    rng = random.Random(args.seed)
+    time_controls = [tuple(int(x) for x in tc.split('+')) for tc in args.time_controls.split(',')]
+    if args.mock:
+        from app.backend.model.mock import MockSkill
+        players = MockSkill.players
+        pairs = [tuple(rng.sample(players, 2)) for _ in range(args.pairs)]
+    else:
+        import pandas as pd
+        from utils.player_statistics import PlayerIndex
+        edges = pd.read_csv(args.edges, usecols=['src', 'dst'])
+        edges = edges[edges.src != edges.dst].sample(n=args.pairs, replace=True, random_state=args.seed)
+        index = PlayerIndex.load(args.players)
+        pairs = [(index.username(src), index.username(dst)) for src, dst in zip(edges.src, edges.dst)]
+    return [(white, black) + rng.choice(time_controls) for white, black in pairs]
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))]
+
+def summarize(concurrency, latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'seconds': elapsed,
+        'qps': (len(latencies) + errors) / elapsed if elapsed > 0 else 0.0,
+        'mean_ms': 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+        'p50_ms': 1000 * percentile(latencies, 50),
+        'p95_ms': 1000 * percentile(latencies, 95),
+        'p99_ms': 1000 * percentile(latencies, 99),
+        'max_ms': 1000 * latencies[-1] if latencies else 0.0,
+    }
+
+def query(game):
+    white, black, min, inc = game
+    return '/predict', urlencode({'white': white, 'black': black, 'min': min, 'inc': inc})
+
+class AsgiClient:
+    """Issues GET requests straight into an ASGI app."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def get(self, path, query_string):
+        done = asyncio.Event()
+        status = None
+        received = False
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # only report the client gone once the response is complete
+            await done.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body' and not message.get('more_body', False):
+                done.set()
+
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'root_path': '',
+            'path': path, 'raw_path': path.encode(), 'query_string': query_string.encode(),
+            'headers': [(b'host', b'benchmark')],
+            'client': ('127.0.0.1', 0), 'server': ('127.0.0.1', 80),
+        }
+        await self.app(scope, receive, send)
+        return status
+
+    async def close(self):
+        pass
+
+class HttpClient:
+    """Minimal HTTP/1.1 client over one keep-alive connection."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def get(self, path, query_string):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write('GET {}?{} HTTP/1.1\r\nHost: {}\r\n\r\n'.format(path, query_string, self.host).encode())
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode().partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection') == 'close':
+            await self.close()
+        return status
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+async def run_level(make_client, games, concurrency, requests, warmup):
+    position = 0
+    latencies = []
+    errors = 0
+
+    async def client_loop(count, record):
+        nonlocal position, errors
+        client = make_client()
+        try:
+            for _ in range(count):
+                game = games[position % len(games)]
+                position += 1
+                start = time.perf_counter()
+                try:
+                    status = await client.get(*query(game))
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    status = None
+                    await client.close()
+                elapsed = time.perf_counter() - start
+                if not record:
+                    continue
+                if status == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+        finally:
+            await client.close()
+
+    def split(total):
+        return [total // concurrency + (i < total % concurrency) for i in range(concurrency)]
+
+    await asyncio.gather(*(client_loop(count, False) for count in split(warmup)))
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(count, True) for count in split(requests)))
+    return summarize(concurrency, latencies, errors, time.perf_counter() - start)
+
+def run_model_level(skill_system, games, concurrency, requests, warmup):
+    position = iter(range(warmup + requests))
+    latencies = []
+    errors = [0]
+
+    def worker(count, record):
+        for _ in range(count):
+            white, black, min, inc = games[next(position) % len(games)]
+            start = time.perf_counter()
+            try:
+                skill_system.predict(white, black, (min, inc))
+                ok = True
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            if record:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    def split(total):
+        return [total // concurrency + (i < total % concurrency) for i in range(concurrency)]
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(lambda count: worker(count, False), split(warmup)))
+        start = time.perf_counter()
+        list(pool.map(lambda count: worker(count, True), split(requests)))
+    return summarize(concurrency, latencies, errors[0], time.perf_counter() - start)
+
+def spawn_server(args):
+    port = urlsplit(args.url).port or 80
+    server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'api:app', '--port', str(port),
+                               '--workers', str(args.workers), '--log-level', 'warning'])
+    deadline = time.monotonic() + args.startup_timeout
+
+    async def ready():
+        client = HttpClient(urlsplit(args.url).hostname, port)
+        try:
+            return await client.get('/', '') == 200
+        except OSError:
+            return False
+        finally:
+            await client.close()
+
+    while not asyncio.run(ready()):
+        if server.poll() is not None or time.monotonic() > deadline:
+            server.kill()
+            raise RuntimeError('uvicorn did not come up on {}'.format(args.url))
+        time.sleep(0.5)
+    return server
+
+async def run_app(args, games, levels):
+    import api
+    # runs the startup/shutdown handlers whichever way starlette wires them
+    async with api.app.router.lifespan_context(api.app):
+        return [await run_level(lambda: AsgiClient(api.app), games, c, args.requests, args.warmup) for c in levels]
+
+def run(args):
+    if args.mock:
+        os.environ['DEEPSKILL_BACKEND'] = 'mock'
+    games = sample_games(args)
+    levels = [int(c) for c in args.concurrency.split(',')]
+
+    if args.target == 'app':
+        return asyncio.run(run_app(args, games, levels))
+    if args.target == 'model':
+        if args.mock:
+            from app.backend.model.mock import MockSkill
+            skill_system = MockSkill()
+        else:
+            from app.backend.model.tgl import TGLDeepSkill
+            skill_system = TGLDeepSkill()
+        return [run_model_level(skill_system, games, c, args.requests, args.warmup) for c in levels]
+
+    server = spawn_server(args) if args.spawn else None
+    try:
+        url = urlsplit(args.url)
+        make_client = lambda: HttpClient(url.hostname, url.port or 80)
+        return [asyncio.run(run_level(make_client, games, c, args.requests, args.warmup)) for c in levels]
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+def regressions(results, baseline, tolerance):
+    """Levels whose QPS dropped or p99 latency rose by more than `tolerance`."""
+    previous = {level['concurrency']: level for level in baseline['results']}
+    found = []
+    for level in results:
+        before = previous.get(level['concurrency'])
+        if before is None:
+            continue
+        if level['qps'] < before['qps'] * (1 - tolerance):
+            found.append('concurrency {}: qps {:.1f} < baseline {:.1f}'.format(level['concurrency'], level['qps'], before['qps']))
+        if level['p99_ms'] > before['p99_ms'] * (1 + tolerance):
+            found.append('concurrency {}: p99 {:.2f}ms > baseline {:.2f}ms'.format(level['concurrency'], level['p99_ms'], before['p99_ms']))
+        if level['errors'] > before['errors']:
+            found.append('concurrency {}: {} errors, baseline had {}'.format(level['concurrency'], level['errors'], before['errors']))
+    return found
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', choices=['app', 'url', 'model'], default='app')
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='server for --target url')
+    parser.add_argument('--spawn', action='store_true', help='start uvicorn on --url for the run')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn workers with --spawn')
+    parser.add_argument('--startup-timeout', type=float, default=600, help='seconds to wait for --spawn')
+    parser.add_argument('--mock', action='store_true', help='serve MockSkill instead of the model')
+    parser.add_argument('--edges', default='tgl/DATA/LICHESS-2013-06/edges.csv', help='edges.csv to sample pairs from')
+    parser.add_argument('--players', help='players.npz of a snapshot, maps node ids to usernames')
+    parser.add_argument('--pairs', type=int, default=10000, help='distinct sampled requests')
+    parser.add_argument('--time-controls', default=TIME_CONTROLS, help='comma separated min+inc')
+    parser.add_argument('--concurrency', default='1,4,16,64', help='comma separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=2000, help='measured requests per level')
+    parser.add_argument('--warmup', type=int, default=200, help='unmeasured requests per level')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON report here as well as to stdout')
+    parser.add_argument('--baseline', help='previous report to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative regression')
+    args = parser.parse_args()
+    if not args.mock and args.players is None:
+        parser.error('--players is required unless --mock is given')
+
+    report = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'results': run(args),
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(report['results'], json.load(f), args.tolerance)
+        for regression in found:
+            print('REGRESSION ' + regression, file=sys.stderr)
+        sys.exit(1 if found else 0)
@@ -0,0 +1,111 @@
+"""Compare the vectorized edge feature and timestamp construction with the
+per-row versions they replaced, on a real month or a synthetic one.
+
+    python utils/benchmark_preprocessing.py --rows 3000000
+    python utils/benchmark_preprocessing.py --csv data/processed/lichess_db_standard_rated_2013-06.csv
+"""
+import argparse
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import torch as pt
+from datetime import datetime
+from pathlib import Path
+from csv_to_input import COLUMNS, RESULTS, prepare_tensor
+from player_statistics import clean_dataframe, sort_by_time
+
+def legacy_prepare_tensor(df, save_path):
+    lst = df.values.tolist()
+
+    def convert_result(result):
+        return RESULTS[result]
+
+    def time_control_normalized(tc):
+        if tc == '-' or tc == '':
+            return 3.0
+        return int(tc.split("+")[0]) / 1200
+
+    def time_control_inc_normalized(tc):
+        if tc == '-' or tc == '':
+            return 0.0
+        return int(tc.split("+")[1]) / 10
+
+    def elo_standardized(elo):
+        return (int(elo) - 1500) / 400
+
+    lst = list(map(lambda l:
+        [convert_result(l[0]),
+         time_control_normalized(l[1]),
+         time_control_inc_normalized(l[1]),
+         elo_standardized(l[2]),
+         elo_standardized(l[3])],
+        lst))
+
+    arr = np.array(lst)
+
+    time_control = pt.from_numpy(arr[:, 1:])
+    one_hot_results = pt.nn.functional.one_hot(pt.from_numpy(arr[:, 0]).to(pt.int64))
+    tensor = pt.cat((one_hot_results, time_control), 1)
+    pt.save(tensor, save_path / "edge_features.pt")
+
+def legacy_sort_by_time(df):
+    df["time"] = df["UTCDate"] + " " + df["UTCTime"]
+    df = df.drop(labels = ["UTCDate", "UTCTime"], axis = 1);
+    df["time"] = df["time"].map(lambda dt: datetime.strptime(dt, '%Y.%m.%d %H:%M:%S'))
+
+    df.sort_values(by = "time", inplace = True)
+    df.reset_index(drop = True, inplace = True)
+
+    first_time = df["time"].iloc[0]
+    df["time"] = (df["time"] - first_time).map(lambda delta: int(delta.total_seconds()))
+    return df
+
+def synthetic_month(rows, seed):
+    rng = np.random.default_rng(seed)
+    seconds = rng.integers(0, 30 * 86400, rows)
+    stamps = pd.Timestamp('2013-06-01') + pd.to_timedelta(seconds, unit='s')
+    return pd.DataFrame({
+        "Event": "Rated Blitz game",
+        "Black": pd.Series(rng.integers(0, rows // 20 + 1, rows)).map("p{}".format),
+        "White": pd.Series(rng.integers(0, rows // 20 + 1, rows)).map("p{}".format),
+        "BlackElo": rng.integers(800, 2800, rows).astype(str),
+        "WhiteElo": rng.integers(800, 2800, rows).astype(str),
+        "UTCDate": stamps.strftime('%Y.%m.%d'),
+        "UTCTime": stamps.strftime('%H:%M:%S'),
+        "Result": rng.choice(list(RESULTS), rows),
+        "TimeControl": rng.choice(["60+0", "180+0", "300+3", "600+0", "-"], rows),
+    })
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--csv', help='processed month to benchmark on')
+    parser.add_argument('--rows', type=int, default=3000000, help='rows of the synthetic month without --csv')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.csv:
+        df = pd.read_csv(args.csv, usecols = COLUMNS, keep_default_na=False)
+    else:
+        df = synthetic_month(args.rows, args.seed)
+    df = clean_dataframe(df)
+    print("{} games".format(len(df)))
+
+    legacy, legacy_seconds = timed(legacy_sort_by_time, df.copy())
+    current, seconds = timed(sort_by_time, df.copy())
+    assert legacy["time"].dtype == current["time"].dtype and legacy["time"].equals(current["time"])
+    print("sort_by_time:   {:8.2f}s -> {:6.2f}s ({:.0f}x), time column identical".format(legacy_seconds, seconds, legacy_seconds / seconds))
+
+    features = current[["Result", "TimeControl", "WhiteElo", "BlackElo"]]
+    with tempfile.TemporaryDirectory() as legacy_dir, tempfile.TemporaryDirectory() as current_dir:
+        _, legacy_seconds = timed(legacy_prepare_tensor, features, Path(legacy_dir))
+        _, seconds = timed(prepare_tensor, features, Path(current_dir))
+        a = pt.load(Path(legacy_dir) / "edge_features.pt")
+        b = pt.load(Path(current_dir) / "edge_features.pt")
+    assert a.dtype == b.dtype and pt.equal(a, b)
+    print("prepare_tensor: {:8.2f}s -> {:6.2f}s ({:.0f}x), edge_features.pt identical".format(legacy_seconds, seconds, legacy_seconds / seconds))
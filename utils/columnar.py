@@ -0,0 +1,163 @@
+"""Columnar tables for the intermediates of the preprocessing pipeline.
+
+A table is a directory with one .npy file per column and a meta.json that
+lists the columns in order. Numeric columns keep the dtype they are written
+with, so writers choose narrow types (int32 ids, int8 splits). String
+columns are dictionary encoded: int32 codes, plus the distinct values as one
+UTF-8 buffer with offsets. Reading memory-maps every array, so opening a
+table only parses meta.json and the distinct strings, and processes reading
+the same table share its pages.
+
+    python utils/columnar.py data/processed/lichess_db_standard_rated_2013-06.csv
+
+converts a csv into the table next to it (here ...2013-06.cols), which
+PlayerStatistics then picks up instead of the csv. A table converted from
+a csv records the csv's size and mtime, and readers fall back to the csv
+once it no longer matches them.
+"""
+import argparse
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+FORMAT = 1
+SUFFIX = ".cols"
+META = "meta.json"
+
+def table_path(path):
+    """The table stored next to a csv: `x.csv` -> `x.cols`."""
+    path = str(path)
+    root, ext = os.path.splitext(path)
+    return root + SUFFIX if ext == ".csv" else path
+
+def exists(path):
+    return os.path.exists(os.path.join(str(path), META))
+
+def _stamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def fresh(path, source):
+    """Whether there is a table at `path` that still matches `source`, the
+    file it was made from. Without the file there is nothing newer to read."""
+    if not exists(path):
+        return False
+    if not os.path.isfile(str(source)):
+        return True
+    with open(os.path.join(str(path), META)) as f:
+        stamp = json.load(f).get("source")
+    if stamp is None:
+        # written without a source, only its age tells
+        return os.path.getmtime(os.path.join(str(path), META)) >= os.path.getmtime(source)
+    return stamp == _stamp(source)
+
+def narrow(name, values, dtype):
+    """`values` cast to `dtype`, refusing integers that do not fit it."""
+    if values.dtype == np.dtype(dtype):
+        return values
+    cast = values.astype(dtype)
+    if np.issubdtype(cast.dtype, np.integer) and not np.array_equal(cast, values):
+        raise ValueError("column {} does not fit in {}".format(name, np.dtype(dtype)))
+    return cast
+
+def write_table(path, columns, dtypes=None, source=None):
+    """Write the columns of a DataFrame, or a dict of arrays, as a table.
+
+    `dtypes` maps column names to the numeric dtype to store them with;
+    string and categorical columns are always dictionary encoded. `source`
+    is the file the columns were read from, for `fresh`. The table is
+    written next to `path` and renamed into place, so readers never see a
+    partial one.
+    """
+    path = str(path)
+    dtypes = dtypes or {}
+    tmp = path.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    def save(name, arr):
+        np.save(os.path.join(tmp, name + ".npy"), arr)
+
+    meta = {"format": FORMAT, "length": None, "columns": [], "source": _stamp(source) if source else None}
+    for i, (name, values) in enumerate(columns.items()):
+        if isinstance(values, pd.Series):
+            values = values.array
+        if isinstance(values, pd.Categorical) or pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+            if not isinstance(values, pd.Categorical):
+                # newer pandas warns when factorizing anything but an array
+                values = np.asarray(values, dtype=object)
+            codes, categories = pd.factorize(values)
+            encoded = [str(category).encode("utf-8") for category in categories]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in encoded], out=offsets[1:])
+            save("{}_codes".format(i), codes.astype(np.int32))
+            save("{}_offsets".format(i), offsets)
+            save("{}_values".format(i), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+            kind, length = "categorical", len(codes)
+        else:
+            values = np.asarray(values)
+            if name in dtypes:
+                values = narrow(name, values, dtypes[name])
+            save(str(i), values)
+            kind, length = values.dtype.str, len(values)
+        if meta["length"] not in (None, length):
+            raise ValueError("column {} has {} rows, expected {}".format(name, length, meta["length"]))
+        meta["length"] = length
+        meta["columns"].append({"name": name, "kind": kind})
+    with open(os.path.join(tmp, META), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmp, path)
+
+def column_names(path):
+    """The columns of a table, in the order they were written."""
+    with open(os.path.join(str(path), META)) as f:
+        return [column["name"] for column in json.load(f)["columns"]]
+
+def read_table(path, columns=None, mmap_mode="c"):
+    """DataFrame over the memory-mapped columns of a table.
+
+    Numeric columns are views of the mapped files; with the default
+    copy-on-write mapping they can be modified without touching the table.
+    String columns come back as pandas categoricals over the mapped codes.
+    """
+    path = str(path)
+    with open(os.path.join(path, META)) as f:
+        meta = json.load(f)
+    if meta["format"] != FORMAT:
+        raise ValueError("table {} has format {}, expected {}".format(path, meta["format"], FORMAT))
+
+    def load(name):
+        return np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+
+    data = {}
+    for i, column in enumerate(meta["columns"]):
+        if columns is not None and column["name"] not in columns:
+            continue
+        if column["kind"] == "categorical":
+            offsets = load("{}_offsets".format(i))
+            buffer = load("{}_values".format(i)).tobytes()
+            categories = [buffer[start:end].decode("utf-8") for start, end in zip(offsets[:-1], offsets[1:])]
+            data[column["name"]] = pd.Categorical.from_codes(load("{}_codes".format(i)), categories)
+        else:
+            data[column["name"]] = load(str(i))
+    if columns is not None:
+        data = {name: data[name] for name in columns}
+    return pd.DataFrame(data, copy=False)
+
+def csv_to_table(csv_path, path=None, dtypes=None):
+    """Convert a csv into a table, by default the one `table_path` names."""
+    path = path or table_path(csv_path)
+    write_table(path, pd.read_csv(csv_path, keep_default_na=False), dtypes, csv_path)
+    return path
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert csv files into columnar tables.')
+    parser.add_argument('csv', nargs='+')
+    args = parser.parse_args()
+
+    for csv_path in args.csv:
+        print(csv_to_table(csv_path))
@@ -1,90 +1,95 @@
 import argparse
 import pickle
+import shutil
+import tempfile
 import pandas as pd
 import numpy as np
 import torch as pt
 from pathlib import Path
+import columnar
+from player_dict import PlayerDictionary
 from player_statistics import sort_by_time, factor_players, clean_dataframe
 
-parser = argparse.ArgumentParser(description='Prepare input data for a specific month.')
-parser.add_argument('month', help='the months to prepare')
-
-args = parser.parse_args()
-
-file_path = Path(__file__).parent
-csv_path = file_path.parent / "data" / "processed"
-save_path = file_path.parent / "tgl" / "DATA" / ("LICHESS-" + args.month)
-save_path.mkdir(parents = True, exist_ok = True)    
-    
-def prepare_tensor(df):
-    lst = df.values.tolist()
-    
-    def convert_result(result):
-        return {
-            "1-0": 0,
-            "0-1": 1,
-            "1/2-1/2": 2,
-        }[result]
-    
-    def time_control_normalized(tc):
-        if tc == '-' or tc == '':
-            return 3.0
-        return int(tc.split("+")[0]) / 1200
-    
-    def time_control_inc_normalized(tc):
-        if tc == '-' or tc == '':
-            return 0.0
-        return int(tc.split("+")[1]) / 10
-
-    def elo_standardized(elo):
-        return (int(elo) - 1500) / 400
-    
-    lst = list(map(lambda l:
-        [convert_result(l[0]),
-         time_control_normalized(l[1]), 
-         time_control_inc_normalized(l[1]),
-         elo_standardized(l[2]),
-         elo_standardized(l[3])],
-        lst))
-    
-    arr = np.array(lst)
-    
-    time_control = pt.from_numpy(arr[:, 1:])
-    one_hot_results = pt.nn.functional.one_hot(pt.from_numpy(arr[:, 0]).to(pt.int64))
-    tensor = pt.cat((one_hot_results, time_control), 1)
+COLUMNS = [
+    "Event",
+    "Black", "White",
+    "BlackElo", "WhiteElo",
+    "UTCDate", "UTCTime",
+    "Result",
+    "TimeControl"]
+RESULTS = {
+    "1-0": 0,
+    "0-1": 1,
+    "1/2-1/2": 2,
+}
+TIME_FORMAT = '%Y.%m.%d %H:%M:%S'
+# one-hot result followed by minutes, increment, white and black elo
+NUM_EDGE_FEATURES = 7
+# edges.cols, the columnar copy of edges.csv; the edge ids keep the name
+# pandas gives the unnamed index column of the csv, and stay int64 since
+# they index the edge features
+EDGE_DTYPES = {
+    "Unnamed: 0": np.int64,
+    "time": np.int32,
+    "src": np.int32,
+    "dst": np.int32,
+    "ext_roll": np.int8,
+}
+
+def edge_features(df):
+    """Float64 (len(df), 7) edge features: one-hot result, minutes / 20,
+    increment / 10 (3 and 0 for games without a clock), standardized elos."""
+    feats = np.zeros((len(df), NUM_EDGE_FEATURES), dtype=np.float64)
+    results, names = pd.factorize(df["Result"])
+    feats[np.arange(len(df)), np.array([RESULTS[name] for name in names])[results]] = 1
+    # a month has a few dozen distinct time controls, parse each once
+    codes, time_controls = pd.factorize(df["TimeControl"].astype(str))
+    parsed = np.array([(3.0, 0.0) if tc == '-' or tc == '' else (int(tc.split("+")[0]) / 1200, int(tc.split("+")[1]) / 10)
+                       for tc in time_controls]).reshape(-1, 2)
+    feats[:, 3:5] = parsed[codes]
+    for column, elo in ((5, "WhiteElo"), (6, "BlackElo")):
+        codes, elos = pd.factorize(df[elo])
+        feats[:, column] = ((elos.astype(np.int64) - 1500) / 400)[codes]
+    return feats
+
+def trim_results(feats, results):
+    """Edge features with the one-hot block only spanning up to the last of
+    `results` that occurs, as one_hot sizes it."""
+    num_results = max(RESULTS[result] for result in results) + 1
+    if num_results == len(RESULTS):
+        return feats
+    return np.delete(feats, np.s_[num_results:len(RESULTS)], axis=1)
+
+def prepare_tensor(df, save_path):
+    feats = edge_features(df)
+    tensor = pt.from_numpy(trim_results(feats, df["Result"].unique()))
     pt.save(tensor, save_path / "edge_features.pt")
     print(tensor.size())
-    
-        
 
-def prepare_input(file):
+def prepare_input(file, save_path, player_dict = None):
     print("Reading CSV...")
-    df = pd.read_csv(file, usecols = [
-        "Event", 
-        "Black", "White",
-        "BlackElo", "WhiteElo", 
-        "UTCDate", "UTCTime", 
-        "Result", 
-        "TimeControl"], 
-        keep_default_na=False)
+    df = pd.read_csv(file, usecols = COLUMNS, keep_default_na=False)
+    prepare_dataframe(df, save_path, player_dict)
+
+def prepare_dataframe(df, save_path, player_dict = None):
     df = clean_dataframe(df)
-    
+
     print("Processing time...")
     df = sort_by_time(df)
-    
+
     print("Preparing tensor...")
-    prepare_tensor(df[["Result", "TimeControl", "WhiteElo", "BlackElo"]])
+    prepare_tensor(df[["Result", "TimeControl", "WhiteElo", "BlackElo"]], save_path)
     df = df.drop(labels = ["WhiteElo", "BlackElo", "Result", "TimeControl"], axis = 1)
-    
+
     print("Factoring players...")
-    codes, uniques = factor_players(df)
+    codes, uniques = factor_players(df, player_dict)
     matches = len(codes) // 2
 
     df = df.drop(labels = ["Event", "Black", "White"], axis = 1)
-    
+
     df["src"] = codes[:matches]
     df["dst"] = codes[matches:]
-        
+
     p50 = len(df) // 2
     p75 = len(df) * 3 // 4
     p100 = len(df)
@@ -92,11 +97,194 @@ def prepare_input(file):
     df["ext_roll"] = 0
     df["ext_roll"].iloc[p50:p75] = 1
     df["ext_roll"].iloc[p75:p100] = 2
-    
+
     print("Saving to CSV")
     df.to_csv(save_path / "edges.csv")
+    print("Saving table")
+    columnar.write_table(save_path / "edges.cols", {"Unnamed: 0": df.index.values, **{name: df[name] for name in df}}, EDGE_DTYPES,
+                         save_path / "edges.csv")
     print(df)
 
-file = list(csv_path.glob('*' + args.month + '*'))[0]
-print(file)
-prepare_input(file)
\ No newline at end of file
+def _sorted_runs(chunks, tmp_path):
+    """Write every cleaned chunk as a run sorted by (time, row) and return
+    the runs together with the provisional player names and the results
+    that occur.
+
+    Players get provisional codes in order of first appearance in the file;
+    the final codes depend on the sorted order and are assigned later.
+    """
+    provisional = {}
+    results = set()
+    runs = []
+    row = 0
+    for i, df in enumerate(chunks):
+        df = clean_dataframe(df)
+        if len(df) == 0:
+            continue
+        time = pd.to_datetime(df["UTCDate"] + " " + df["UTCTime"], format=TIME_FORMAT)
+        time = time.values.astype('datetime64[s]').astype(np.int64)
+        codes, uniques = pd.factorize(pd.concat([df["White"], df["Black"]]))
+        lookup = np.array([provisional.setdefault(name, len(provisional)) for name in uniques], dtype=np.int64)
+        players = lookup[codes]
+        results.update(df["Result"].unique())
+
+        order = np.argsort(time, kind='stable')
+        run = {
+            'time': time[order],
+            'row': np.arange(row, row + len(df), dtype=np.int64)[order],
+            'white': players[:len(df)][order],
+            'black': players[len(df):][order],
+            'feats': edge_features(df)[order],
+        }
+        paths = {}
+        for name, arr in run.items():
+            paths[name] = tmp_path / "run{}_{}.npy".format(i, name)
+            np.save(paths[name], arr)
+        runs.append(paths)
+        row += len(df)
+        print("Sorted chunk {} ({} games)".format(i, row))
+    return runs, list(provisional), row, results
+
+def _merge_runs(runs, tmp_path, total, block_size):
+    """k-way merge of the sorted runs into memory-mapped arrays, one block per run at a time."""
+    runs = [{name: np.load(path, mmap_mode='r') for name, path in run.items()} for run in runs]
+    merged = {
+        'time': np.lib.format.open_memmap(tmp_path / "time.npy", mode='w+', dtype=np.int64, shape=(total,)),
+        'white': np.lib.format.open_memmap(tmp_path / "white.npy", mode='w+', dtype=np.int64, shape=(total,)),
+        'black': np.lib.format.open_memmap(tmp_path / "black.npy", mode='w+', dtype=np.int64, shape=(total,)),
+        'feats': np.lib.format.open_memmap(tmp_path / "feats.npy", mode='w+', dtype=np.float64, shape=(total, NUM_EDGE_FEATURES)),
+    }
+    pos = [0] * len(runs)
+    written = 0
+    while written < total:
+        active = [i for i, run in enumerate(runs) if pos[i] < len(run['time'])]
+        ends = {i: min(pos[i] + block_size, len(runs[i]['time'])) for i in active}
+        # everything up to the smallest last key of a partially read run is final
+        cutoff = min(((runs[i]['time'][ends[i] - 1], runs[i]['row'][ends[i] - 1])
+                      for i in active if ends[i] < len(runs[i]['time'])), default=None)
+        parts = []
+        for i in active:
+            time = runs[i]['time'][pos[i]:ends[i]]
+            take = len(time)
+            if cutoff is not None:
+                lo, hi = np.searchsorted(time, cutoff[0], 'left'), np.searchsorted(time, cutoff[0], 'right')
+                take = lo + np.searchsorted(runs[i]['row'][pos[i] + lo:pos[i] + hi], cutoff[1], 'right')
+            parts.append({name: arr[pos[i]:pos[i] + take] for name, arr in runs[i].items()})
+            pos[i] += take
+        block = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+        order = np.lexsort((block['row'], block['time']))
+        end = written + len(order)
+        for name in merged:
+            merged[name][written:end] = block[name][order]
+        written = end
+    return merged
+
+def _final_codes(merged, num_players, block_size):
+    """Map provisional codes to the codes factor_players gives the sorted
+    games: first appearance over all White players, then all Black players."""
+    final = np.full(num_players, -1, dtype=np.int64)
+    next_code = 0
+    for column in ('white', 'black'):
+        players = merged[column]
+        for start in range(0, len(players), block_size):
+            uniques, first = np.unique(players[start:start + block_size], return_index=True)
+            new = final[uniques] == -1
+            uniques = uniques[new][np.argsort(first[new])]
+            final[uniques] = np.arange(next_code, next_code + len(uniques))
+            next_code += len(uniques)
+    return final
+
+def prepare_input_chunked(file, save_path, chunk_size, tmp_dir = None, player_dict = None):
+    """prepare_input in bounded memory.
+
+    The csv is read `chunk_size` rows at a time, each chunk sorted by time
+    into a run on disk, and the runs merged into memory-mapped arrays. An
+    input that fits in one chunk goes through prepare_dataframe and gives
+    exactly its output; larger ones differ from it at most in the order of
+    games played in the same second, which the chunked sort keeps in file
+    order.
+    """
+    chunks = pd.read_csv(file, usecols = COLUMNS, keep_default_na=False, chunksize = chunk_size)
+    first = next(chunks, None)
+    second = next(chunks, None)
+    if second is None:
+        prepare_dataframe(first if first is not None else pd.read_csv(file, usecols = COLUMNS, keep_default_na=False), save_path, player_dict)
+        return
+
+    tmp_path = Path(tempfile.mkdtemp(dir = tmp_dir, prefix = "csv_to_input-"))
+    try:
+        print("Sorting chunks...")
+        def all_chunks():
+            yield first
+            yield second
+            yield from chunks
+        runs, players, total, results = _sorted_runs(all_chunks(), tmp_path)
+
+        print("Merging {} runs...".format(len(runs)))
+        merged = _merge_runs(runs, tmp_path, total, chunk_size)
+        for run in runs:
+            for path in run.values():
+                path.unlink()
+
+        print("Factoring players...")
+        final = _final_codes(merged, len(players), chunk_size)
+        if player_dict is not None:
+            by_code = np.empty(len(players), dtype=object)
+            by_code[final] = players
+            final = player_dict.assign(by_code)[final]
+
+        print("Saving to CSV")
+        p50 = total // 2
+        p75 = total * 3 // 4
+        first_time = merged['time'][0]
+        table = {name: np.lib.format.open_memmap(tmp_path / "edges_{}.npy".format(i), mode='w+', dtype=dtype, shape=(total,))
+                 for i, (name, dtype) in enumerate(EDGE_DTYPES.items())}
+        with open(save_path / "edges.csv", "w", newline="") as f:
+            for start in range(0, total, chunk_size):
+                end = min(start + chunk_size, total)
+                index = np.arange(start, end)
+                block = pd.DataFrame({
+                    "time": merged['time'][start:end] - first_time,
+                    "src": final[merged['white'][start:end]],
+                    "dst": final[merged['black'][start:end]],
+                    "ext_roll": (index >= p50).astype(np.int64) + (index >= p75),
+                }, index = index)
+                block.to_csv(f, header = start == 0)
+                table["Unnamed: 0"][start:end] = index
+                for name in block:
+                    table[name][start:end] = columnar.narrow(name, block[name].values, EDGE_DTYPES[name])
+
+        print("Saving table")
+        columnar.write_table(save_path / "edges.cols", table, source = save_path / "edges.csv")
+
+        print("Preparing tensor...")
+        tensor = pt.from_numpy(trim_results(merged['feats'], results))
+        pt.save(tensor, save_path / "edge_features.pt")
+        print(tensor.size())
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors = True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prepare input data for a specific month.')
+    parser.add_argument('month', help='the months to prepare')
+    parser.add_argument('--chunk-size', type=int, default=0, help='rows per chunk, bounds memory use (0 reads the whole csv at once)')
+    parser.add_argument('--tmp-dir', help='directory for the sorted runs of --chunk-size (default: system temp)')
+    parser.add_argument('--player-dict', help='persistent player dictionary, keeps node ids stable across months (created if missing)')
+
+    args = parser.parse_args()
+
+    file_path = Path(__file__).parent
+    csv_path = file_path.parent / "data" / "processed"
+    save_path = file_path.parent / "tgl" / "DATA" / ("LICHESS-" + args.month)
+    save_path.mkdir(parents = True, exist_ok = True)
+
+    file = list(csv_path.glob('*' + args.month + '*'))[0]
+    print(file)
+    player_dict = PlayerDictionary(args.player_dict) if args.player_dict else None
+    if args.chunk_size > 0:
+        prepare_input_chunked(file, save_path, args.chunk_size, args.tmp_dir, player_dict)
+    else:
+        prepare_input(file, save_path, player_dict)
+    if player_dict is not None:
+        player_dict.save()
+        print("{} players in {}".format(len(player_dict), args.player_dict))
@@ -1,60 +1,108 @@
-import chess.pgn
 import os
 import csv
-import zstandard
 import io
 import re
 import argparse
-from pathlib import Path
-
-parser = argparse.ArgumentParser()
-parser.add_argument('pattern')
-args = parser.parse_args()
-
-pattern = args.pattern
-
-
-os.chdir(os.path.abspath(os.path.dirname(__file__) ))
-os.chdir("../data")
-
-files = list(
-    filter(
-        lambda file: file.endswith("pgn.zst"),
-        os.listdir("raw")
-    ))
-
-
-for filename in files:
-    if re.search(pattern, filename) is None:
-        continue
-    print(filename)
-
-    dctx = zstandard.ZstdDecompressor()
-    compressed = open(f"raw/{filename}", 'rb')
-    
-    pgn = io.TextIOWrapper(
-        io.BufferedReader(
-            dctx.stream_reader(
-                compressed, 
-                closefd = True)),
-        encoding='utf-8')
-    print(pgn)
-        
-    csv_filename = filename.rstrip(".png.zst") + ".csv"
-    csv_file = open(f"processed/{csv_filename}", "w", newline="")
-    
-    fieldnames = ["Event", "White", "Black", "Result", "BlackElo", "WhiteElo", "BlackRatingDiff", "WhiteRatingDiff", "Opening", "Termination", "TimeControl", "UTCDate", "UTCTime"]
-    writer = csv.DictWriter(csv_file, fieldnames=fieldnames, extrasaction="ignore")
-    
-    writer.writeheader()
-    
-    game_count = 1
-    game = chess.pgn.read_game(pgn)
-    while game:
-        if game_count % 1000 == 0:
-            print(f"Game number: {game_count}")
-        writer.writerow(game.headers)
-        game = chess.pgn.read_game(pgn)
-        game_count += 1
-    
-    close(csv_file)
+import multiprocessing
+import zstandard
+from collections import deque
+
+FIELDNAMES = ["Event", "White", "Black", "Result", "BlackElo", "WhiteElo", "BlackRatingDiff", "WhiteRatingDiff", "Opening", "Termination", "TimeControl", "UTCDate", "UTCTime"]
+
+# tag pairs of the wanted fields at the start of a line; the literal prefix lets
+# the regex engine skip over movetext without looking at it. The value runs to
+# the last '"]' of the line, so escaped quotes inside it need no special case
+HEADER = re.compile(rb'\n\[(' + b'|'.join(name.encode() for name in FIELDNAMES) + rb') "([^\n]*)"\]')
+GAME_START = b'\n[Event '
+
+def read_chunks(stream, chunk_size):
+    """Blocks of whole games: each chunk ends right before an [Event tag."""
+    rest = b''
+    while True:
+        block = stream.read(chunk_size)
+        if not block:
+            break
+        block = rest + block
+        cut = block.rfind(GAME_START)
+        if cut <= 0:
+            rest = block
+            continue
+        rest = block[cut + 1:]
+        yield block[:cut + 1]
+    if rest:
+        yield rest
+
+def convert_chunk(chunk):
+    """CSV rows, as text, of the games in a chunk of PGN."""
+    fields = {name.encode(): i for i, name in enumerate(FIELDNAMES)}
+    rows = []
+    row = None
+    for key, value in HEADER.findall(b'\n' + chunk):
+        index = fields[key]
+        if index == 0 or row is None:
+            # a new game starts at its [Event tag
+            row = [''] * len(FIELDNAMES)
+            rows.append(row)
+        if b'\\' in value:
+            value = value.replace(b'\\"', b'"').replace(b'\\\\', b'\\')
+        row[index] = value.decode('utf-8', 'replace')
+    out = io.StringIO()
+    csv.writer(out).writerows(rows)
+    return out.getvalue()
+
+def open_pgn(path):
+    if path.endswith('.zst'):
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+def convert_file(path, csv_path, chunk_size, pool=None, max_pending=16):
+    """Write the headers of every game in `path` to `csv_path`.
+
+    Chunks are converted by `pool` when given, in order, while this process
+    keeps decompressing; at most `max_pending` chunks are in flight."""
+    with open_pgn(path) as pgn, open(csv_path, 'w', newline='', buffering=1 << 20) as csv_file:
+        csv.writer(csv_file).writerow(FIELDNAMES)
+        if pool is None:
+            for chunk in read_chunks(pgn, chunk_size):
+                csv_file.write(convert_chunk(chunk))
+            return csv_path
+        pending = deque()
+        for chunk in read_chunks(pgn, chunk_size):
+            pending.append(pool.apply_async(convert_chunk, (chunk,)))
+            if len(pending) >= max_pending:
+                csv_file.write(pending.popleft().get())
+        while pending:
+            csv_file.write(pending.popleft().get())
+    return csv_path
+
+def _convert_file(job):
+    return convert_file(*job)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Extract the game headers of raw PGN dumps to csv.')
+    parser.add_argument('pattern')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--chunk-size', type=int, default=16, help='MB of decompressed PGN per task')
+    parser.add_argument('--by-file', action='store_true', help='one process per file instead of splitting every file into chunks')
+    args = parser.parse_args()
+
+    pattern = args.pattern
+
+
+    os.chdir(os.path.abspath(os.path.dirname(__file__) ))
+    os.chdir("../data")
+
+    files = list(
+        filter(
+            lambda file: file.endswith("pgn.zst") and re.search(pattern, file) is not None,
+            os.listdir("raw")
+        ))
+    jobs = [(f"raw/{filename}", f"processed/{filename.removesuffix('.pgn.zst')}.csv", args.chunk_size << 20) for filename in files]
+
+    with multiprocessing.Pool(args.processes) as pool:
+        if args.by_file:
+            for csv_path in pool.imap_unordered(_convert_file, jobs):
+                print(csv_path)
+        else:
+            for job in jobs:
+                print(convert_file(*job, pool=pool, max_pending=2 * args.processes))
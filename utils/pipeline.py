@@ -0,0 +1,260 @@
+"""Incremental build of the monthly datasets.
+
+Every month goes through the stages
+
+  pgn    data/raw/<name>.pgn.zst -> data/processed/<name>.csv             (pgn_to_csv)
+  table  data/processed/<name>.csv -> data/processed/<name>.cols          (columnar, for PlayerStatistics)
+  input  data/processed/<name>.csv -> tgl/DATA/LICHESS-<month>/edges.csv,
+         edges.cols, edge_features.pt                                      (csv_to_input)
+  graph  tgl/DATA/LICHESS-<month>/edges.csv -> .../ext_full.npz           (gen_graph)
+
+where <name> is lichess_db_standard_rated_<month>. Months without a raw
+dump start from their processed csv.
+
+A stage's key hashes its parameters, the contents of its inputs and the
+source of the code that runs it. A stage is skipped when the last run
+recorded the same key and its outputs still hold what that run wrote.
+File hashes are memoized by size and mtime, so an up-to-date build reads no
+data. Stages run in a process pool as soon as their dependencies are done,
+so different months build in parallel. A stage that rewrites its outputs
+with the same contents does not rebuild the stages after it.
+
+With --player-dict the input stages of consecutive months are chained.
+Each one starts from the player dictionary that the previous month left in
+its dataset directory (players/), so node ids are shared by all months.
+When an earlier month changes, the later months are only rebuilt if its
+dictionary came out different.
+
+    python utils/pipeline.py 2013-01 2013-02 2013-03 --jobs 4
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import columnar
+from csv_to_input import prepare_input, prepare_input_chunked
+from pgn_to_csv import convert_file
+from player_dict import PlayerDictionary
+
+ROOT = Path(__file__).resolve().parent.parent
+RAW = ROOT / "data" / "raw"
+PROCESSED = ROOT / "data" / "processed"
+DATASETS = ROOT / "tgl" / "DATA"
+STATE = ROOT / "data" / "pipeline.json"
+PLAYER_DICT = "players"
+
+# source files whose changes invalidate the outputs of a stage
+CODE = {
+    "pgn": ["utils/pgn_to_csv.py"],
+    "table": ["utils/columnar.py"],
+    "input": ["utils/csv_to_input.py", "utils/player_statistics.py", "utils/columnar.py", "utils/player_dict.py"],
+    "graph": ["tgl/gen_graph.py"],
+}
+
+def _relative(path):
+    path = Path(path)
+    return str(path.relative_to(ROOT)) if path.is_relative_to(ROOT) else str(path)
+
+class HashMemo:
+    """Content hashes of files and directories, memoized by size and mtime."""
+
+    def __init__(self, entries = None):
+        self.entries = entries if entries is not None else {}
+
+    def _file(self, path):
+        stat = os.stat(path)
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        entry = self.entries.get(_relative(path))
+        if entry is not None and entry[:2] == stamp:
+            return entry[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        self.entries[_relative(path)] = stamp + [digest.hexdigest()]
+        return digest.hexdigest()
+
+    def __call__(self, path):
+        """Hash of `path`, None if it does not exist."""
+        path = Path(path)
+        if path.is_dir():
+            digest = hashlib.sha256()
+            for file in sorted(p for p in path.rglob('*') if p.is_file()):
+                digest.update(str(file.relative_to(path)).encode())
+                digest.update(self._file(file).encode())
+            return digest.hexdigest()
+        if not path.exists():
+            return None
+        return self._file(path)
+
+class Stage:
+    """One step of the build: `run(*args)` reads `inputs` and writes `outputs`."""
+
+    def __init__(self, name, kind, run, args, inputs, outputs, params = None, deps = ()):
+        self.name = name
+        self.kind = kind
+        self.run = run
+        self.args = args
+        self.inputs = [Path(path) for path in inputs] + [ROOT / path for path in CODE[kind]]
+        self.outputs = [Path(path) for path in outputs]
+        self.params = params or {}
+        self.deps = list(deps)
+
+    def key(self, memo):
+        inputs = [(_relative(path), memo(path)) for path in self.inputs]
+        return hashlib.sha256(json.dumps([self.kind, self.params, inputs]).encode()).hexdigest()
+
+def convert_pgn(pgn_path, csv_path, chunk_size):
+    convert_file(str(pgn_path), str(csv_path), chunk_size)
+
+def build_table(csv_path, table_path):
+    columnar.csv_to_table(csv_path, table_path)
+
+def build_input(csv_path, dataset, chunk_size = 0, player_dict = False, previous = None):
+    dataset.mkdir(parents = True, exist_ok = True)
+    players = PlayerDictionary(previous) if player_dict else None
+    if chunk_size > 0:
+        prepare_input_chunked(csv_path, dataset, chunk_size, None, players)
+    else:
+        prepare_input(csv_path, dataset, players)
+    if players is not None:
+        players.save(str(dataset / PLAYER_DICT))
+
+def build_graph(dataset, add_reverse = False):
+    command = [sys.executable, "gen_graph.py", "--data", dataset.name] + (["--add_reverse"] if add_reverse else [])
+    subprocess.run(command, cwd = ROOT / "tgl", check = True)
+
+def month_stages(months, chunk_size = 0, pgn_chunk_size = 16 << 20, player_dict = False, add_reverse = False):
+    """The stages building `months`, in dependency order."""
+    stages = []
+    previous = None
+    for month in months:
+        name = "lichess_db_standard_rated_" + month
+        pgn_path = RAW / (name + ".pgn.zst")
+        csv_path = PROCESSED / (name + ".csv")
+        table_path = Path(columnar.table_path(csv_path))
+        dataset = DATASETS / ("LICHESS-" + month)
+
+        csv_deps = []
+        if pgn_path.exists():
+            stages.append(Stage(month + "/pgn", "pgn", convert_pgn, (pgn_path, csv_path, pgn_chunk_size),
+                                [pgn_path], [csv_path]))
+            csv_deps = [month + "/pgn"]
+        stages.append(Stage(month + "/table", "table", build_table, (csv_path, table_path),
+                            [csv_path], [table_path], deps = csv_deps))
+
+        outputs = [dataset / "edges.csv", dataset / "edges.cols", dataset / "edge_features.pt"]
+        inputs = [csv_path]
+        deps = list(csv_deps)
+        if player_dict:
+            outputs.append(dataset / PLAYER_DICT)
+            if previous is not None:
+                inputs.append(previous[1])
+                deps.append(previous[0])
+        stages.append(Stage(month + "/input", "input", build_input,
+                            (csv_path, dataset, chunk_size, player_dict, previous[1] if previous else None),
+                            inputs, outputs, {"chunk_size": chunk_size, "player_dict": player_dict}, deps))
+        if player_dict:
+            previous = (month + "/input", dataset / PLAYER_DICT)
+
+        stages.append(Stage(month + "/graph", "graph", build_graph, (dataset, add_reverse),
+                            [dataset / "edges.csv"], [dataset / "ext_full.npz"], {"add_reverse": add_reverse},
+                            [month + "/input"]))
+    return stages
+
+def _save_state(state, path):
+    tmp = str(path) + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp, path)
+
+def run_stages(stages, state_path = STATE, jobs = None, force = False):
+    """Bring the outputs of `stages` up to date. Returns the names of the
+    stages that failed, or could not run because a dependency failed."""
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        state = {"stages": {}, "files": {}}
+    memo = HashMemo(state["files"])
+    pending = {stage.name: stage for stage in stages}
+    done, failed = set(), set()
+    running = {}
+
+    with ProcessPoolExecutor(jobs) as pool:
+        while pending or running:
+            progress = False
+            for stage in list(pending.values()):
+                if any(dep in failed for dep in stage.deps):
+                    print("{}: skipped, a dependency failed".format(stage.name))
+                    failed.add(stage.name)
+                    del pending[stage.name]
+                    continue
+                if not all(dep in done for dep in stage.deps):
+                    continue
+                del pending[stage.name]
+                progress = True
+                missing = [_relative(path) for path in stage.inputs if not path.exists()]
+                if missing:
+                    print("{}: missing {}".format(stage.name, ", ".join(missing)))
+                    failed.add(stage.name)
+                    continue
+                key = stage.key(memo)
+                record = state["stages"].get(stage.name)
+                if (not force and record is not None and record["key"] == key
+                        and all(memo(ROOT / path) == digest for path, digest in record["outputs"].items())):
+                    print("{}: up to date".format(stage.name))
+                    done.add(stage.name)
+                    continue
+                print("{}: running".format(stage.name))
+                running[pool.submit(stage.run, *stage.args)] = (stage, key)
+            if not running:
+                if not progress:
+                    # dependencies that are not stages of the build
+                    for name in pending:
+                        print("{}: unknown dependency".format(name))
+                    failed.update(pending)
+                    break
+                continue
+            finished, _ = wait(running, return_when = FIRST_COMPLETED)
+            for future in finished:
+                stage, key = running.pop(future)
+                try:
+                    future.result()
+                except Exception:
+                    traceback.print_exc()
+                    print("{}: failed".format(stage.name))
+                    failed.add(stage.name)
+                    state["stages"].pop(stage.name, None)
+                    continue
+                state["stages"][stage.name] = {
+                    "key": key,
+                    "outputs": {_relative(path): memo(path) for path in stage.outputs},
+                }
+                _save_state(state, state_path)
+                print("{}: done".format(stage.name))
+                done.add(stage.name)
+    _save_state(state, state_path)
+    return failed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the datasets of the given months, redoing only what changed.')
+    parser.add_argument('months', nargs='+', help='months to build, e.g. 2013-06')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='stages run in parallel')
+    parser.add_argument('--chunk-size', type=int, default=0, help='csv_to_input rows per chunk (0 reads each month at once)')
+    parser.add_argument('--pgn-chunk-size', type=int, default=16, help='MB of decompressed PGN per pgn_to_csv chunk')
+    parser.add_argument('--player-dict', action='store_true', help='share node ids across the months, in the order given')
+    parser.add_argument('--add-reverse', action='store_true', help='passed on to gen_graph')
+    parser.add_argument('--state', default=STATE, help='where the hashes of the last run are kept')
+    parser.add_argument('--force', action='store_true', help='rerun every stage')
+    args = parser.parse_args()
+
+    stages = month_stages(args.months, args.chunk_size, args.pgn_chunk_size << 20, args.player_dict, args.add_reverse)
+    failed = run_stages(stages, args.state, args.jobs, args.force)
+    sys.exit(1 if failed else 0)
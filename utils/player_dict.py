@@ -0,0 +1,87 @@
+import os
+import shutil
+import numpy as np
+
+NAMES = "names.npy"
+KEYS = "keys.npy"
+IDS = "ids.npy"
+
+def _encode(usernames):
+    """UTF-8 usernames as a fixed-width bytes array, which numpy sorts bytewise."""
+    return np.char.encode(np.asarray(usernames, dtype=str), 'utf-8')
+
+def _widen(arr, itemsize):
+    return arr.astype('S{}'.format(itemsize)) if arr.dtype.itemsize < itemsize else arr
+
+class PlayerDictionary:
+    """Append-only mapping of usernames to node ids, shared by every month.
+
+    Ids are handed out in order of first appearance and never change, so the
+    graphs of different months built against the same dictionary agree on
+    them. On disk it is a directory of three arrays: the usernames in id
+    order, and the usernames sorted bytewise with their ids, which lookups
+    binary search. They are memory-mapped, so opening the dictionary does
+    not depend on its size, and a month with M players costs O(M log N)
+    lookups plus a vectorized merge of its new players.
+    """
+
+    def __init__(self, path = None):
+        self.path = path
+        if path is not None and os.path.exists(os.path.join(path, NAMES)):
+            self._names = np.load(os.path.join(path, NAMES), mmap_mode='r')
+            self._keys = np.load(os.path.join(path, KEYS), mmap_mode='r')
+            self._ids = np.load(os.path.join(path, IDS), mmap_mode='r')
+        else:
+            self._names = np.array([], dtype='S1')
+            self._keys = np.array([], dtype='S1')
+            self._ids = np.array([], dtype=np.int64)
+
+    def __len__(self):
+        return len(self._names)
+
+    def _lookup(self, keys):
+        if len(self._keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        return np.where(self._keys[pos] == keys, self._ids[pos], -1)
+
+    def lookup(self, usernames):
+        """Ids of `usernames`, -1 for the ones not in the dictionary."""
+        return self._lookup(_encode(usernames))
+
+    def assign(self, usernames):
+        """Ids of `usernames`, adding the unknown ones in order of first appearance."""
+        keys = _encode(usernames)
+        uniques, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        ids = self._lookup(uniques)
+        new = np.flatnonzero(ids == -1)
+        if len(new) > 0:
+            new = new[np.argsort(first[new])]
+            ids[new] = np.arange(len(self), len(self) + len(new))
+            itemsize = max(self._keys.dtype.itemsize, uniques.dtype.itemsize)
+            self._names = np.concatenate([_widen(self._names, itemsize), _widen(uniques[new], itemsize)])
+            # uniques are sorted, so the new keys go in with a single merge
+            added = np.sort(new)
+            at = np.searchsorted(self._keys, uniques[added])
+            self._keys = np.insert(_widen(self._keys, itemsize), at, _widen(uniques[added], itemsize))
+            self._ids = np.insert(self._ids, at, ids[added])
+        return ids[inverse.reshape(-1)]
+
+    def username(self, id):
+        return self._names[id].decode('utf-8')
+
+    def usernames(self):
+        return np.char.decode(self._names, 'utf-8').tolist()
+
+    def save(self, path = None):
+        """Write the dictionary to `path`, by default the one it was opened from."""
+        path = path or self.path
+        tmp = path.rstrip('/') + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        np.save(os.path.join(tmp, NAMES), self._names)
+        np.save(os.path.join(tmp, KEYS), self._keys)
+        np.save(os.path.join(tmp, IDS), self._ids)
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp, path)
+        self.path = path
@@ -1,6 +1,13 @@
+import numpy as np
 import pandas as pd
-from datetime import datetime
-from collections import defaultdict
+from bisect import bisect_left, bisect_right
+try:
+    from utils import columnar
+except ImportError:
+    # run as a script from utils/
+    import columnar
+
+COLUMNS = ["Event", "Black", "White", "BlackElo", "WhiteElo", "UTCDate", "UTCTime", "Result", "TimeControl"]
 
 def clean_dataframe(df):    
     df = df[df['Result'].isin(["1-0", "0-1", "1/2-1/2"])]
@@ -9,101 +16,205 @@ def clean_dataframe(df):
     return df
 
 def sort_by_time(df):
-    df["time"] = df["UTCDate"] + " " + df["UTCTime"]
+    if isinstance(df["UTCDate"].dtype, pd.CategoricalDtype):
+        # columnar tables hold dates and times as categories, parse each distinct one once
+        date = pd.to_datetime(df["UTCDate"].cat.categories, format = '%Y.%m.%d').values[df["UTCDate"].cat.codes]
+        time = pd.to_timedelta(df["UTCTime"].cat.categories).values[df["UTCTime"].cat.codes]
+        df["time"] = date + time
+    else:
+        df["time"] = pd.to_datetime(df["UTCDate"] + " " + df["UTCTime"], format = '%Y.%m.%d %H:%M:%S')
     df = df.drop(labels = ["UTCDate", "UTCTime"], axis = 1);
-    df["time"] = df["time"].map(lambda dt: datetime.strptime(dt, '%Y.%m.%d %H:%M:%S'))
 
     df.sort_values(by = "time", inplace = True)
     df.reset_index(drop = True, inplace = True)
 
     first_time = df["time"].iloc[0]
-    df["time"] = (df["time"] - first_time).map(lambda delta: int(delta.total_seconds()))    
+    df["time"] = (df["time"] - first_time) // pd.Timedelta(seconds = 1)
     return df    
 
-def factor_players(df):
+def factor_players(df, player_dict = None):
     players = pd.concat([df['White'], df['Black']])
+    if player_dict is not None:
+        # ids that stay the same across months, new players go after the known ones;
+        # players the dictionary took from later months have no node in this graph
+        codes = player_dict.assign(players.values)
+        return codes, player_dict.usernames()[:int(codes.max()) + 1]
     codes, uniques = pd.factorize(players)
     return codes, uniques    
 
+class PlayerIndex:
+    """Exact and prefix lookup of players by username.
+
+    `usernames[code]` is the player with node code `code`. Exact lookups go
+    through a hash map; prefix search is a binary search over the usernames
+    sorted case-insensitively, so it costs O(log N + limit).
+    """
+    
+    def __init__(self, usernames, order=None):
+        self._usernames = list(usernames)
+        self._codes = {name: code for code, name in enumerate(self._usernames)}
+        if order is None:
+            order = sorted(range(len(self._usernames)), key=lambda code: self._usernames[code].lower())
+        self._order = list(order)
+        self._keys = [self._usernames[code].lower() for code in self._order]
+    
+    @classmethod
+    def load(cls, filename):
+        arrays = np.load(filename)
+        return cls(arrays['usernames'].tolist(), arrays['order'].tolist())
+    
+    def save(self, filename):
+        np.savez(filename, usernames=np.array(self._usernames, dtype=str), order=np.array(self._order, dtype=np.int32))
+    
+    def add(self, username):
+        code = self._codes.get(username)
+        if code is not None:
+            return code
+        code = len(self._usernames)
+        self._usernames.append(username)
+        self._codes[username] = code
+        key = username.lower()
+        pos = bisect_right(self._keys, key)
+        self._keys.insert(pos, key)
+        self._order.insert(pos, code)
+        return code
+    
+    def __len__(self):
+        return len(self._usernames)
+    
+    def __contains__(self, username):
+        return username in self._codes
+    
+    def code(self, username):
+        return self._codes[username]
+    
+    def username(self, code):
+        return self._usernames[code]
+    
+    def usernames(self):
+        return self._usernames
+    
+    def search(self, prefix, limit=10):
+        prefix = prefix.lower()
+        start = bisect_left(self._keys, prefix)
+        matches = []
+        for i in range(start, min(start + limit, len(self._keys))):
+            if not self._keys[i].startswith(prefix):
+                break
+            matches.append(self._usernames[self._order[i]])
+        return matches
+
+# game types by node of the aggregate tables, None for events of no known type
+GAME_TYPES = ["Bullet", "Blitz", "Rapid", "Classical", None]
+
+def game_type(event):
+    if "Bullet" in event:
+        return "Bullet"
+    if "Blitz" in event:
+        return "Blitz"
+    if "Rapid" in event:
+        return "Rapid"
+    if "Classical" in event:
+        return "Classical"
+
+def _parse_column(column, parse):
+    """`parse` applied to every distinct value of a column only once."""
+    codes, uniques = pd.factorize(column)
+    return np.array([parse(value) for value in uniques])[codes]
+
 class PlayerStatistics:
+    """Per-player final elos and game counts of a month, by game type.
+
+    Construction only keeps the games as flat arrays, in time order with
+    white before black: the node code of each player, the game type and
+    the elo. The per-player tables, (players, game types) arrays indexed
+    by node code, are aggregated from them when first asked for.
+    """
     
-    def __init__(self, filename):
-        print("Reading CSV...")
-        df = pd.read_csv(filename, usecols = ["Event", "Black", "White","BlackElo", "WhiteElo", "UTCDate", "UTCTime", "Result", "TimeControl"])
+    def __init__(self, filename, player_dict = None):
+        table = columnar.table_path(filename)
+        if columnar.fresh(table, filename):
+            print("Reading table...")
+            # in the order of the csv, like read_csv gives them
+            df = columnar.read_table(table, columns = [name for name in columnar.column_names(table) if name in COLUMNS])
+        else:
+            print("Reading CSV...")
+            df = pd.read_csv(filename, usecols = COLUMNS)
         df = clean_dataframe(df)
     
         print("Processing time...")
         df = sort_by_time(df)
         
         print("Factoring players...")
-        codes, uniques = factor_players(df)
-        
-        self._players = uniques
-    
-        self._name_to_code = {uniques[code]:code for code in codes}    
-        self._code_to_name = {code:uniques[code] for code in codes}
-        
-        self._final_elo = defaultdict(dict)
-
-        self._games_played = defaultdict(lambda: defaultdict(int))
+        codes, uniques = factor_players(df, player_dict)
         
-        self._outcomes = {}
-        self._outcomes['White'] = df[df['Result'] == '1-0'].count()
-        self._outcomes['Black'] = df[df['Result'] == '0-1'].count()
-        self._outcomes['Draw'] = df[df['Result'] == '1/2-1/2'].count()
+        self._index = PlayerIndex(uniques)
         
-        def game_type(event):
-            if "Bullet" in event:
-                return "Bullet"
-            if "Blitz" in event:
-                return "Blitz"
-            if "Rapid" in event:
-                return "Rapid"
-            if "Classical" in event:
-                return "Classical"
-
-            
-        self._games_played_by_type = {
-            "Bullet": 0,
-            "Blitz": 0,
-            "Rapid": 0,
-            "Classical": 0,
-            "None": 0,
+        # games interleaved as white, black, white, ... like the original row loop
+        num_games = len(df)
+        self._players = np.column_stack([codes[:num_games], codes[num_games:]]).ravel().astype(np.int32)
+        self._elos = np.column_stack([
+            _parse_column(df["WhiteElo"], int),
+            _parse_column(df["BlackElo"], int),
+        ]).ravel().astype(np.int32)
+        self._types = _parse_column(df["Event"], lambda event: GAME_TYPES.index(game_type(event))).astype(np.int8)
+        self._outcomes = {
+            'White': df[df['Result'] == '1-0'].count(),
+            'Black': df[df['Result'] == '0-1'].count(),
+            'Draw': df[df['Result'] == '1/2-1/2'].count(),
         }
         
-        print("Iterating rows...")
-        for row in df.itertuples():
-            
-            type = game_type(row.Event)
-            
-            self._final_elo[row.White][type] = int(row.WhiteElo)
-            self._final_elo[row.Black][type] = int(row.BlackElo)
-            
-            self._games_played[row.White][type] += 1
-            self._games_played[row.Black][type] += 1
-            
-            self._games_played_by_type[str(type)] += 1
-        
+        self._final_elo_table = None
+        self._games_played_table = None
         print("Statistics ready!")
-
+    
+    def _keys(self):
+        """(player, game type) cell of every player's side of every game."""
+        return self._players.astype(np.int64) * len(GAME_TYPES) + np.repeat(self._types, 2)
+    
+    def final_elo_table(self):
+        """(players, game types) elo after each player's last game of the type, -1 if none."""
+        if self._final_elo_table is None:
+            last = pd.Series(self._elos).groupby(self._keys()).last()
+            table = np.full(len(self._index) * len(GAME_TYPES), -1, dtype=np.int32)
+            table[last.index.values] = last.values
+            self._final_elo_table = table.reshape(-1, len(GAME_TYPES))
+        return self._final_elo_table
+    
+    def games_played_table(self):
+        """(players, game types) number of games of each player by type."""
+        if self._games_played_table is None:
+            counts = np.bincount(self._keys(), minlength = len(self._index) * len(GAME_TYPES))
+            self._games_played_table = counts.astype(np.int32).reshape(-1, len(GAME_TYPES))
+        return self._games_played_table
     
     def username_from_code(self, id):
-        return self._code_to_name(id)
+        return self._index.username(id)
     
     def code_from_username(self, username):
-        return self._name_to_code(username)
+        return self._index.code(username)
     
     def final_elo(self, username):
-        return self._final_elo[username]
+        if username not in self._index:
+            return {}
+        row = self.final_elo_table()[self._index.code(username)]
+        return {type: int(elo) for type, elo in zip(GAME_TYPES, row) if elo >= 0}
     
     def games_played(self, username):
-        return self._games_played[username]
+        if username not in self._index:
+            return {}
+        row = self.games_played_table()[self._index.code(username)]
+        return {type: int(count) for type, count in zip(GAME_TYPES, row) if count > 0}
     
     def games_played_type(self, type):
-        return self._games_played_by_type[type]
+        column = [str(game_type) for game_type in GAME_TYPES].index(type)
+        return int(np.count_nonzero(self._types == column))
     
     def outcomes(self):
         return self._outcomes
     
     def players(self):
-        return list(self._players)
+        return list(self._index.usernames())
+    
+    def index(self):
+        return self._index